@@ -0,0 +1,188 @@
+"""Container images of the argo apps
+
+The manifests are walked on the level of the yaml events (libyaml if available): only the small subtrees with images
+(containers, image overrides) are built as python objects, the rest of a manifest (e.g. the huge CRD schemas of argocd)
+is just skipped. The image overrides of kustomize ('images' of a kustomization, 'kustomize.images' of an argo
+application) are applied to the container images of their app like kustomize / argocd does.
+"""
+
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import yaml
+
+from ._common import TyperAbort, glob_files
+from ._constants import ARGO_APP_LOCATIONS, REPO_ROOT
+
+try:
+    _Loader = yaml.CSafeLoader
+except AttributeError:  # pyyaml without libyaml
+    _Loader = yaml.SafeLoader
+
+YamlPath = Tuple[Optional[str], ...]  # keys of the mappings, '-' for the items of a sequence
+
+# pod spec fields with the containers
+_CONTAINER_FIELDS = ("containers", "initContainers", "ephemeralContainers")
+_KUSTOMIZE_IMAGES = ("images", "-")
+_APPLICATION_IMAGES = ("kustomize", "images", "-")
+
+
+def _is_container(path: YamlPath) -> bool:
+    return len(path) >= 2 and path[-1] == "-" and path[-2] in _CONTAINER_FIELDS
+
+
+def _is_image_override(path: YamlPath) -> bool:
+    return path == _KUSTOMIZE_IMAGES or (
+        path[-3:] == _APPLICATION_IMAGES and (path[:2] == ("spec", "source") or path[:3] == ("spec", "sources", "-"))
+    )
+
+
+def _node(events: Iterator[yaml.Event], event: yaml.Event) -> Any:
+    """build the node which starts with *event* (scalars as strings, aliases as None)"""
+    if isinstance(event, yaml.MappingStartEvent):
+        mapping = {}
+        while not isinstance(key := next(events), yaml.MappingEndEvent):
+            mapping[_node(events, key)] = _node(events, next(events))
+        return mapping
+    if isinstance(event, yaml.SequenceStartEvent):
+        sequence = []
+        while not isinstance(item := next(events), yaml.SequenceEndEvent):
+            sequence.append(_node(events, item))
+        return sequence
+    return event.value if isinstance(event, yaml.ScalarEvent) else None
+
+
+def _walk(
+    events: Iterator[yaml.Event], event: yaml.Event, path: YamlPath, capture: Callable[[YamlPath], bool]
+) -> Iterator[Tuple[YamlPath, Any]]:
+    """yield the nodes at the *captured* paths of the node which starts with *event*"""
+    if capture(path):
+        yield path, _node(events, event)
+    elif isinstance(event, yaml.MappingStartEvent):
+        while not isinstance(key := next(events), yaml.MappingEndEvent):
+            if isinstance(key, yaml.ScalarEvent):
+                key_value = key.value
+            else:  # complex key (e.g. a mapping) => skipped
+                _node(events, key)
+                key_value = None
+            yield from _walk(events, next(events), path + (key_value,), capture)
+    elif isinstance(event, yaml.SequenceStartEvent):
+        while not isinstance(item := next(events), yaml.SequenceEndEvent):
+            yield from _walk(events, item, path + ("-",), capture)
+
+
+def _captured_nodes(manifest: Path, capture: Callable[[YamlPath], bool]) -> Iterator[Tuple[YamlPath, Any]]:
+    """yield the nodes at the *captured* paths of all documents of the *manifest*
+
+    exit 1 if the manifest isn't valid yaml
+    """
+    try:
+        with open(manifest, "rb") as file:
+            events = yaml.parse(file, Loader=_Loader)
+            for event in events:
+                if isinstance(event, yaml.DocumentStartEvent):
+                    yield from _walk(events, next(events), (), capture)
+    except yaml.YAMLError as exc:
+        raise TyperAbort(str(exc), f"Can't read the argo manifest: {manifest}")
+
+
+def _split_image(image_ref: str) -> Tuple[str, str]:
+    """split an image ref into the name and the tag / digest suffix (e.g. 'nginx:1.2' => 'nginx', ':1.2')"""
+    if "@" in image_ref:
+        name, _, digest = image_ref.partition("@")
+        return name, f"@{digest}"
+    name, colon, tag = image_ref.rpartition(":")
+    if colon and "/" not in tag:
+        return name, f":{tag}"
+    return image_ref, ""
+
+
+@dataclass
+class ImageOverride:
+    """image override of kustomize"""
+
+    name: str
+    new_name: Optional[str] = None
+    new_tag: Optional[str] = None
+    digest: Optional[str] = None
+
+    @classmethod
+    def parse(cls, node: Any) -> Optional["ImageOverride"]:
+        """parse an item of a kustomization ('name', 'newName', ...) or of an argo app ('name=new-name:tag')"""
+        if isinstance(node, dict) and isinstance(node.get("name"), str):
+            return cls(node["name"], node.get("newName"), node.get("newTag"), node.get("digest"))
+        if isinstance(node, str):
+            name, _, new_image = node.partition("=")
+            new_name, suffix = _split_image(new_image or name)
+            name = name if new_image else new_name
+            return cls(
+                name,
+                new_name if new_name != name else None,
+                suffix[1:] if suffix.startswith(":") else None,
+                suffix[1:] if suffix.startswith("@") else None,
+            )
+        return None
+
+    @property
+    def image_ref(self) -> Optional[str]:
+        """the image which the override defines completely (None => only a part, e.g. a new tag)"""
+        if self.new_tag is None and self.digest is None:
+            return None
+        return f"{self.new_name or self.name}" + (f"@{self.digest}" if self.digest else f":{self.new_tag}")
+
+    def apply(self, image_ref: str) -> Optional[str]:
+        """get the overridden image (None => the override doesn't match the *image_ref*)"""
+        name, suffix = _split_image(image_ref)
+        if name != self.name:
+            return None
+        if self.digest:
+            suffix = f"@{self.digest}"
+        elif self.new_tag:
+            suffix = f":{self.new_tag}"
+        return f"{self.new_name or name}{suffix}"
+
+
+def _apply_overrides(image_ref: str, overrides: List[ImageOverride]) -> str:
+    for override in overrides:
+        if (overridden := override.apply(image_ref)) is not None:
+            return overridden
+    return image_ref
+
+
+def scan_manifest(manifest: Path) -> Tuple[List[str], List[ImageOverride]]:
+    """get the container images and the image overrides of a *manifest*"""
+    images: List[str] = []
+    overrides: List[ImageOverride] = []
+    for path, node in _captured_nodes(manifest, lambda path: _is_container(path) or _is_image_override(path)):
+        if _is_container(path):
+            if isinstance(node, dict) and isinstance(node.get("image"), str):
+                images.append(node["image"])
+        elif (override := ImageOverride.parse(node)) is not None:
+            overrides.append(override)
+    return images, overrides
+
+
+def argo_app_images(apps: Iterable[str] = ("*",), root: Path = REPO_ROOT) -> Dict[str, List[str]]:
+    """get the images of the argo apps (system and user apps) with the overrides applied
+
+    apps: names / glob patterns of the apps, return: app dir (e.g. 'system-apps/argocd') => images (unique, sorted)
+    """
+    app_dirs = glob_files(root, *[location.format(app=app) for app in apps for location in ARGO_APP_LOCATIONS])
+    app_images: Dict[str, List[str]] = {}
+    for app_dir in dict.fromkeys(app_dirs):
+        images: List[str] = []
+        overrides: List[ImageOverride] = []
+        for manifest in glob_files(app_dir, "**/*.yaml", "**/*.yml"):
+            manifest_images, manifest_overrides = scan_manifest(manifest)
+            images += manifest_images
+            overrides += manifest_overrides
+        images = [_apply_overrides(image, overrides) for image in images]
+        images += [override.image_ref for override in overrides if override.image_ref]  # e.g. of an argo app
+        app_images[str(app_dir.parent.relative_to(root))] = sorted(set(images))
+    return app_images
+
+
+def argo_manifest_images(root: Path = REPO_ROOT) -> List[str]:
+    """get the images of all argo apps of the system and user apps (unique, sorted)"""
+    return sorted({image for images in argo_app_images(root=root).values() for image in images})
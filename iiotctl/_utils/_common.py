@@ -45,6 +45,11 @@ class TyperAbort(typer.Abort):
 
 class Command:
 
+    @staticmethod
+    def run(cmd: Iterable[str], in_bytes=False, **args) -> sp.CompletedProcess:
+        """execute given subprocess command; return the completed process without checking the return code"""
+        return sp.run(cmd, text=not in_bytes, capture_output=True, **args)
+
     @staticmethod
     def check_output(
         cmd: Iterable[str], in_bytes=False, ignore_error=False, additional_error_msg="", capture_output=True, **args
@@ -8,10 +8,27 @@ TALOS_CONFIG_PROJECT = MACHINE_DIR / "talosconfig-teleport"
 TALOS_CONFIG_USER = Path.home() / ".talos" / "config"
 K8S_CONFIG_USER = Path.home() / ".kube" / "config"
 TASKS_TMP_DIR = REPO_ROOT / ".tasks"
+MC_CACHE_DIR = TASKS_TMP_DIR / "mc-cache"
+INVENTORY_DIR = TASKS_TMP_DIR / "inventory"
 PUBLIC_SEALED_SECRETS_KEY = REPO_ROOT / "system-apps/sealed-secrets" / "sealing-secret/public-key.crt"
 
-PATCH_LOCATIONS = ["machine/config/*/_*.jq", "system-apps/*/machine-patches/_*.jq"]
-EXCLUDE_SYNC_PATCHES = ["**/_*.boot.jq"]
+# jq patches and declarative patches (yaml / json)
+PATCH_LOCATIONS = [
+    "machine/config/*/_*.jq",
+    "machine/config/*/_*.yaml",
+    "machine/config/*/_*.json",
+    "system-apps/*/machine-patches/_*.jq",
+    "system-apps/*/machine-patches/_*.yaml",
+    "system-apps/*/machine-patches/_*.json",
+]
+EXCLUDE_SYNC_PATCHES = ["**/_*.boot.jq", "**/_*.boot.yaml", "**/_*.boot.json"]
+# argo dirs of the apps (like the generators of the argo application sets), 'app': name / glob pattern of the app
+ARGO_APP_LOCATIONS = [
+    "system-apps/{app}/argo",
+    "system-apps/{app}/*/argo",
+    "user-apps/{app}/argo",
+    "user-apps/{app}/*/argo",
+]
 DEFAULT_MACHINE_CONFIG_ID = "v1alpha1"
 
 TASK_CONFIG_PATH = Path(__file__).parent.parent / "tasks_config.json"
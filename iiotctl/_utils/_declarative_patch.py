@@ -0,0 +1,228 @@
+"""Declarative machine patches
+
+Patch files in yaml or json ('_*.yaml' / '_*.json') which are applied in-process to the parsed machine config.
+They can be mixed with the jq patches in the same (sorted) patch chain.
+
+A declarative patch is a list of operations, the path of an operation is written in jq syntax
+(e.g. '.cluster.controllerManager.extraArgs."terminated-pod-gc-threshold"') or as a list of keys:
+
+```yaml
+- set: .machine.features.apidCheckExtKeyUsage  # set the value, missing parent objects are created
+  value: true
+- merge: .cluster  # recursive merge of objects like jq: '.cluster |= . * value'
+  value:
+    allowSchedulingOnControlPlanes: true
+- delete: .machine.kubelet.extraArgs  # like jq: 'del(.machine.kubelet.extraArgs)'
+- upsert: .machine.files  # update or insert objects into a list by the primary key, like the jq 'upsert' module
+  key: path
+  value:  # a single object or a list of objects
+    path: /var/some-file
+    content: some content
+    permissions: 384
+    op: create
+```
+"""
+
+import copy
+import json
+import re
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import yaml
+
+from . import _yaml12 as yaml12
+from ._common import TyperAbort
+
+DECLARATIVE_SUFFIXES = (".yaml", ".json")
+OPERATIONS = ("set", "merge", "delete", "upsert")
+
+JsonPath = Tuple[str, ...]
+
+_PATH_ELEMENT_PATTERN = re.compile(r'\.(?:(?P<key>[A-Za-z_]\w*)|(?P<quoted>"(?:[^"\\]|\\.)*"))')
+
+_operations: Dict[Path, List[Tuple[str, JsonPath, Dict]]] = {}
+
+
+def is_declarative(patch_file: Path) -> bool:
+    """check if the *patch_file* is a declarative patch (otherwise it's a jq patch)"""
+    return Path(patch_file).suffix in DECLARATIVE_SUFFIXES
+
+
+def _as_list(value: Any) -> List:
+    return value if isinstance(value, list) else [value]
+
+
+def _parse_path(path: str | List[str]) -> JsonPath:
+    """parse a jq path ('.a.b."c-d"' or '.' for the whole config) or a list of keys"""
+    if isinstance(path, list) and all(isinstance(key, str) for key in path):
+        return tuple(path)
+    if not isinstance(path, str):
+        raise ValueError(f"invalid path {json.dumps(path)}")
+    if path == ".":
+        return ()
+
+    keys: List[str] = []
+    pos = 0
+    while pos < len(path):
+        if (match := _PATH_ELEMENT_PATTERN.match(path, pos)) is None:
+            raise ValueError(f"invalid path '{path}'")
+        keys.append(match.group("key") or json.loads(match.group("quoted")))
+        pos = match.end()
+    return tuple(keys)
+
+
+def _parse_operation(operation: Any) -> Tuple[str, JsonPath, Dict]:
+    """parse a single operation of a declarative patch; raise ValueError when it isn't valid"""
+    names = [name for name in OPERATIONS if isinstance(operation, dict) and name in operation]
+    if len(names) != 1:
+        raise ValueError(f"must contain exactly one of: {', '.join(OPERATIONS)}")
+    name = names[0]
+    path = _parse_path(operation[name])
+    if name != "delete" and "value" not in operation:
+        raise ValueError(f"'{name}' requires a 'value'")
+    if name == "delete" and not path:
+        raise ValueError("the whole config can't be deleted")
+    if name == "upsert":
+        if not isinstance(operation.get("key"), str):
+            raise ValueError("'upsert' requires the primary 'key' of the list objects")
+        operation = {**operation, "value": _as_list(operation["value"])}
+        if not all(isinstance(obj, dict) for obj in operation["value"]):
+            raise ValueError("the 'value' of 'upsert' must be an object or a list of objects")
+    return name, path, operation
+
+
+def _load(patch_file: Path) -> Tuple[List[Tuple[str, JsonPath, Dict]], List[Tuple[Optional[int], str]]]:
+    """load the operations of a declarative patch; return the operations and the errors (line number, message)"""
+    try:
+        with open(patch_file, "r") as f:
+            text = f.read()
+        # yaml 1.2 like talos: 'on' / '1:30' are strings, '0o644' / '0644' are octal numbers
+        content = json.loads(text) if Path(patch_file).suffix == ".json" else yaml12.load(text)
+    except json.JSONDecodeError as exc:
+        return [], [(exc.lineno, exc.msg)]
+    except yaml.MarkedYAMLError as exc:
+        return [], [(exc.problem_mark.line + 1 if exc.problem_mark else None, str(exc.problem))]
+    except (OSError, yaml.YAMLError) as exc:
+        return [], [(None, str(exc))]
+
+    if not isinstance(content, list):
+        return [], [(1, "a declarative patch must be a list of operations")]
+    try:  # the yaml nodes contain the line numbers of the operations
+        items = yaml.compose(text, Loader=yaml12.Yaml12Loader)
+    except yaml.YAMLError:  # json with tabs (not valid yaml)
+        items = None
+
+    operations, errors = [], []
+    for i, operation in enumerate(content):
+        try:
+            operations.append(_parse_operation(operation))
+        except ValueError as exc:
+            line = items.value[i].start_mark.line + 1 if isinstance(items, yaml.SequenceNode) else None
+            errors.append((line, f"operation {i}: {exc}"))
+    return operations, errors
+
+
+def lint(patch_file: Path) -> List[Tuple[Optional[int], str]]:
+    """check the declarative *patch_file*; return the errors (line number, message)"""
+    return _load(patch_file)[1]
+
+
+def load_operations(patch_file: Path) -> List[Tuple[str, JsonPath, Dict]]:
+    """load the operations (name, path, operation args) of a declarative patch; loaded once per run
+
+    exit 1 when the patch file isn't valid
+    """
+    patch_file = Path(patch_file).resolve()
+    if patch_file not in _operations:
+        operations, errors = _load(patch_file)
+        if errors:
+            raise TyperAbort(
+                *[f"line {line}: {msg}" if line else msg for line, msg in errors],
+                f"Invalid declarative patch '{patch_file}'"
+            )
+        _operations[patch_file] = operations
+    return _operations[patch_file]
+
+
+def patch_paths(patch_file: Path) -> List[JsonPath]:
+    """get the paths which are changed by the declarative *patch_file*"""
+    return [path for _, path, _ in load_operations(patch_file)]
+
+
+def _merge(value: Any, other: Any) -> Any:
+    """recursive merge like the jq '*' operator for objects"""
+    if not (isinstance(value, dict) and isinstance(other, dict)):
+        return copy.deepcopy(other)
+    merged = dict(value)
+    for key, other_value in other.items():
+        merged[key] = _merge(value.get(key), other_value)
+    return merged
+
+
+def _index_key(value: Any) -> str:
+    """key of a value in an index (equal values => equal keys, like '_index_key' of the jq 'upsert' module)"""
+    return json.dumps(value, sort_keys=True)
+
+
+def _upsert(objects: Any, key: str, new_objects: List[Dict]) -> List:
+    """update or insert the *new_objects* by their primary *key* (same as 'upsert_all' of the jq 'upsert' module)"""
+    objects = [] if objects is None else list(objects)
+    index: Dict[str, int] = {}  # primary key -> index of the first object with this primary key
+    for i, obj in enumerate(objects):
+        if isinstance(obj, dict):
+            index.setdefault(_index_key(obj.get(key)), i)
+
+    for new_object in new_objects:
+        primary_key = _index_key(new_object.get(key))
+        if primary_key in index:
+            objects[index[primary_key]] = copy.deepcopy(new_object)
+        else:
+            index[primary_key] = len(objects)
+            objects.append(copy.deepcopy(new_object))
+    return objects
+
+
+def _apply_operation(mc: Any, name: str, path: JsonPath, operation: Dict) -> Any:
+    if name == "set" and not path:
+        return copy.deepcopy(operation["value"])
+    if name == "merge" and not path:
+        return _merge(mc, operation["value"])
+
+    parent = mc
+    for i, key in enumerate(path[:-1]):
+        if not isinstance(parent, dict):
+            raise ValueError(f"can't {name} '{'.'.join(path)}': '{'.'.join(path[:i])}' isn't an object")
+        if parent.get(key) is None:
+            if name == "delete":
+                return mc
+            parent[key] = {}
+        parent = parent[key]
+    if not isinstance(parent, dict):
+        raise ValueError(f"can't {name} '{'.'.join(path)}': '{'.'.join(path[:-1])}' isn't an object")
+
+    key = path[-1]
+    if name == "set":
+        parent[key] = copy.deepcopy(operation["value"])
+    elif name == "merge":
+        parent[key] = _merge(parent.get(key) or {}, operation["value"])
+    elif name == "delete":
+        parent.pop(key, None)
+    elif name == "upsert":
+        if parent.get(key) is not None and not isinstance(parent[key], list):
+            raise ValueError(f"can't upsert into '{'.'.join(path)}': isn't a list")
+        parent[key] = _upsert(parent.get(key), operation["key"], operation["value"])
+    return mc
+
+
+def patch_value(mc: Any, patch_file: Path) -> Any:
+    """apply the declarative *patch_file* to the parsed *mc* (the mc is changed in place)
+
+    exit 1 when the patch can't be applied
+    """
+    for name, path, operation in load_operations(patch_file):
+        try:
+            mc = _apply_operation(mc, name, path, operation)
+        except ValueError as exc:
+            raise TyperAbort(str(exc), f"Can't apply the patch '{Path(patch_file).resolve()}'")
+    return mc
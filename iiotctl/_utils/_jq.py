@@ -0,0 +1,315 @@
+"""Helpers for jq patch programs
+
+Resolve the modules of jq patch files and combine a chain of patch files into a single jq program,
+so the whole chain is applied with one jq run.
+
+When the jq python binding is installed, the programs can also be compiled once per run and applied in-process
+to already parsed json values. Otherwise the jq cli is used.
+
+Declarative patches (see '_declarative_patch') in a patch chain are always applied in-process.
+"""
+
+import json
+import re
+from itertools import groupby
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from . import _declarative_patch as declarative_patch
+from ._common import Command, patch_json
+
+try:
+    import jq as jq_binding
+except ImportError:  # the in-process backend is optional
+    jq_binding = None
+
+# jq: error: foo/0 is not defined at <top-level>, line 3:
+_ERROR_PATTERN = re.compile(
+    r'^jq: error: (?P<msg>.*?)(?: at (?P<file><top-level>|.+?), line (?P<line>\d+)(?:, column \d+)?:)?$'
+)
+
+# import / include directives at the beginning of a patch file (optionally preceded by comments)
+_DIRECTIVE_PATTERN = re.compile(
+    r'\s*(?:#[^\n]*(?:\n|$)\s*)*'
+    r'(?P<kind>module|import|include)\s+'
+    r'(?P<path>"(?:[^"\\]|\\.)*")?\s*'
+    r'(?:as\s+(?P<alias>\$?[A-Za-z_][A-Za-z0-9_]*))?\s*'
+    r'(?P<meta>\{[^;]*\})?\s*;'
+)
+
+
+def split_directives(program: str) -> Tuple[List[re.Match], str]:
+    """split a jq program into its leading directives and its body"""
+    directives = []
+    pos = 0
+    while (match := _DIRECTIVE_PATTERN.match(program, pos)) is not None:
+        directives.append(match)
+        pos = match.end()
+    return directives, program[pos:]
+
+
+def _rename_alias(body: str, alias: str, new_alias: str) -> str:
+    """replace all references to the module *alias* in *body* with *new_alias*"""
+    if alias.startswith("$"):  # data import: referenced as $name::name
+        name, new_name = alias[1:], new_alias[1:]
+        return re.sub(rf"\${re.escape(name)}::{re.escape(name)}\b", f"${new_name}::{new_name}", body)
+    return re.sub(rf"(?<![\w$:]){re.escape(alias)}::", f"{new_alias}::", body)
+
+
+def resolve_module(path: str, jq_modules_dir: Path, is_data=False) -> Optional[Path]:
+    """resolve the file of an imported / included jq module like jq does (search path, then the working dir)"""
+    suffix = ".json" if is_data else ".jq"
+    for root in (jq_modules_dir, Path.cwd()):
+        for candidate in (root / f"{path}{suffix}", root / path / f"{Path(path).name}{suffix}"):
+            if candidate.is_file():
+                return candidate.resolve()
+    return None
+
+
+def module_dependencies(jq_file: Path, jq_modules_dir: Path) -> List[Path]:
+    """get all module files which are (transitively) imported / included by the *jq_file*"""
+    dependencies: List[Path] = []
+    if declarative_patch.is_declarative(jq_file):  # can't import modules
+        return dependencies
+    pending = [jq_file]
+    while pending:
+        with open(pending.pop(), "r") as f:
+            directives, _ = split_directives(f.read())
+        for directive in directives:
+            kind, path, alias = directive.group("kind", "path", "alias")
+            if kind == "module":
+                continue
+            is_data = bool(alias and alias.startswith("$"))
+            module = resolve_module(json.loads(path), jq_modules_dir, is_data)
+            if module is None or module in dependencies:
+                continue
+            dependencies.append(module)
+            if not is_data:
+                pending.append(module)
+    return dependencies
+
+
+def compile_errors(jq_patch_file: Path, jq_modules_dir: Path) -> List[Tuple[Path, Optional[int], str]]:
+    """compile the *jq_patch_file* and its modules (without applying it)
+
+    The patch is compiled with the jq python binding if it's installed, otherwise with the jq cli.
+    return the compile errors: file (patch or module), line number and message
+    """
+    with open(jq_patch_file, "r") as f:
+        program = f.read()
+    directives, body = split_directives(program)
+
+    if jq_binding is not None:  # compiles the program without applying it
+        # add the search paths (replaces the '-L' arg of the jq cli) without adding lines
+        search_meta = json.dumps({"search": [str(jq_modules_dir.resolve()), str(Path.cwd())]})
+        lint_directives = "".join(
+            directive.group(0) if directive.group("meta") or directive.group("kind") == "module"
+            else re.sub(r";\s*$", lambda end: f" {search_meta}{end.group(0)}", directive.group(0))
+            for directive in directives
+        )
+        try:
+            _compile(lint_directives + body)
+            return []
+        except ValueError as exc:
+            error = str(exc)
+    else:
+        # without any input (and without '-n') the compiled program is never applied
+        result = Command.run(["jq", "-L", jq_modules_dir, program], input="")
+        if not result.returncode:
+            return []
+        error = result.stderr
+
+    errors = []
+    for error_line in error.splitlines():
+        if (match := _ERROR_PATTERN.match(error_line)) is None:
+            continue
+        file, line, msg = match.group("file", "line", "msg")
+        file = jq_patch_file if file in (None, "<top-level>") else Path(file)
+        line = int(line) if line else None
+        if msg.startswith("module not found: "):  # jq doesn't know the line of the import
+            module = msg.removeprefix("module not found: ")
+            line = next((i for i, text in enumerate(program.splitlines(), 1) if f'"{module}"' in text), None)
+        errors.append((file, line, msg))
+    return errors or [(jq_patch_file, None, error.strip())]
+
+
+def fuse_patch_files(jq_patch_files: Sequence[Path], search_paths: Optional[Sequence[Path]] = None) -> str:
+    """build one jq program which applies all *jq_patch_files* one after another
+
+    The imports of all patches are hoisted to the top of the program and get unique aliases, the includes are
+    deduplicated. The body of each patch is wrapped in its own scope, so the local definitions don't collide.
+
+    search_paths: added as search paths to the directives without metadata (replaces the '-L' arg of the jq cli)
+    """
+    if search_paths is not None:
+        search_meta = json.dumps({"search": [str(path) for path in search_paths]})
+
+    includes: List[str] = []
+    imports: Dict[Tuple[str, bool, str], str] = {}  # (path, is data import, metadata) -> unique alias
+    bodies: List[str] = []
+
+    for patch_file in jq_patch_files:
+        with open(patch_file, "r") as f:
+            directives, body = split_directives(f.read())
+
+        for directive in directives:
+            kind, path, alias, meta = directive.group("kind", "path", "alias", "meta")
+            if search_paths is not None and not meta:
+                meta = search_meta
+            if kind == "include":
+                include = f"include {path}{' ' + meta if meta else ''};"
+                if include not in includes:
+                    includes.append(include)
+            elif kind == "import":
+                is_data = alias.startswith("$")
+                key = (path, is_data, meta or "")
+                if key not in imports:
+                    imports[key] = f"{'$' if is_data else ''}_fused_module_{len(imports)}"
+                body = _rename_alias(body, alias, imports[key])
+
+        # the body ends on a new line => a trailing comment can't swallow the closing parenthesis
+        bodies.append(f"(\n{body.strip()}\n)")
+
+    # jq (<= 1.6) ignores includes which follow an import => includes first
+    header = includes + [
+        f"import {path} as {alias}{' ' + meta if meta else ''};" for (path, _, meta), alias in imports.items()
+    ]
+    return "\n".join(header + ["\n| ".join(bodies)]) + "\n"
+
+
+def _run_fused(json_input: bytes, jq_patch_files: Sequence[Path], jq_modules_dir: Path):
+    """apply the fused *jq_patch_files* to *json_input*; return the completed jq process"""
+    return Command.run(
+        cmd=["jq", "-S", "-L", jq_modules_dir, fuse_patch_files(jq_patch_files)],
+        input=json_input,
+        in_bytes=True
+    )
+
+
+def _patch_groups(patch_files: Sequence[Path]):
+    """split a patch chain into groups of consecutive jq patches and declarative patches"""
+    for declarative, group in groupby(patch_files, key=declarative_patch.is_declarative):
+        yield declarative, list(group)
+
+
+def patch_json_fused(json_input: bytes, jq_patch_files: Sequence[Path], jq_modules_dir: Path) -> bytes:
+    """patch the *json_input* with all *jq_patch_files* in a single jq run
+
+    consecutive declarative patches in between are applied in-process
+    when the fused run fails, bisect the patch chain to find the first failing patch and
+    exit 1 with its error message
+    """
+    for declarative, patch_files in _patch_groups(jq_patch_files):
+        if declarative:
+            mc = json.loads(json_input)
+            for patch_file in patch_files:
+                mc = declarative_patch.patch_value(mc, patch_file)
+            json_input = dump_json(mc)
+        else:
+            json_input = _patch_json_fused(json_input, patch_files, jq_modules_dir)
+    return json_input
+
+
+def _patch_json_fused(json_input: bytes, jq_patch_files: List[Path], jq_modules_dir: Path) -> bytes:
+    """apply the fused jq patches (see 'patch_json_fused')"""
+    if not jq_patch_files:
+        return json_input
+
+    results = {len(jq_patch_files): _run_fused(json_input, jq_patch_files, jq_modules_dir)}
+    if not results[len(jq_patch_files)].returncode:
+        return results[len(jq_patch_files)].stdout
+
+    # bisect: find the shortest prefix of the patch chain which can't be applied
+    low, high = 1, len(jq_patch_files)
+    while low < high:
+        mid = (low + high) // 2
+        results[mid] = _run_fused(json_input, jq_patch_files[:mid], jq_modules_dir)
+        if results[mid].returncode:
+            high = mid
+        else:
+            low = mid + 1
+
+    previous = low - 1
+    if previous == 0:
+        patched_json = json_input
+    elif previous in results:
+        patched_json = results[previous].stdout
+    else:
+        patched_json = _run_fused(json_input, jq_patch_files[:previous], jq_modules_dir).stdout
+
+    # apply the failing patch on its own => exit with the original error message of jq;
+    # if it only fails as part of the fused program, continue patch by patch
+    for patch_file in jq_patch_files[previous:]:
+        patched_json = patch_json(patched_json, patch_file, jq_modules_dir)
+
+    return patched_json
+
+
+_compiled_programs: Dict[str, Any] = {}
+
+
+def _compile(program: str):
+    """compile the jq *program* with the python binding; compiled programs are cached during the run"""
+    if program not in _compiled_programs:
+        _compiled_programs[program] = jq_binding.compile(program)
+    return _compiled_programs[program]
+
+
+def dump_json(value: Any) -> bytes:
+    """dump a json value in the output format of 'jq -S'"""
+    return bytes(json.dumps(value, indent=2, sort_keys=True, ensure_ascii=False) + "\n", "utf-8")
+
+
+def patch_value_in_process(value: Any, jq_patch_files: Sequence[Path], jq_modules_dir: Path, fused=False) -> Any:
+    """patch the parsed json *value* with the *jq_patch_files* in-process (fused: as a single jq program)
+
+    consecutive jq patches are fused, the declarative patches are applied in between
+    raise ValueError when a jq patch can't be compiled or applied
+    """
+    search_paths = [jq_modules_dir.resolve(), Path.cwd()]
+    for declarative, patch_files in _patch_groups(jq_patch_files):
+        if declarative:
+            for patch_file in patch_files:
+                value = declarative_patch.patch_value(value, patch_file)
+            continue
+        if fused:
+            programs = [fuse_patch_files(patch_files, search_paths)]
+        else:
+            programs = [fuse_patch_files([patch_file], search_paths) for patch_file in patch_files]
+
+        for program in programs:
+            results = _compile(program).input_value(value).all()
+            if len(results) != 1:
+                raise ValueError(f"Expected a single json value as result, got {len(results)}")
+            value = results[0]
+    return value
+
+
+def patch_json_in_process(
+    json_input: bytes, jq_patch_files: Sequence[Path], jq_modules_dir: Path, fused=False
+) -> Optional[bytes]:
+    """patch the *json_input* with the *jq_patch_files* in-process (same output as the jq cli)
+
+    The input is parsed once, all patches are applied to the parsed value and the result is dumped once.
+    Return None when the jq binding isn't installed (and there are jq patches) or a jq patch fails
+    (=> use the jq cli for its error message).
+    """
+    if jq_binding is None and not all(map(declarative_patch.is_declarative, jq_patch_files)):
+        return None
+    try:
+        return dump_json(patch_value_in_process(json.loads(json_input), jq_patch_files, jq_modules_dir, fused))
+    except ValueError:
+        return None
+
+
+def run_filter_in_process(jq_filter: str, json_input: bytes) -> Optional[List[Any]]:
+    """apply the *jq_filter* to the *json_input* in-process; return all results
+
+    Return None when the jq binding isn't installed or the filter fails (=> use the jq cli for its error message).
+    """
+    if jq_binding is None:
+        return None
+    try:
+        return _compile(jq_filter).input_value(json.loads(json_input)).all()
+    except ValueError:
+        return None
@@ -0,0 +1,146 @@
+"""Cache for patched machine configs
+
+Content addressed on-disk cache (in the '.tasks' dir) for the results of jq patches and talosctl validations.
+The key of a patch result is derived from the input config, the patch files and all jq modules they import,
+so an entry can never be outdated; a change of one of these inputs simply leads to a new key.
+
+The dependency graph of the last run of a patch chain is stored as well (see '_patch_graph').
+"""
+
+import json
+import os
+import subprocess as sp
+import tempfile
+import time
+from hashlib import sha256
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+from ._config import ASDF_PLUGINS
+from ._constants import MC_CACHE_DIR
+from ._jq import module_dependencies
+
+_PATCHED_DIR = MC_CACHE_DIR / "patched"
+_VALIDATED_DIR = MC_CACHE_DIR / "validated"
+_GRAPH_DIR = MC_CACHE_DIR / "graph"
+_MAX_ENTRY_AGE_SEC = 30 * 24 * 60 * 60  # remove entries which weren't used for 30 days
+
+# the files don't change during a single iiotctl run
+_file_digests: Dict[Path, str] = {}
+_patch_digests: Dict[Path, str] = {}
+_pruned = False
+
+
+def _tool_version(tool: str) -> str:
+    return ASDF_PLUGINS.get(tool, {}).get("version", "")
+
+
+def _file_digest(file: Path) -> str:
+    file = Path(file).resolve()
+    if file not in _file_digests:
+        with open(file, "rb") as f:
+            _file_digests[file] = sha256(f.read()).hexdigest()
+    return _file_digests[file]
+
+
+def patch_digest(patch_file: Path, jq_modules_dir: Path) -> str:
+    """digest of the *patch_file* and all jq modules it imports"""
+    patch_file = Path(patch_file).resolve()
+    if patch_file not in _patch_digests:
+        digest = sha256(f"{patch_file} {_file_digest(patch_file)}".encode())
+        for module in module_dependencies(patch_file, jq_modules_dir):
+            digest.update(f"\n{module} {_file_digest(module)}".encode())
+        _patch_digests[patch_file] = digest.hexdigest()
+    return _patch_digests[patch_file]
+
+
+def patch_key(json_input: bytes, jq_patch_files: Sequence[Path], jq_modules_dir: Path) -> str:
+    """create the cache key for patching *json_input* with all *jq_patch_files*"""
+    key = sha256(f"jq {_tool_version('jq')}\n".encode())
+    key.update(sha256(json_input).digest())
+    for patch_file in jq_patch_files:
+        key.update(patch_digest(patch_file, jq_modules_dir).encode())
+    return key.hexdigest()
+
+
+def graph_key(json_input: bytes, jq_patch_files: Sequence[Path]) -> str:
+    """create the key of the dependency graph of patching *json_input* with the chain of *jq_patch_files*
+
+    only the paths of the patch files are used => the graph of the last run is found after a patch was edited
+    """
+    key = sha256(json_input)
+    for patch_file in jq_patch_files:
+        key.update(f"\n{Path(patch_file).resolve()}".encode())
+    return key.hexdigest()
+
+
+def _validation_key(mc: bytes, mode: str) -> str:
+    key = sha256(f"talosctl {_tool_version('talosctl')} validate --mode={mode}\n".encode())
+    key.update(mc)
+    return key.hexdigest()
+
+
+def _read(entry: Path) -> Optional[bytes]:
+    try:
+        with open(entry, "rb") as f:
+            content = f.read()
+    except OSError:
+        return None
+    os.utime(entry)  # mark the entry as recently used
+    return content
+
+
+def _prune():
+    """remove all entries which weren't used for a long time"""
+    global _pruned
+    _pruned = True
+    expired = time.time() - _MAX_ENTRY_AGE_SEC
+    for entry in [*_PATCHED_DIR.glob("*"), *_VALIDATED_DIR.glob("*"), *_GRAPH_DIR.glob("*")]:
+        try:
+            if entry.stat().st_mtime < expired:
+                entry.unlink()
+        except OSError:  # already removed by a concurrent run
+            continue
+
+
+def _write(entry: Path, content: bytes):
+    if not _pruned:
+        _prune()
+    entry.parent.mkdir(parents=True, exist_ok=True)
+    # write + rename => concurrent runs never read a partially written entry
+    with tempfile.NamedTemporaryFile(dir=entry.parent, delete=False) as f:
+        f.write(content)
+    os.replace(f.name, entry)
+
+
+def load_patched(key: str) -> Optional[bytes]:
+    """load a cached patch result; return None if there is none"""
+    return _read(_PATCHED_DIR / f"{key}.json")
+
+
+def store_patched(key: str, mc: bytes):
+    _write(_PATCHED_DIR / f"{key}.json", mc)
+
+
+def load_validation(mc: bytes, mode: str) -> Optional[sp.CompletedProcess]:
+    """load the cached talosctl validation result of *mc*; return None if there is none"""
+    content = _read(_VALIDATED_DIR / _validation_key(mc, mode))
+    if content is None:
+        return None
+    result = json.loads(content)
+    return sp.CompletedProcess(result["args"], result["returncode"], stdout="", stderr=result["stderr"])
+
+
+def store_validation(mc: bytes, mode: str, result: sp.CompletedProcess):
+    content = {"args": [str(arg) for arg in result.args], "returncode": result.returncode, "stderr": result.stderr}
+    _write(_VALIDATED_DIR / _validation_key(mc, mode), json.dumps(content).encode())
+
+
+def load_graph(key: str) -> Optional[List[Dict]]:
+    """load the dependency graph of the last run of a patch chain; return None if there is none"""
+    content = _read(_GRAPH_DIR / f"{key}.json")
+    return None if content is None else json.loads(content)
+
+
+def store_graph(key: str, graph: List[Dict]):
+    _write(_GRAPH_DIR / f"{key}.json", json.dumps(graph, indent=2).encode())
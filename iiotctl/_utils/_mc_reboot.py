@@ -0,0 +1,69 @@
+"""Local prediction if a machine config change requires a reboot
+
+Talos applies a new machine config without a reboot ('no-reboot' mode) only if all changes are in fields which can
+be applied immediately (see 'CanApplyImmediate' of the talos runtime). The changed json paths between the live and the
+new mc are classified against this table; a change of any other field requires a reboot.
+
+The table is maintained for the talos version of the repo ('TALOS_VERSION'). Unknown fields are classified as
+'reboot' => the prediction is conservative, the server dry-run confirms it.
+"""
+
+import json
+from typing import Any, List, Set, Tuple
+
+JsonPath = Tuple[str, ...]
+
+# subtrees of the v1alpha1 config which talos applies without a reboot (talos v1.7)
+NO_REBOOT_PATHS: Set[JsonPath] = {
+    ("debug",),
+    ("cluster",),
+    ("machine", "time"),
+    ("machine", "certSANs"),
+    ("machine", "install"),
+    ("machine", "network"),
+    ("machine", "nodeLabels"),
+    ("machine", "nodeAnnotations"),
+    ("machine", "nodeTaints"),
+    ("machine", "sysfs"),
+    ("machine", "sysctls"),
+    ("machine", "logging"),
+    ("machine", "controlPlane"),
+    ("machine", "kubelet"),
+    ("machine", "kernel"),
+    ("machine", "registries"),
+    ("machine", "pods"),
+    ("machine", "seccompProfiles"),
+    ("machine", "udev"),
+    ("machine", "features", "kubernetesTalosAPIAccess"),
+    ("machine", "features", "kubePrism"),
+    ("machine", "features", "hostDNS"),
+}
+
+
+def _is_no_reboot(path: JsonPath) -> bool:
+    return any(path[:len(no_reboot_path)] == no_reboot_path for no_reboot_path in NO_REBOOT_PATHS)
+
+
+def _is_parent(path: JsonPath) -> bool:
+    """check if the *path* contains a subtree of the table (=> it must be compared in detail)"""
+    return any(
+        no_reboot_path[:len(path)] == path for no_reboot_path in NO_REBOOT_PATHS if len(no_reboot_path) > len(path)
+    )
+
+
+def changed_paths(old: Any, new: Any, path: JsonPath = ()) -> Set[JsonPath]:
+    """get the paths of the subtrees which differ between *old* and *new* (as deep as required by the table)"""
+    if old == new:
+        return set()
+    if not (_is_parent(path) and isinstance(old, dict) and isinstance(new, dict)):
+        return {path}
+    changed: Set[JsonPath] = set()
+    for key in old.keys() | new.keys():
+        changed |= changed_paths(old.get(key), new.get(key), path + (key,))
+    return changed
+
+
+def reboot_paths(live_mc: bytes, new_mc: bytes) -> List[str]:
+    """get the changed paths (jq syntax) between the *live_mc* and the *new_mc* which require a reboot"""
+    changed = changed_paths(json.loads(live_mc), json.loads(new_mc))
+    return sorted("." + ".".join(path) for path in changed if not _is_no_reboot(path))
@@ -0,0 +1,118 @@
+"""Offline pre-validation of machine configs
+
+Checks the structure of a machine config against the bundled schema ('talos-config.schema.json') in-process.
+Only a subset of the json schema keywords is supported: $ref (local), type, enum, pattern, required,
+properties, additionalProperties and items.
+
+The bundled schema is a deliberate hand-written subset of the upstream talos schema, not a copy of it (the upstream
+schema uses keywords which aren't supported): it checks the fields it lists and allows all other fields (the
+complete field list is checked by 'talosctl validate'), so it never rejects a valid machine config.
+"""
+
+import json
+import re
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List
+
+from ._config import TALOS_VERSION
+
+_SCHEMA_FILE = Path(__file__).parent.parent / "talos-config.schema.json"
+
+_KEYWORDS = {"$ref", "type", "enum", "pattern", "required", "properties", "additionalProperties", "items"}
+_ANNOTATIONS = {"$schema", "$comment", "$defs", "title", "description", "x-talos-version"}
+
+_TYPE_CHECKS = {
+    "object": lambda value: isinstance(value, dict),
+    "array": lambda value: isinstance(value, list),
+    "string": lambda value: isinstance(value, str),
+    "boolean": lambda value: isinstance(value, bool),
+    "integer": lambda value: isinstance(value, int) and not isinstance(value, bool),
+    "number": lambda value: isinstance(value, (int, float)) and not isinstance(value, bool),
+    "null": lambda value: value is None,
+}
+
+
+@lru_cache(maxsize=None)
+def _load_schema() -> Dict:
+    with open(_SCHEMA_FILE, "r") as f:
+        return json.load(f)
+
+
+def unsupported_keywords(schema: Dict, path: str = "#") -> List[str]:
+    """list the keywords of the *schema* (and its sub-schemas) which the validator would ignore"""
+    found = [f"{path}/{key}" for key in schema if key not in _KEYWORDS | _ANNOTATIONS]
+    sub_schemas = {
+        **{f"$defs/{name}": sub for name, sub in schema.get("$defs", {}).items()},
+        **{f"properties/{name}": sub for name, sub in schema.get("properties", {}).items()},
+        **{key: schema[key] for key in ("items", "additionalProperties") if isinstance(schema.get(key), dict)},
+    }
+    for sub_path, sub_schema in sub_schemas.items():
+        found += unsupported_keywords(sub_schema, f"{path}/{sub_path}")
+    return found
+
+
+def is_supported() -> bool:
+    """check if the bundled schema is made for the talos version of the repo"""
+    schema_version = _load_schema().get("x-talos-version", "")
+    return TALOS_VERSION == schema_version or TALOS_VERSION.startswith(f"{schema_version}.")
+
+
+def _resolve(schema: Dict) -> Dict:
+    while "$ref" in schema:
+        ref_schema = _load_schema()
+        for part in schema["$ref"].removeprefix("#/").split("/"):
+            ref_schema = ref_schema[part]
+        schema = ref_schema
+    return schema
+
+
+def _check(value: Any, schema: Dict, path: str, errors: List[str]):
+    schema = _resolve(schema)
+
+    types = schema.get("type")
+    if types is not None:
+        types = [types] if isinstance(types, str) else types
+        if not any(_TYPE_CHECKS[type_](value) for type_ in types):
+            errors.append(f"{path}: expected {' or '.join(types)}, got {type(value).__name__} ({json.dumps(value)})")
+            return
+
+    if "enum" in schema and value not in schema["enum"]:
+        errors.append(f"{path}: {json.dumps(value)} is not one of {json.dumps(schema['enum'])}")
+    if "pattern" in schema and isinstance(value, str) and not re.search(schema["pattern"], value):
+        errors.append(f"{path}: {json.dumps(value)} doesn't match the pattern '{schema['pattern']}'")
+
+    if isinstance(value, dict):
+        for key in schema.get("required", []):
+            if key not in value:
+                errors.append(f"{path}: missing required property '{key}'")
+        properties: Dict = schema.get("properties", {})
+        additional = schema.get("additionalProperties", True)
+        for key, sub_value in value.items():
+            if key in properties:
+                _check(sub_value, properties[key], f"{path}.{key}", errors)
+            elif additional is False:
+                errors.append(f"{path}: unknown property '{key}'")
+            elif isinstance(additional, dict):
+                _check(sub_value, additional, f"{path}.{key}", errors)
+
+    if isinstance(value, list) and "items" in schema:
+        for i, item in enumerate(value):
+            _check(item, schema["items"], f"{path}[{i}]", errors)
+
+
+def validate(mc: bytes) -> List[str]:
+    """check the structure of the *mc*; return the errors with the json path of the invalid value
+
+    return no errors if the bundled schema doesn't support the talos version of the repo
+    """
+    if not is_supported():
+        return []
+    try:
+        mc_value = json.loads(mc)
+    except json.JSONDecodeError as exc:
+        return [f"$: invalid json ({exc})"]
+
+    errors: List[str] = []
+    _check(mc_value, _load_schema(), "$", errors)
+    return errors
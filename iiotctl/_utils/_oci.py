@@ -0,0 +1,448 @@
+"""OCI image archives for machines without (fast) internet access
+
+An archive is a tar of an OCI image layout ('oci-layout', 'index.json', 'blobs/sha256/<hex>'). Each blob is stored
+once, even if several images share it (e.g. a base layer). The images are named by the 'io.containerd.image.name' and
+'org.opencontainers.image.ref.name' annotations of 'index.json' (=> 'ctr image import' can read the archive as well).
+
+export: the images are downloaded from their registries via the distribution api (anonymous or with the login of the
+        docker config, plain http for registries on localhost)
+import: the archive is served as a read-only registry, the machine pulls the images from it as mirror of their
+        registries (containerd fetches a blob only once => shared layers are sent once)
+"""
+
+import base64
+import hashlib
+import json
+import re
+import shutil
+import tarfile
+import tempfile
+import threading
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import httpx
+
+INDEX_MEDIA_TYPES = (
+    "application/vnd.oci.image.index.v1+json",
+    "application/vnd.docker.distribution.manifest.list.v2+json",
+)
+MANIFEST_MEDIA_TYPES = (
+    "application/vnd.oci.image.manifest.v1+json",
+    "application/vnd.docker.distribution.manifest.v2+json",
+)
+DEFAULT_PLATFORM = "linux/amd64"
+
+_REF_NAME_ANNOTATION = "org.opencontainers.image.ref.name"
+_CONTAINERD_NAME_ANNOTATION = "io.containerd.image.name"
+_DOCKER_HUB = "docker.io"
+_DOCKER_HUB_ALIASES = ("registry-1.docker.io", "index.docker.io")
+_DOCKER_CONFIG = Path.home() / ".docker" / "config.json"
+_LOCAL_HOSTS = ("localhost", "127.0.0.1", "[::1]")
+_CHUNK_SIZE = 1024 * 1024
+
+
+class OciError(Exception):
+    """a registry request failed or an archive / blob is invalid"""
+
+
+def normalize_image_ref(image_ref: str) -> str:
+    """get the full name of an image like containerd does (e.g. 'nginx' => 'docker.io/library/nginx:latest')"""
+    name, at, digest = image_ref.partition("@")
+    domain = name.split("/", 1)[0]
+    if "/" not in name or not ("." in domain or ":" in domain or domain == "localhost"):
+        name = f"docker.io/{name}"
+    if name.startswith("docker.io/") and name.count("/") == 1:
+        name = name.replace("docker.io/", "docker.io/library/", 1)
+    if not digest and ":" not in name.rsplit("/", 1)[-1]:
+        name += ":latest"
+    return f"{name}{at}{digest}"
+
+
+def normalize_registry(registry: str) -> str:
+    """get the name of the *registry* in image refs (e.g. 'registry-1.docker.io' => 'docker.io')"""
+    return _DOCKER_HUB if registry in _DOCKER_HUB_ALIASES else registry
+
+
+@dataclass(frozen=True)
+class ImageRef:
+    registry: str
+    repository: str
+    tag: Optional[str] = None
+    digest: Optional[str] = None
+
+    @classmethod
+    def parse(cls, image_ref: str) -> "ImageRef":
+        name, _, digest = normalize_image_ref(image_ref).partition("@")
+        registry, _, path = name.partition("/")
+        repository, tag = path, None
+        if ":" in path.rsplit("/", 1)[-1]:
+            repository, _, tag = path.rpartition(":")
+        return cls(registry, repository, tag, digest or None)
+
+    @property
+    def reference(self) -> str:
+        """the digest or tag which is requested from the registry"""
+        return self.digest or self.tag or "latest"
+
+    def __str__(self) -> str:
+        return f"{self.registry}/{self.repository}" + (f":{self.tag}" if self.tag else "") + (
+            f"@{self.digest}" if self.digest else ""
+        )
+
+
+def _digest(content: bytes) -> str:
+    return f"sha256:{hashlib.sha256(content).hexdigest()}"
+
+
+def _blob_name(digest: str) -> str:
+    algorithm, _, hex_digest = digest.partition(":")
+    if algorithm != "sha256" or not re.fullmatch(r'[0-9a-f]{64}', hex_digest):
+        raise OciError(f"Unsupported digest: {digest}")
+    return f"blobs/sha256/{hex_digest}"
+
+
+def _docker_login(registry: str) -> Optional[Tuple[str, str]]:
+    """get the login of the *registry* from the docker config (only plain 'auth' entries, no credential helpers)"""
+    try:
+        auths: Dict = json.loads(_DOCKER_CONFIG.read_text()).get("auths", {})
+    except (OSError, ValueError):
+        return None
+    hosts = [registry, f"https://{registry}"]
+    if registry == _DOCKER_HUB:
+        hosts += [*_DOCKER_HUB_ALIASES, "https://index.docker.io/v1/"]
+    for host in hosts:
+        if auth := auths.get(host, {}).get("auth"):
+            username, _, password = base64.b64decode(auth).decode().partition(":")
+            return username, password
+    return None
+
+
+class RegistryClient:
+    """read-only client of the registry distribution api (thread safe)"""
+
+    def __init__(self, insecure_registries: Iterable[str] = (), timeout=60.0):
+        self._http = httpx.Client(follow_redirects=True, timeout=timeout)
+        self._insecure_registries = set(insecure_registries)
+        self._tokens: Dict[Tuple[str, str], str] = {}
+
+    def __enter__(self) -> "RegistryClient":
+        return self
+
+    def __exit__(self, *exc_info):
+        self._http.close()
+
+    def _url(self, image: ImageRef, path: str) -> str:
+        host = _DOCKER_HUB_ALIASES[0] if image.registry == _DOCKER_HUB else image.registry
+        plain_http = host.rsplit(":", 1)[0] in _LOCAL_HOSTS or image.registry in self._insecure_registries
+        return f"{'http' if plain_http else 'https'}://{host}/v2/{image.repository}/{path}"
+
+    def _token(self, image: ImageRef, challenge: str) -> str:
+        """get a bearer token for the *challenge* of the registry ('realm', 'service' and 'scope')"""
+        params = dict(re.findall(r'(\w+)="([^"]*)"', challenge))
+        response = self._http.get(params.pop("realm", ""), params=params, auth=_docker_login(image.registry))
+        response.raise_for_status()
+        body = response.json()
+        return body.get("token") or body.get("access_token", "")
+
+    def _send(self, image: ImageRef, path: str, headers: Dict[str, str], stream=False) -> httpx.Response:
+        key = (image.registry, image.repository)
+        url = self._url(image, path)
+        try:
+            for _ in range(2):  # the 2nd attempt with a token (if the registry requires one)
+                auth = {"Authorization": f"Bearer {self._tokens[key]}"} if key in self._tokens else {}
+                request = self._http.build_request("GET", url, headers={**headers, **auth})
+                response = self._http.send(request, stream=stream)
+                challenge = response.headers.get("www-authenticate", "")
+                if response.status_code != httpx.codes.UNAUTHORIZED or not challenge.lower().startswith("bearer "):
+                    break
+                response.close()
+                self._tokens[key] = self._token(image, challenge[len("bearer "):])
+            response.raise_for_status()
+        except httpx.HTTPError as exc:
+            raise OciError(str(exc).splitlines()[0] if str(exc) else type(exc).__name__) from exc
+        return response
+
+    def manifest(self, image: ImageRef, reference: str) -> Tuple[bytes, str]:
+        """get the manifest / index *reference* (tag or digest) of the *image* and its media type"""
+        headers = {"Accept": ", ".join(INDEX_MEDIA_TYPES + MANIFEST_MEDIA_TYPES)}
+        response = self._send(image, f"manifests/{reference}", headers)
+        if reference.startswith("sha256:") and _digest(response.content) != reference:
+            raise OciError(f"The digest of the manifest {reference} doesn't match")
+        media_type = response.headers.get("content-type", "").split(";")[0].strip()
+        if media_type not in INDEX_MEDIA_TYPES + MANIFEST_MEDIA_TYPES:  # e.g. 'application/json' of a simple registry
+            media_type = json.loads(response.content).get("mediaType", media_type)
+        return response.content, media_type
+
+    def download_blob(self, image: ImageRef, digest: str, file: BinaryIO):
+        """write the blob *digest* of the *image* into the *file* and verify its digest"""
+        response = self._send(image, f"blobs/{digest}", {}, stream=True)
+        sha256 = hashlib.sha256()
+        try:
+            for chunk in response.iter_bytes(_CHUNK_SIZE):
+                sha256.update(chunk)
+                file.write(chunk)
+        except httpx.HTTPError as exc:
+            raise OciError(str(exc) or type(exc).__name__) from exc
+        finally:
+            response.close()
+        if f"sha256:{sha256.hexdigest()}" != digest:
+            raise OciError(f"The digest of the blob {digest} doesn't match")
+
+
+def _platform_descriptor(index: Dict, platform: str) -> Dict:
+    """select the manifest of the *platform* ('os/architecture[/variant]') from the *index*"""
+    os_name, architecture, *variant = platform.split("/")
+    for descriptor in index.get("manifests", []):
+        descriptor_platform = descriptor.get("platform", {})
+        if (descriptor_platform.get("os"), descriptor_platform.get("architecture")) == (os_name, architecture) and (
+            not variant or descriptor_platform.get("variant") == variant[0]
+        ):
+            return descriptor
+    raise OciError(f"No manifest for the platform {platform}")
+
+
+class ArchiveWriter:
+    """write the images into an OCI image archive (the blobs are staged in a temp dir, each blob is stored once)
+
+    the archive is only written when the context exits without an exception
+    """
+
+    def __init__(self, archive: Path):
+        self.archive = archive
+        self._staging = Path(tempfile.mkdtemp(prefix="oci-", dir=archive.parent))
+        (self._staging / "blobs/sha256").mkdir(parents=True)
+        self._lock = threading.Lock()
+        self._blobs: Dict[str, int] = {}  # digest => size (claimed by the thread which downloads it)
+        self._images: List[Dict] = []
+        self.shared_bytes = 0  # bytes which weren't stored again (blobs of several images)
+
+    def __enter__(self) -> "ArchiveWriter":
+        return self
+
+    def __exit__(self, exc_type, *exc_info):
+        try:
+            if exc_type is None:
+                self._write_archive()
+        finally:
+            shutil.rmtree(self._staging, ignore_errors=True)
+
+    @property
+    def size(self) -> int:
+        return sum(self._blobs.values())
+
+    def _claim(self, digest: str, size: int) -> bool:
+        """check if the blob has to be stored (False => another image stores it already)"""
+        with self._lock:
+            if digest in self._blobs:
+                self.shared_bytes += size
+                return False
+            self._blobs[digest] = size
+            return True
+
+    def _write_blob(self, digest: str, content: bytes):
+        if self._claim(digest, len(content)):
+            (self._staging / _blob_name(digest)).write_bytes(content)
+
+    def _download_blob(self, client: RegistryClient, image: ImageRef, descriptor: Dict) -> int:
+        """store the blob of the *descriptor*; return the number of downloaded bytes"""
+        if not self._claim(descriptor["digest"], descriptor.get("size", 0)):
+            return 0
+        with open(self._staging / _blob_name(descriptor["digest"]), "wb") as file:
+            client.download_blob(image, descriptor["digest"], file)
+        return descriptor.get("size", 0)
+
+    def add_image(self, client: RegistryClient, image_ref: str, platform: str = DEFAULT_PLATFORM) -> int:
+        """download the *image* (the manifest of the *platform* of an index) into the archive
+
+        return the number of downloaded bytes (0 => all blobs are shared with images of the archive)
+        """
+        image = ImageRef.parse(image_ref)
+        content, media_type = client.manifest(image, image.reference)
+        digest = image.digest or _digest(content)
+        self._write_blob(digest, content)
+        descriptor = {"mediaType": media_type, "digest": digest, "size": len(content)}
+
+        manifest_content = content
+        if media_type in INDEX_MEDIA_TYPES:
+            platform_descriptor = _platform_descriptor(json.loads(content), platform)
+            manifest_content, _ = client.manifest(image, platform_descriptor["digest"])
+            self._write_blob(platform_descriptor["digest"], manifest_content)
+        elif media_type not in MANIFEST_MEDIA_TYPES:
+            raise OciError(f"Unsupported manifest type '{media_type}'")
+
+        manifest = json.loads(manifest_content)
+        downloaded = sum(
+            self._download_blob(client, image, blob) for blob in [manifest["config"], *manifest.get("layers", [])]
+        )
+        name = str(image)
+        descriptor["annotations"] = {_CONTAINERD_NAME_ANNOTATION: name, _REF_NAME_ANNOTATION: name}
+        with self._lock:
+            self._images.append(descriptor)
+        return downloaded
+
+    def _write_archive(self):
+        index = {"schemaVersion": 2, "mediaType": INDEX_MEDIA_TYPES[0], "manifests": self._images}
+        (self._staging / "index.json").write_text(json.dumps(index, indent=2))
+        (self._staging / "oci-layout").write_text(json.dumps({"imageLayoutVersion": "1.0.0"}))
+        partial_archive = self.archive.with_name(f"{self.archive.name}.partial")
+        with tarfile.open(partial_archive, "w", format=tarfile.PAX_FORMAT) as tar:  # no compression => seekable blobs
+            for name in ("oci-layout", "index.json", *sorted(map(_blob_name, self._blobs))):
+                tar.add(self._staging / name, arcname=name)
+        partial_archive.replace(self.archive)
+
+
+class Archive:
+    """read-only access to the images and blobs of an OCI image archive (without extracting it)"""
+
+    def __init__(self, archive: Path):
+        self.path = archive
+        try:
+            with tarfile.open(archive, "r:") as tar:
+                self._members = {
+                    member.name.removeprefix("./"): (member.offset_data, member.size)
+                    for member in tar if member.isfile()
+                }
+            index = json.loads(self.read("index.json"))
+        except (OSError, tarfile.TarError, ValueError, KeyError) as exc:
+            raise OciError(f"Invalid OCI image archive: {archive} ({exc})") from exc
+
+        self.images: Dict[str, Dict] = {}  # image ref => descriptor
+        self.media_types: Dict[str, str] = {}  # manifest / index digest => media type
+        for descriptor in index.get("manifests", []):
+            annotations = descriptor.get("annotations", {})
+            if name := annotations.get(_CONTAINERD_NAME_ANNOTATION, annotations.get(_REF_NAME_ANNOTATION)):
+                self.images[normalize_image_ref(name)] = descriptor
+            self.media_types[descriptor["digest"]] = descriptor["mediaType"]
+            if descriptor["mediaType"] in INDEX_MEDIA_TYPES:
+                for child in json.loads(self.read(_blob_name(descriptor["digest"])))["manifests"]:
+                    if self.has_blob(child["digest"]):  # only the selected platform
+                        self.media_types[child["digest"]] = child["mediaType"]
+
+    def has_blob(self, digest: str) -> bool:
+        try:
+            return _blob_name(digest) in self._members
+        except OciError:
+            return False
+
+    def blob_size(self, digest: str) -> int:
+        return self._members[_blob_name(digest)][1]
+
+    def read(self, name: str) -> bytes:
+        offset, size = self._members[name]
+        with open(self.path, "rb") as file:
+            file.seek(offset)
+            return file.read(size)
+
+    def iter_blob(self, digest: str) -> Iterator[bytes]:
+        offset, size = self._members[_blob_name(digest)]
+        with open(self.path, "rb") as file:  # a file per reader => concurrent requests
+            file.seek(offset)
+            while size > 0:
+                chunk = file.read(min(_CHUNK_SIZE, size))
+                if not chunk:
+                    raise OciError(f"Truncated blob {digest} in {self.path}")
+                size -= len(chunk)
+                yield chunk
+
+    def find_manifest(self, name: str, reference: str, registry: Optional[str] = None) -> Optional[str]:
+        """get the digest of the manifest *reference* (tag / digest) of the repository *name*
+
+        the *name* may have a prefix (e.g. 'quay/argoproj/argocd' of a mirror with 'overridePath'), the *registry*
+        ('ns' parameter of containerd) must match if it's known
+        """
+        if reference.startswith("sha256:"):
+            return reference if reference in self.media_types else None
+        for image_ref, descriptor in self.images.items():
+            image = ImageRef.parse(image_ref)
+            if image.tag != reference or not (name == image.repository or name.endswith(f"/{image.repository}")):
+                continue
+            if registry is None or normalize_registry(registry) == image.registry:
+                return descriptor["digest"]
+        return None
+
+
+class _RegistryHandler(BaseHTTPRequestHandler):
+    server: "ArchiveRegistry"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass  # containerd requests a lot
+
+    def _send(self, status: int, headers: Dict[str, str], body: Iterable[bytes] = ()):
+        self.send_response(status)
+        for key, value in {"Docker-Distribution-API-Version": "registry/2.0", **headers}.items():
+            self.send_header(key, value)
+        self.end_headers()
+        if self.command != "HEAD":
+            for chunk in body:
+                self.wfile.write(chunk)
+
+    def _not_found(self, code: str, message: str):
+        body = json.dumps({"errors": [{"code": code, "message": message}]}).encode()
+        self._send(404, {"Content-Type": "application/json", "Content-Length": str(len(body))}, [body])
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path.rstrip("/") == "/v2":
+            self._send(200, {"Content-Type": "application/json", "Content-Length": "2"}, [b"{}"])
+            return
+        if not (match := re.fullmatch(r'/v2/(.+)/(manifests|blobs)/([^/]+)', url.path)):
+            self._not_found("NAME_UNKNOWN", url.path)
+            return
+        name, kind, reference = match.groups()
+        archive = self.server.archive
+        if kind == "manifests":
+            registry = parse_qs(url.query).get("ns", [None])[0]
+            digest = archive.find_manifest(name, reference, registry)
+            if digest is None:
+                self._not_found("MANIFEST_UNKNOWN", f"{name}:{reference}")
+                return
+            media_type = archive.media_types[digest]
+        else:
+            digest, media_type = reference, "application/octet-stream"
+            if not archive.has_blob(digest):
+                self._not_found("BLOB_UNKNOWN", digest)
+                return
+            self.server.count_blob(digest, self.command != "HEAD")
+        headers = {
+            "Content-Type": media_type,
+            "Content-Length": str(archive.blob_size(digest)),
+            "Docker-Content-Digest": digest,
+        }
+        self._send(200, headers, archive.iter_blob(digest))
+
+
+class ArchiveRegistry(ThreadingHTTPServer):
+    """serve an OCI image archive as read-only registry (distribution api) in a background thread"""
+
+    daemon_threads = True
+
+    def __init__(self, archive: Archive, port: int, address: str = ""):
+        super().__init__((address, port), _RegistryHandler)
+        self.archive = archive
+        self.sent_blobs: Dict[str, int] = {}  # digest => number of downloads
+        self._lock = threading.Lock()
+
+    def count_blob(self, digest: str, download: bool):
+        if download:
+            with self._lock:
+                self.sent_blobs[digest] = self.sent_blobs.get(digest, 0) + 1
+
+    @property
+    def sent_bytes(self) -> int:
+        return sum(self.archive.blob_size(digest) * count for digest, count in self.sent_blobs.items())
+
+    def __enter__(self) -> "ArchiveRegistry":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
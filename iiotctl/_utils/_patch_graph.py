@@ -0,0 +1,408 @@
+"""Dependency graph of the machine patches
+
+For each patch of a chain, the json subtrees it reads and writes (e.g. 'machine.network' or 'cluster') and the modules
+it imports are recorded in the mc cache. The next run of the same chain on the same input only re-evaluates the
+patches which changed (patch file or imported module) or which read a subtree that differs from the last run;
+the writes of all other patches are taken over from the cached intermediate configs of the last run.
+
+- reads: the paths used in the patch and its modules (static, conservative); a patch only reads these paths if it is
+  provably path-scoped (see '_reads_input') and outputs its updated input (see '_replaces_output'), otherwise
+  (e.g. a bare '.' outside of an update assignment, '..', 'tojson', 'length', '{machine: .machine}') it reads
+  everything; a declarative patch only reads the paths of its operations
+- writes: the subtrees which differ between the input and the output of the patch (recorded in the last run);
+  everything for the patches which read everything
+
+All paths are truncated to a depth of 2 (e.g. '.machine.network.hostname' => 'machine.network').
+Functions of included / imported modules are assumed to work on the value they are called with.
+"""
+
+import json
+import re
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+from . import _declarative_patch as declarative_patch
+from . import _mc_cache as mc_cache
+from ._constants import REPO_ROOT
+from ._jq import dump_json, module_dependencies, split_directives
+
+JsonPath = Tuple[str, ...]
+
+_DEPTH = 2
+_ROOT: JsonPath = ()
+
+# '.machine.network.hostname' (not an index, a field of a variable / a result or a number)
+_PATH_PATTERN = re.compile(r'(?<![\w\])}$.])((?:\.[A-Za-z_]\w*)+)')
+# '{machine}' => shorthand for '{machine: .machine}'
+_SHORTHAND_PATTERN = re.compile(r'[{,]\s*([A-Za-z_]\w*)\s*(?=[,}])')
+# tokens of the code (without comments and string texts): numbers, field paths ('.machine'), bare dots ('.', '..',
+# '.[0]', '."key"' => the input itself), names (functions, keywords, '$variables', '@formats', 'module::functions')
+# and the operators / brackets which delimit the right side of an update assignment
+_TOKEN_PATTERN = re.compile(
+    r'(?P<number>\d+(?:\.\d*)?(?:[eE][+-]?\d+)?)'
+    r'|(?P<field>\.[A-Za-z_]\w*)'
+    r'|(?P<dot>(?<![\w\])}$.])\.)'
+    r'|(?P<name>[$@]?[A-Za-z_]\w*(?:::[A-Za-z_]\w*)?)'
+    r'|(?P<op>\?//|\|=|//=?|[-+*/%]=|[=!<>]=|[|,;:()\[\]{}=])'
+)
+_DEF_PATTERN = re.compile(r'(?<![\w$.])def\s+([A-Za-z_]\w*)')
+_KEYWORDS = frozenset((
+    "def", "if", "then", "elif", "else", "end", "as", "reduce", "foreach", "try", "catch", "label", "break", "and", "or"
+))
+# builtins which don't read their input (besides the paths of their arguments)
+_PATH_ONLY_BUILTINS = frozenset(("null", "true", "false", "empty", "error", "select", "del"))
+# read something else than the input (environment, location) => can't be tracked
+_UNTRACKED = frozenset(("env", "$ENV", "$__loc__", "input", "inputs", "input_filename"))
+# the right side of an update assignment ends at these tokens ('a |= b | c' => '(a |= b) | c')
+_UPDATE_END = frozenset(("|", ",", "//", ";", "then", "elif", "else", "end", "catch", "as", "def", ")", "]", "}"))
+_OPENING = frozenset(("(", "[", "{", "if"))
+_CLOSING = frozenset((")", "]", "}", "end"))
+# the stages of a pipeline end at these tokens (the precedence of ',' and '//' is lower than the one of assignments)
+_STAGE_END = frozenset(("|", ",", "//"))
+_ASSIGNMENTS = frozenset(("=", "|=", "+=", "-=", "*=", "/=", "%=", "//="))
+# builtins which output their input (or nothing)
+_PASS_THROUGH_BUILTINS = frozenset(("del", "select", "empty", "error"))
+
+_reads: Dict[Path, Set[JsonPath]] = {}
+
+
+def _code_only(program: str) -> str:
+    """remove the comments and blank the (non interpolated) text of the strings of a jq *program*"""
+    code: List[str] = []
+    interpolations: List[int] = []  # open parentheses per string interpolation
+    in_string = False
+    i = 0
+    while i < len(program):
+        char = program[i]
+        if in_string:
+            if char == "\\" and program[i + 1:i + 2] == "(":
+                code.append("\\(")
+                interpolations.append(0)
+                in_string = False
+                i += 2
+                continue
+            if char == "\\":
+                code.append("  ")
+                i += 2
+                continue
+            if char == '"':
+                in_string = False
+            code.append(char if char in '"\n' else " ")
+        elif char == "#":
+            end = program.find("\n", i)
+            i = len(program) if end < 0 else end
+            continue
+        else:
+            if char == '"':
+                in_string = True
+            elif char == "(" and interpolations:
+                interpolations[-1] += 1
+            elif char == ")" and interpolations:
+                if interpolations[-1] == 0:
+                    interpolations.pop()
+                    in_string = True
+                else:
+                    interpolations[-1] -= 1
+            code.append(char)
+        i += 1
+    return "".join(code)
+
+
+def _paths(code: str) -> Set[JsonPath]:
+    paths = {tuple(match.group(1)[1:].split("."))[:_DEPTH] for match in _PATH_PATTERN.finditer(code)}
+    return paths | {(match.group(1),) for match in _SHORTHAND_PATTERN.finditer(code)}
+
+
+def _defined_functions(code: str) -> Set[str]:
+    return set(_DEF_PATTERN.findall(code))
+
+
+def _reads_input(code: str, path_scoped_functions: Set[str]) -> bool:
+    """check if the *code* may read more of its input than the paths it names
+
+    The code is path-scoped if everything outside of the right sides of its update assignments ('|=', their input
+    is the updated path) is a field path, a literal, a variable, a keyword, a path-only builtin, a parameter or a
+    function of the code or of the *path_scoped_functions* (of modules). Everything else (e.g. '.', '..', 'tojson',
+    'length', '@json' or an unknown function) may read the whole input.
+    """
+    tokens = [(match.lastgroup, match.group()) for match in _TOKEN_PATTERN.finditer(code)]
+    functions = path_scoped_functions | _defined_functions(code)
+    stack: List[str] = []  # open brackets / 'if'
+    update_depth: Optional[int] = None  # stack depth of the right side of the current update assignment
+    scopes: List[Tuple[int, Set[str]]] = []  # stack depth and parameters of the current function definitions
+
+    def is_path_scoped(i: int, name: str) -> bool:
+        if name.startswith("$"):
+            return True
+        if "::" in name:
+            return name.partition("::")[2] in functions
+        if name in _KEYWORDS or name in _PATH_ONLY_BUILTINS or name in functions:
+            return True
+        if any(name in parameters for _, parameters in scopes):
+            return True
+        # an object key: '{name: ...}' or '{name}' (=> '.name', see _SHORTHAND_PATTERN)
+        previous, following = tokens[i - 1][1] if i else "", tokens[i + 1][1] if i + 1 < len(tokens) else ""
+        return stack[-1:] == ["{"] and previous in ("{", ",") and following in (":", ",", "}")
+
+    i = 0
+    while i < len(tokens):
+        kind, token = tokens[i]
+        if update_depth == len(stack) and token in _UPDATE_END:
+            update_depth = None
+        if token == ";" and scopes and scopes[-1][0] == len(stack):
+            scopes.pop()
+        if token in _UNTRACKED:
+            return True
+        if update_depth is None and (kind == "dot" or (kind == "name" and not is_path_scoped(i, token))):
+            return True
+
+        if token == "def":  # skip the name and the parameters ('def f($a; g):')
+            i += 2
+            parameters: Set[str] = set()
+            if i < len(tokens) and tokens[i][1] == "(":
+                while i < len(tokens) and tokens[i][1] != ")":
+                    if tokens[i][0] == "name":
+                        parameters.add(tokens[i][1].lstrip("$"))
+                    i += 1
+                i += 1
+            scopes.append((len(stack), parameters))
+            continue
+        if token in _CLOSING and stack:
+            stack.pop()
+        elif token in _OPENING:
+            stack.append(token)
+        elif token == "|=" and update_depth is None:
+            update_depth = len(stack)
+        i += 1
+    return False
+
+
+def _without_definitions(tokens: List[str]) -> List[str]:
+    """remove the function definitions ('def f: ...;') from the *tokens*"""
+    result: List[str] = []
+    depth = 0
+    definitions: List[int] = []  # depths of the open definitions (a definition ends at a ';' of its depth)
+    for token in tokens:
+        if token in _CLOSING:
+            depth -= 1
+        if token == "def":
+            definitions.append(depth)
+        elif not definitions:
+            result.append(token)
+        elif token == ";" and definitions[-1] == depth:
+            definitions.pop()
+        if token in _OPENING:
+            depth += 1
+    return result
+
+
+def _outer(tokens: List[str]) -> List[str]:
+    """get the *tokens* outside of brackets (incl. the outer brackets, e.g. 'del(.a)' => 'del', '(', ')')"""
+    outer: List[str] = []
+    depth = 0
+    for token in tokens:
+        if token in _CLOSING:
+            depth -= 1
+        if depth == 0:
+            outer.append(token)
+        if token in _OPENING:
+            depth += 1
+    return outer
+
+
+def _split(tokens: List[str], separators: frozenset) -> List[List[str]]:
+    """split the *tokens* at the *separators* outside of brackets"""
+    parts: List[List[str]] = [[]]
+    depth = 0
+    for token in tokens:
+        if token in _CLOSING:
+            depth -= 1
+        if depth == 0 and token in separators:
+            parts.append([])
+            continue
+        parts[-1].append(token)
+        if token in _OPENING:
+            depth += 1
+    return parts
+
+
+def _passes_input(tokens: List[str]) -> bool:
+    """check if each stage of the pipeline of the *tokens* outputs its (updated) input"""
+    for stage in _split(tokens, _STAGE_END):
+        outer = _outer(stage)
+        if not stage:
+            continue
+        if stage[0] in ("reduce", "foreach"):
+            return False
+        if _ASSIGNMENTS.intersection(outer) or "as" in outer:  # '.a = 1', '.a as $a'
+            continue
+        if outer == ["(", ")"] and _passes_input(stage[1:-1]):
+            continue
+        if outer == ["if", "end"]:
+            # 'if c then a elif d then b else c end' => [c, a, d, b, c] (without 'else': the input is passed)
+            parts = _split(stage[1:-1], frozenset(("then", "elif", "else")))
+            branches = parts[1::2] + (parts[-1:] if len(parts) % 2 else [])
+            if all(map(_passes_input, branches)):
+                continue
+        if outer[0] in _PASS_THROUGH_BUILTINS and outer[1:] in ([], ["(", ")"]):
+            continue
+        return False
+    return True
+
+
+def _replaces_output(code: str) -> bool:
+    """check if the *code* may output something else than its (updated) input
+
+    The input is passed if each stage of the top-level pipeline is an assignment ('.a = 1', '.a |= f'), a binding
+    ('.a as $a'), 'del(...)' / 'select(...)' or such a pipeline in parentheses / the branches of an 'if'. Everything
+    else (e.g. '{machine: .machine}', '[.machine]', '.machine', 'reduce' or a function call) builds a new output,
+    which drops the parts of the input which aren't named.
+    """
+    return not _passes_input(_without_definitions([match.group() for match in _TOKEN_PATTERN.finditer(code)]))
+
+
+def _path_scoped_functions(module_codes: List[str]) -> Set[str]:
+    """get the functions of the modules which only read the paths they name (modules may use each other)"""
+    reading: Set[str] = set()
+    while True:
+        functions = {function for code in module_codes for function in _defined_functions(code)} - reading
+        newly_reading = {
+            function for code in module_codes if _reads_input(code, functions) for function in _defined_functions(code)
+        } - reading
+        if not newly_reading:
+            return functions
+        reading |= newly_reading
+
+
+def patch_reads(patch_file: Path, jq_modules_dir: Path) -> Set[JsonPath]:
+    """get the (truncated) paths which the *patch_file* (and its modules) may read; {()} => everything"""
+    patch_file = Path(patch_file).resolve()
+    if patch_file not in _reads and declarative_patch.is_declarative(patch_file):
+        _reads[patch_file] = {path[:_DEPTH] for path in declarative_patch.patch_paths(patch_file)}
+    elif patch_file not in _reads:
+        with open(patch_file, "r") as f:
+            _, body = split_directives(f.read())
+        code = _code_only(body)
+        module_codes = []
+        for module in module_dependencies(patch_file, jq_modules_dir):
+            if module.suffix == ".jq":
+                with open(module, "r") as f:
+                    module_codes.append(_code_only(split_directives(f.read())[1]))
+        reads = _paths(code).union(*map(_paths, module_codes))
+        if _reads_input(code, _path_scoped_functions(module_codes)) or _replaces_output(code):
+            reads = {_ROOT}
+        _reads[patch_file] = reads
+    return _reads[patch_file]
+
+
+def changed_paths(old: Any, new: Any, path: JsonPath = _ROOT) -> Set[JsonPath]:
+    """get the (truncated) paths of all subtrees which differ between *old* and *new*"""
+    if old == new:
+        return set()
+    if len(path) == _DEPTH or not (isinstance(old, dict) and isinstance(new, dict)):
+        return {path}
+    changed: Set[JsonPath] = set()
+    for key in old.keys() | new.keys():
+        if key not in old or key not in new:
+            changed.add(path + (key,))
+        else:
+            changed |= changed_paths(old[key], new[key], path + (key,))
+    return changed
+
+
+def _overlap(paths: Set[JsonPath], other_paths: Set[JsonPath]) -> bool:
+    """check if a path is a prefix of (or equal to) one of the other paths or vice versa"""
+    return any(
+        path[:len(other_path)] == other_path or other_path[:len(path)] == path
+        for path in paths for other_path in other_paths
+    )
+
+
+def _take_over(mc: Any, previous_mc: Any, paths: Set[JsonPath]) -> Any:
+    """replace the subtrees at *paths* in *mc* with the ones of *previous_mc* (removed if missing there)"""
+    for path in paths:
+        if path == _ROOT:
+            return previous_mc
+        target, source = mc, previous_mc
+        for key in path[:-1]:
+            target = target.setdefault(key, {})
+            source = source.get(key, {}) if isinstance(source, dict) else {}
+        if path[-1] in source:
+            target[path[-1]] = source[path[-1]]
+        else:
+            target.pop(path[-1], None)
+    return mc
+
+
+def _relative(file: Path) -> str:
+    file = Path(file).resolve()
+    return str(file.relative_to(REPO_ROOT)) if file.is_relative_to(REPO_ROOT) else str(file)
+
+
+def evaluate(
+    mc: bytes,
+    patch_files: Sequence[Path],
+    jq_modules_dir: Path,
+    apply_patch: Callable[[bytes, Path], bytes],
+    on_step: Optional[Callable[[int, bytes], None]] = None
+) -> List[bytes]:
+    """apply the *patch_files* to the *mc*; return the mc before the first patch and after each patch
+
+    Only the patches which changed or depend on a changed subtree are applied with *apply_patch*, the results
+    of all other patches are taken from the mc cache. The dependency graph of the chain is recorded in the mc cache.
+    on_step(n, mc): called with the mc after the n-th patch
+    """
+    patch_files = list(patch_files)
+    keys = [mc_cache.patch_key(mc, patch_files[:n], jq_modules_dir) for n in range(len(patch_files) + 1)]
+    graph_key = mc_cache.graph_key(mc, patch_files)
+    previous = mc_cache.load_graph(graph_key) or []
+
+    patched_mcs = [mc]
+    mc_value = json.loads(mc)
+    # subtrees which differ from the last run at this point of the chain (None => unknown)
+    dirty: Optional[Set[JsonPath]] = set() if previous else None
+    graph: List[Dict] = []
+
+    for n, patch_file in enumerate(patch_files, start=1):
+        digest = mc_cache.patch_digest(patch_file, jq_modules_dir)
+        reads = patch_reads(patch_file, jq_modules_dir)
+        entry = previous[n - 1] if n <= len(previous) else {}
+        last_writes = {tuple(path) for path in entry.get("writes", [])}
+        # the mc after this patch in the last run
+        last_mc = mc_cache.load_patched(entry["output"]) if entry and dirty is not None else None
+        last_mc = None if last_mc is None else json.loads(last_mc)
+
+        patched_mc = mc_cache.load_patched(keys[n])
+        if patched_mc is None:
+            if (
+                entry.get("digest") == digest and dirty is not None and last_mc is not None
+                and not _overlap(reads | last_writes, dirty)
+            ):
+                # same patch, same inputs => same writes as in the last run
+                patched_mc = dump_json(_take_over(json.loads(patched_mcs[-1]), last_mc, last_writes))
+            else:
+                patched_mc = apply_patch(patched_mcs[-1], patch_file)
+            mc_cache.store_patched(keys[n], patched_mc)
+
+        patched_value = json.loads(patched_mc)
+        # a patch which may read the whole input may also build a new output (e.g. '{machine: .machine}' drops the
+        # other keys) => its output is taken over as a whole
+        writes = {_ROOT} if reads == {_ROOT} else changed_paths(mc_value, patched_value)
+        dirty = None if last_mc is None else changed_paths(last_mc, patched_value)
+
+        graph.append({
+            "patch": _relative(patch_file),
+            "digest": digest,
+            "modules": [_relative(module) for module in module_dependencies(patch_file, jq_modules_dir)],
+            "reads": sorted(list(path) for path in reads),
+            "writes": sorted(list(path) for path in writes),
+            "output": keys[n],
+        })
+        patched_mcs.append(patched_mc)
+        mc_value = patched_value
+        if on_step is not None:
+            on_step(n, patched_mc)
+
+    if graph != previous:
+        mc_cache.store_graph(graph_key, graph)
+    return patched_mcs
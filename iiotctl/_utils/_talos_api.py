@@ -0,0 +1,512 @@
+"""Native client for the talos machine api
+
+Optional backend for the talosctl wrappers in '_talosctl': when grpcio is installed, the talos api is called via gRPC
+instead of spawning talosctl. The client reads the contexts of the talosconfig like talosctl does and keeps one
+mTLS channel per endpoint open for the whole iiotctl run, so the TLS handshake (e.g. through the teleport proxy)
+is only done once.
+
+Only the few messages of the machine api (machine.MachineService) and the resource api (cosi.resource.State)
+which are used by iiotctl are encoded / decoded (protobuf wire format, no generated code required).
+"""
+
+import atexit
+import base64
+import datetime
+import os
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import yaml
+
+from . import _yaml12 as yaml12
+from ._constants import TALOS_CONFIG_USER
+
+try:
+    import grpc
+except ImportError:  # the native backend is optional
+    grpc = None
+
+DEFAULT_PORT = 50000
+CONNECT_TIMEOUT_SEC = 10.0
+# talosctl args which select the machine (all other args are options of the single commands)
+CONNECTION_ARGS = ("talosconfig", "context", "nodes", "endpoints")
+
+_APPLY_MODES = {"reboot": 0, "auto": 1, "no-reboot": 2, "staged": 3, "try": 4}
+_CONTAINERD_NAMESPACES = {"system": 1, "cri": 2}
+_SYSTEM_NAMESPACE = "system"  # containerd namespace of the talos services
+_DISK_TYPES = ("UNKNOWN", "SSD", "HDD", "NVME", "SD", "CD")
+_RESOURCE_DEFINITIONS = ("meta", "ResourceDefinitions.meta.cosi.dev")
+# enum names of the runtime events (index = enum value)
+_SEQUENCE_ACTIONS = ("NOOP", "START", "STOP")
+_PHASE_ACTIONS = ("START", "STOP")  # phases & tasks
+_SERVICE_ACTIONS = (
+    "INITIALIZED", "PREPARING", "WAITING", "RUNNING", "STOPPING", "FINISHED", "FAILED", "SKIPPED", "STARTING"
+)
+_MACHINE_STAGES = (
+    "UNKNOWN", "BOOTING", "INSTALLING", "MAINTENANCE", "RUNNING", "REBOOTING", "SHUTTING_DOWN", "RESETTING", "UPGRADING"
+)
+
+# open channels per endpoint + credentials; None => the channel can't be used (=> talosctl)
+_channels: Dict[Tuple[str, str, str, str], Any] = {}
+_clients: Dict[Tuple[Any, Optional[str]], "Client"] = {}
+_lock = threading.Lock()  # the clients are shared by the threads of a run
+
+
+class TalosApiError(Exception):
+    """error response of the talos api"""
+
+
+@dataclass
+class Version:
+    tag: str
+    sha: str
+    arch: str
+
+
+@dataclass
+class ApplyResult:
+    mode: str
+    mode_details: str
+    warnings: List[str] = field(default_factory=list)
+
+
+@dataclass
+class Disk:
+    """disk of a machine (like a row of 'talosctl disks')"""
+    dev: str
+    model: str = ""
+    serial: str = ""
+    type: str = ""
+    uuid: str = ""
+    wwid: str = ""
+    modalias: str = ""
+    name: str = ""
+    size: str = ""  # human readable, e.g. '512 GB'
+    bus_path: str = ""
+    subsystem: str = ""
+    read_only: bool = False
+    system_disk: bool = False
+
+
+@dataclass
+class Event:
+    """runtime event of a machine (like a row of 'talosctl events')
+
+    type: e.g. 'SequenceEvent', 'PhaseEvent', 'TaskEvent', 'ServiceStateEvent', 'MachineStatusEvent'
+    source: the sequence / phase / task / service of the event or the stage of the machine
+    action: e.g. 'START' / 'STOP' / 'ERROR' (sequences, phases, tasks), 'RUNNING' (services)
+    ready: only set for machine status events
+    """
+    id: str
+    type: str
+    source: str = ""
+    action: str = ""
+    message: str = ""
+    ready: Optional[bool] = None
+
+
+def pretty_size(size: int) -> str:
+    """format a size in bytes like talosctl (e.g. '512 GB', '1.5 MB')"""
+    value, unit = float(size), "B"
+    for unit in ("B", "kB", "MB", "GB", "TB", "PB"):
+        if value < 1000 or unit == "PB":
+            break
+        value /= 1000
+    return f"{value:.0f} {unit}" if unit == "B" or value >= 10 else f"{value:.1f} {unit}"
+
+
+# --- protobuf wire format ---
+
+def _varint(value: int) -> bytes:
+    value &= (1 << 64) - 1  # negative numbers are encoded as 64-bit two's complement
+    encoded = bytearray()
+    while True:
+        byte, value = value & 0x7F, value >> 7
+        encoded.append(byte | (0x80 if value else 0))
+        if not value:
+            return bytes(encoded)
+
+
+def _encode(*fields: Tuple[int, Any]) -> bytes:
+    """encode a message from (field number, value) pairs; None values are skipped, bytes are nested messages"""
+    message = bytearray()
+    for number, value in fields:
+        if value is None:
+            continue
+        if isinstance(value, (bool, int)):
+            message += _varint(number << 3) + _varint(int(value))
+        else:
+            value = value.encode() if isinstance(value, str) else value
+            message += _varint(number << 3 | 2) + _varint(len(value)) + value
+    return bytes(message)
+
+
+def _decode(message: bytes) -> Dict[int, List[int | bytes]]:
+    """decode a message into the values (varints or bytes) of its field numbers"""
+    fields: Dict[int, List[int | bytes]] = {}
+    pos = 0
+
+    def read_varint() -> int:
+        nonlocal pos
+        value, shift = 0, 0
+        while True:
+            byte = message[pos]
+            pos += 1
+            value |= (byte & 0x7F) << shift
+            shift += 7
+            if not byte & 0x80:
+                return value
+
+    while pos < len(message):
+        key = read_varint()
+        number, wire_type = key >> 3, key & 7
+        if wire_type == 0:
+            value = read_varint()
+        elif wire_type == 2:
+            length = read_varint()
+            value, pos = message[pos:pos + length], pos + length
+        elif wire_type in (1, 5):  # fixed 64 / 32 bit
+            length = 8 if wire_type == 1 else 4
+            value, pos = int.from_bytes(message[pos:pos + length], "little"), pos + length
+        else:
+            raise TalosApiError(f"unsupported protobuf wire type {wire_type}")
+        fields.setdefault(number, []).append(value)
+    return fields
+
+
+def _first(fields: Dict[int, List], number: int, default: Any = b"") -> Any:
+    return fields.get(number, [default])[0]
+
+
+def _string(fields: Dict[int, List], number: int) -> str:
+    return _first(fields, number).decode()
+
+
+def _timestamp(message: bytes) -> str:
+    seconds = _first(_decode(message), 1, 0)
+    return datetime.datetime.fromtimestamp(seconds, datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _enum(names: Tuple[str, ...], value: int) -> str:
+    return names[value] if value < len(names) else str(value)
+
+
+def _event(message: bytes) -> Event:
+    """decode a machine.Event message (the payload is a google.protobuf.Any)"""
+    fields = _decode(message)
+    data = _decode(_first(fields, 2))
+    event = Event(id=_string(fields, 3), type=_string(data, 1).rsplit(".", 1)[-1])
+    payload = _decode(_first(data, 2))
+    if event.type == "SequenceEvent":
+        event.source, event.action = _string(payload, 1), _enum(_SEQUENCE_ACTIONS, _first(payload, 2, 0))
+        if 3 in payload:
+            event.action, event.message = "ERROR", _string(_decode(_first(payload, 3)), 2)
+    elif event.type in ("PhaseEvent", "TaskEvent"):
+        event.source, event.action = _string(payload, 1), _enum(_PHASE_ACTIONS, _first(payload, 2, 0))
+    elif event.type == "ServiceStateEvent":
+        event.source, event.action = _string(payload, 1), _enum(_SERVICE_ACTIONS, _first(payload, 2, 0))
+        event.message = _string(payload, 3)
+    elif event.type == "MachineStatusEvent":
+        status = _decode(_first(payload, 2))
+        event.source, event.ready = _enum(_MACHINE_STAGES, _first(payload, 1, 0)), bool(_first(status, 1, 0))
+        event.message = ", ".join(
+            f"{_string(condition, 1)}: {_string(condition, 2)}" for condition in map(_decode, status.get(2, []))
+        )
+    return event
+
+
+def _sorted_keys(value: Any) -> Any:
+    """sort the keys of the (nested) dicts like talosctl (-o json marshals go maps => the keys are sorted)"""
+    if isinstance(value, dict):
+        return {key: _sorted_keys(value[key]) for key in sorted(value)}
+    if isinstance(value, list):
+        return [_sorted_keys(item) for item in value]
+    return value
+
+
+def _check_metadata(message: bytes):
+    """raise the error of a node in the common.Metadata of a response message"""
+    metadata = _decode(_first(_decode(message), 1))
+    if error := _string(metadata, 2):
+        raise TalosApiError(error)
+
+
+# --- talosconfig ---
+
+def _pem(value_b64: str) -> Optional[bytes]:
+    if not value_b64:
+        return None
+    # talos writes ed25519 keys (pkcs8) with a non standard pem label
+    return base64.b64decode(value_b64).replace(b"ED25519 PRIVATE KEY", b"PRIVATE KEY")
+
+
+def _target(endpoint: str) -> str:
+    host_port = endpoint.removeprefix("https://")
+    return host_port if ":" in host_port.rsplit("]", 1)[-1] else f"{host_port}:{DEFAULT_PORT}"
+
+
+def _load_context(talosconfig=None, context=None, nodes=None, endpoints=None) -> Optional[Dict]:
+    talosconfig = Path(talosconfig or os.environ.get("TALOSCONFIG") or TALOS_CONFIG_USER)
+    try:
+        with open(talosconfig, "r") as f:
+            config = yaml.safe_load(f) or {}
+    except OSError:
+        return None
+    context_values = (config.get("contexts") or {}).get(context or config.get("context"))
+    if context_values is None:
+        return None
+    nodes = nodes.split(",") if isinstance(nodes, str) else (nodes or context_values.get("nodes") or [])
+    endpoints = endpoints.split(",") if isinstance(endpoints, str) else (endpoints or context_values.get("endpoints"))
+    return {**context_values, "nodes": nodes, "endpoints": endpoints or []}
+
+
+# --- client ---
+
+class Client:
+    """talos api client of a single node; the channel is shared by all clients of the same endpoint
+
+    the resource definitions (to resolve the resource aliases) are loaded once per client
+    """
+
+    def __init__(self, channel, node: Optional[str]):
+        self._channel = channel
+        self.node = node
+        self._metadata = [("node", node)] if node else []
+        self._resource_definitions: Optional[List[Dict]] = None
+        self._resource_definitions_lock = threading.Lock()
+
+    def _call(self, method: str, request: bytes, timeout: Optional[float] = None) -> bytes:
+        try:
+            return self._channel.unary_unary(method)(request, metadata=self._metadata, timeout=timeout)
+        except grpc.RpcError as exc:
+            raise TalosApiError(f"{exc.code().name}: {exc.details()}") from None
+
+    def _stream(self, method: str, request: bytes, timeout: Optional[float] = None) -> Iterator[bytes]:
+        responses = self._channel.unary_stream(method)(request, metadata=self._metadata, timeout=timeout)
+        try:
+            yield from responses
+        except grpc.RpcError as exc:
+            raise TalosApiError(f"{exc.code().name}: {exc.details()}") from None
+        finally:  # the caller stopped early
+            responses.cancel()
+
+    def version(self, timeout: Optional[float] = None) -> Version:
+        """get the talos version of the node (like 'talosctl version')"""
+        response = _decode(self._call("/machine.MachineService/Version", b"", timeout))
+        message = _first(response, 1)
+        _check_metadata(message)
+        version = _decode(_first(_decode(message), 2))
+        return Version(tag=_string(version, 1), sha=_string(version, 2), arch=_string(version, 6))
+
+    def _resource(self, message: bytes) -> Dict:
+        """convert a cosi resource into the output format of 'talosctl get -o json' (incl. the order of the keys)"""
+        resource = _decode(message)
+        metadata = _decode(_first(resource, 1))
+        spec = _decode(_first(resource, 2))
+        labels = dict((_string(entry, 1), _string(entry, 2)) for entry in map(_decode, metadata.get(10, [])))
+        return _sorted_keys({
+            "node": self.node or "",
+            "metadata": {
+                "namespace": _string(metadata, 1),
+                "type": _string(metadata, 2),
+                "id": _string(metadata, 3),
+                "version": int(_string(metadata, 4) or 0),
+                "owner": _string(metadata, 5),
+                "phase": _string(metadata, 6),
+                "created": _timestamp(_first(metadata, 7)),
+                "updated": _timestamp(_first(metadata, 8)),
+                **({"labels": labels} if labels else {}),
+            },
+            "spec": yaml12.load(_string(spec, 2)),
+        })
+
+    def _list(self, namespace: str, resource_type: str) -> Iterator[Dict]:
+        responses = self._stream("/cosi.resource.State/List", _encode((1, namespace), (2, resource_type)))
+        return (self._resource(_first(_decode(response), 1)) for response in responses)
+
+    def _resolve(self, resource: str) -> Tuple[str, str]:
+        """resolve a resource name or alias (e.g. 'mc') to its namespace and type like talosctl does"""
+        with self._resource_definitions_lock:
+            if self._resource_definitions is None:
+                self._resource_definitions = [definition["spec"] for definition in self._list(*_RESOURCE_DEFINITIONS)]
+        for definition in self._resource_definitions:
+            names = [
+                definition.get("type"), definition.get("displayType"),
+                *definition.get("aliases", []), *definition.get("allAliases", [])
+            ]
+            if resource.lower() in (str(name).lower() for name in names if name):
+                return definition.get("defaultNamespace", ""), definition["type"]
+        raise TalosApiError(f"resource type '{resource}' is not registered")
+
+    def iter_resources(self, resource: str) -> Iterator[Dict]:
+        """yield all resources of a type as they arrive (like 'talosctl get -o json')"""
+        yield from self._list(*self._resolve(resource))
+
+    def get(self, resource: str, id: Optional[str] = None) -> Dict | List[Dict]:
+        """get a resource (by id) or all resources of a type (like 'talosctl get -o json')"""
+        namespace, resource_type = self._resolve(resource)
+        if id is None:
+            return list(self._list(namespace, resource_type))
+        response = self._call("/cosi.resource.State/Get", _encode((1, namespace), (2, resource_type), (3, id)))
+        return self._resource(_first(_decode(response), 1))
+
+    def apply_configuration(self, mc: bytes, mode="auto", dry_run=False) -> ApplyResult:
+        """apply the *mc* to the node (like 'talosctl apply-config')"""
+        if mode not in _APPLY_MODES:
+            raise TalosApiError(f"unknown apply mode '{mode}'")
+        request = _encode((1, mc), (4, _APPLY_MODES[mode] or None), (5, dry_run or None))
+        message = _first(_decode(self._call("/machine.MachineService/ApplyConfiguration", request)), 1)
+        _check_metadata(message)
+        result = _decode(message)
+        modes = {number: name for name, number in _APPLY_MODES.items()}
+        return ApplyResult(
+            mode=modes.get(_first(result, 3, 0), "reboot"),
+            mode_details=_string(result, 4),
+            warnings=[warning.decode() for warning in result.get(2, [])],
+        )
+
+    def disks(self) -> List[Disk]:
+        """get the disks of the node (like 'talosctl disks')"""
+        disks = []
+        for message in _decode(self._call("/storage.StorageService/Disks", b"")).get(1, []):
+            _check_metadata(message)
+            for disk in map(_decode, _decode(message).get(2, [])):
+                disk_type = _first(disk, 9, 0)
+                disks.append(Disk(
+                    dev=_string(disk, 3),
+                    model=_string(disk, 2),
+                    serial=_string(disk, 5),
+                    type=_DISK_TYPES[disk_type] if disk_type < len(_DISK_TYPES) else "UNKNOWN",
+                    uuid=_string(disk, 7),
+                    wwid=_string(disk, 8),
+                    modalias=_string(disk, 6),
+                    name=_string(disk, 4),
+                    size=pretty_size(_first(disk, 1, 0)),
+                    bus_path=_string(disk, 10),
+                    subsystem=_string(disk, 12),
+                    read_only=bool(_first(disk, 13, 0)),
+                    system_disk=bool(_first(disk, 11, 0)),
+                ))
+        return disks
+
+    def image_list(self, namespace="cri") -> List[str]:
+        """get the names of the images in the containerd *namespace* of the node (like 'talosctl image list')"""
+        images = []
+        request = _encode((1, _CONTAINERD_NAMESPACES[namespace]))
+        for message in self._stream("/machine.MachineService/ImageList", request):
+            _check_metadata(message)
+            images.append(_string(_decode(message), 2))
+        return images
+
+    def image_pull(self, image_ref: str, namespace="cri"):
+        """pull the image into the containerd *namespace* of the node (like 'talosctl image pull')"""
+        request = _encode((1, _CONTAINERD_NAMESPACES[namespace]), (2, image_ref))
+        for message in _decode(self._call("/machine.MachineService/ImagePull", request)).get(1, []):
+            _check_metadata(message)
+
+    def events(self, tail_events=0, tail_id: Optional[str] = None, timeout: Optional[float] = None) -> Iterator[Event]:
+        """stream the runtime events of the node (like 'talosctl events')
+
+        tail_events: number of past events (-1 => all), tail_id: only the events after this id
+        """
+        request = _encode((1, tail_events or None), (2, tail_id))
+        for message in self._stream("/machine.MachineService/Events", request, timeout):
+            yield _event(message)
+
+    def _data_lines(self, method: str, request: bytes) -> Iterator[str]:
+        """stream the common.Data chunks of a response as lines (a line can be split over chunks)"""
+        rest = b""
+        for message in self._stream(method, request):
+            _check_metadata(message)
+            lines = (rest + _first(_decode(message), 2)).split(b"\n")
+            rest = lines.pop()
+            for line in lines:
+                yield line.decode(errors="replace")
+        if rest:
+            yield rest.decode(errors="replace")
+
+    def logs(self, service: str, tail_lines=-1, follow=False) -> Iterator[str]:
+        """stream the log lines of a talos service (like 'talosctl logs'); tail_lines: -1 => all"""
+        request = _encode((1, _SYSTEM_NAMESPACE), (2, service), (4, follow or None), (5, tail_lines))
+        yield from self._data_lines("/machine.MachineService/Logs", request)
+
+    def dmesg(self, follow=False) -> Iterator[str]:
+        """stream the kernel messages of the node (like 'talosctl dmesg')"""
+        yield from self._data_lines("/machine.MachineService/Dmesg", _encode((1, follow or None)))
+
+    def upgrade(self, image: str, preserve=False, stage=False, force=False) -> str:
+        """start the upgrade of the node (like 'talosctl upgrade --wait=false'); return the ack message"""
+        request = _encode((1, image), (2, preserve or None), (3, stage or None), (4, force or None))
+        message = _first(_decode(self._call("/machine.MachineService/Upgrade", request)), 1)
+        _check_metadata(message)
+        return _string(_decode(message), 2)
+
+
+def _close_channels():
+    for channel in _channels.values():
+        if channel is not None:
+            channel.close()
+    _channels.clear()
+    _clients.clear()
+
+
+def _connect(channel, timeout: float) -> bool:
+    """connect the *channel* (incl. the TLS handshake); return False when the connection fails
+
+    e.g. the TLS library of grpcio can't sign with the ed25519 client keys which talosctl generates by default
+    """
+    state = {}
+    done = threading.Event()
+
+    def on_change(connectivity):
+        if connectivity in (grpc.ChannelConnectivity.READY, grpc.ChannelConnectivity.TRANSIENT_FAILURE):
+            state.setdefault("ready", connectivity == grpc.ChannelConnectivity.READY)
+            done.set()
+
+    channel.subscribe(on_change, try_to_connect=True)
+    done.wait(timeout)
+    channel.unsubscribe(on_change)
+    return state.get("ready", False)
+
+
+def client(**talos_args) -> Optional[Client]:
+    """get the client for the machine selected by the talosctl *talos_args* (talosconfig, context, nodes, endpoints)
+
+    return None when talosctl must be used instead: grpcio isn't installed, there are other talosctl args,
+    more than one node is selected, the talosconfig can't be loaded or the connection fails
+    (=> talosctl prints the error)
+    """
+    if grpc is None or set(talos_args) - set(CONNECTION_ARGS):
+        return None
+    context = _load_context(**talos_args)
+    if context is None or not context["endpoints"] or len(context["nodes"]) > 1:
+        return None
+
+    with _lock:
+        return _client(context)
+
+
+def _client(context: Dict) -> Optional[Client]:
+    target = _target(context["endpoints"][0])
+    key = (target, context.get("ca", ""), context.get("crt", ""), context.get("key", ""))
+    if key not in _channels:
+        if not _channels:
+            atexit.register(_close_channels)
+        credentials = grpc.ssl_channel_credentials(
+            root_certificates=_pem(context.get("ca")),
+            private_key=_pem(context.get("key")),
+            certificate_chain=_pem(context.get("crt")),
+        )
+        channel = grpc.secure_channel(target, credentials)
+        if not _connect(channel, CONNECT_TIMEOUT_SEC):
+            channel.close()
+            channel = None
+        _channels[key] = channel
+    if _channels[key] is None:
+        return None
+    node = next(iter(context["nodes"]), None)
+    if (key, node) not in _clients:
+        _clients[(key, node)] = Client(_channels[key], node)
+    return _clients[(key, node)]
@@ -1,62 +1,276 @@
 import base64
+import copy
 import datetime
+import ipaddress
 import json
+import os
 import re
 import subprocess as sp
 import sys
 import tempfile
+import threading
+from contextlib import contextmanager
 from pathlib import Path
 from time import sleep
-from typing import Dict, Iterable, List
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 
 import yaml
 from cryptography import x509
 from cryptography.hazmat.primitives import hashes, serialization
-from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.hazmat.primitives.asymmetric import ec, ed448, ed25519
 from cryptography.x509.oid import ExtendedKeyUsageOID, NameOID
 
+from . import _mc_cache as mc_cache
+from . import _mc_schema as mc_schema
+from . import _patch_graph as patch_graph
+from . import _talos_api as talos_api
 from ._common import (Command, TyperAbort, parse_kwargs_to_cli_args,
-                      patch_json, print_if)
+                      patch_json, print_error, print_if)
 from ._constants import JQ_MODULES_DIR, K8S_CONFIG_USER, REPO_ROOT
+from ._jq import patch_json_fused, patch_json_in_process, run_filter_in_process
+from ._talos_api import Disk, Event
 
 ENCODING = sys.stdout.encoding
 
+# resources read from the machines during this iiotctl run (key: resource, id, connection args)
+_resource_cache: Dict[Tuple, Any] = {}
+_resource_cache_lock = threading.Lock()
+
+_WHITESPACE = re.compile(r'\s*')
+_COLUMN_SEPARATOR = re.compile(r'\s{3,}')  # talosctl tables are padded with at least 3 spaces
+_TALOS_CLIENT_ROLE = "os:admin"  # role of the generated talosconfig (organization of the client cert)
+_TALOS_ED25519_KEY_PEM_TYPE = b"ED25519 PRIVATE KEY"
+
+
+def _cache_key(resource: str, id: Optional[str], talos_args: Dict) -> Tuple:
+    return resource, id, tuple(sorted((arg, str(value)) for arg, value in talos_args.items()))
+
+
+def _cached_read(resource: str, id: Optional[str], talos_args: Dict, read: Callable[[], Any]) -> Any:
+    """serve a read of a resource from the resource cache; *read* is only called once per run and key"""
+    key = _cache_key(resource, id, talos_args)
+    with _resource_cache_lock:
+        cached = key in _resource_cache
+        value = _resource_cache.get(key)
+    if not cached:
+        value = read()
+        with _resource_cache_lock:
+            _resource_cache[key] = value
+    return copy.deepcopy(value)  # the callers may change the returned resources
+
+
+def invalidate_resource_cache():
+    """forget all resources read during this run (the machine was changed, e.g. by an apply or upgrade)"""
+    with _resource_cache_lock:
+        _resource_cache.clear()
+
+
+def _parse_table(table: str) -> List[Dict[str, str]]:
+    """parse a table printed by talosctl; the values are cut at the start positions of the (aligned) header columns
+
+    => values with (wide) spaces, e.g. disk models, are kept; empty values ('-') are skipped
+    """
+    header, *lines = table.splitlines() or [""]
+    # a single space joins the words of a column name (e.g. 'PEER URLS'), the columns are padded with more spaces
+    columns = [(match.group(), match.start()) for match in re.finditer(r'\S+(?: \S+)*', header)]
+    ends = [start for _, start in columns[1:]] + [None]
+    rows = []
+    for line in filter(str.strip, lines):
+        values = {name: line[start:end].strip() for (name, start), end in zip(columns, ends)}
+        rows.append({name: value for name, value in values.items() if value not in ("", "-")})
+    return rows
+
+
+def etcd_members(**talos_args) -> List[Dict[str, str]]:
+    """get the members of the etcd cluster (the rows of 'talosctl etcd members')"""
+    table = Command.check_output(
+        cmd=["talosctl", "etcd", "members", *parse_kwargs_to_cli_args(**talos_args)],
+        additional_error_msg="Can't get the etcd members."
+    )
+    return _parse_table(table)
+
+
+def etcd_status(**talos_args) -> List[Dict[str, str]]:
+    """get the status of the etcd members (the rows of 'talosctl etcd status')"""
+    table = Command.check_output(
+        cmd=["talosctl", "etcd", "status", *parse_kwargs_to_cli_args(**talos_args)],
+        additional_error_msg="Can't get the etcd status."
+    )
+    return _parse_table(table)
+
+
+def _disk_from_resource(resource: Dict) -> Disk:
+    """convert a 'disks' resource (talos >= 1.8) into a disk record"""
+    spec = resource["spec"]
+    transport = spec.get("transport", "")
+    disk_type = (
+        "CD" if spec.get("cdrom") else "NVME" if transport == "nvme" else "SD" if transport == "mmc"
+        else "HDD" if spec.get("rotational") else "SSD"
+    )
+    return Disk(
+        dev=spec.get("dev_path", f"/dev/{resource['metadata']['id']}"),
+        model=spec.get("model", ""),
+        serial=spec.get("serial", ""),
+        type=disk_type,
+        uuid=spec.get("uuid", ""),
+        wwid=spec.get("wwid", ""),
+        modalias=spec.get("modalias", ""),
+        name=resource["metadata"]["id"],
+        size=spec.get("pretty_size") or talos_api.pretty_size(spec.get("size", 0)),
+        bus_path=spec.get("bus_path", ""),
+        subsystem=spec.get("sub_system", ""),
+        read_only=bool(spec.get("readonly")),
+    )
+
+
+def disks(**talos_args) -> Dict[str, Disk]:
+    """get the disks of the machine by device (e.g. '/dev/sda')
+
+    The source depends on the talos version of the machine (not on the version of the repo, the machine may not be
+    upgraded yet): the 'disks' resources (talos >= 1.8), otherwise the disks api (talos api) or the table of
+    'talosctl disks' (talos < 1.8, there are no 'disks' resources).
+    """
+    live_version = get_live_talos_version(**talos_args)
+    if tuple(map(int, re.findall(r'\d+', live_version)[:2])) >= (1, 8):
+        return {disk.dev: disk for disk in map(_disk_from_resource, iter_resources("disks", **talos_args))}
+
+    if (api := talos_api.client(**talos_args)) is not None:
+        try:
+            return {disk.dev: disk for disk in api.disks()}
+        except talos_api.TalosApiError as exc:
+            raise TyperAbort(str(exc), "Can't get the disks.")
 
-def disks(**talos_args) -> Dict[str, Dict[str, str]]:
     disks_table = Command.check_output(cmd=["talosctl", "disks", *parse_kwargs_to_cli_args(**talos_args)])
-    header_line = disks_table.splitlines()[0]
-    keys = header_line.split()[:11]  # only use the first 11 elements, skip READ_ONLY ...
-    disk_entries = disks_table.splitlines()[1:]
     disks = {}
-    for i in disk_entries:
-        disk_values = re.split(r'\s{3,}', i)
-        disk = {key: value for key, value in zip(keys, disk_values) if value != "-"}
-        name = disk.pop("DEV")
-        disks.update({name: disk})
+    for row in _parse_table(disks_table):
+        disks[row["DEV"]] = Disk(
+            dev=row["DEV"],
+            model=row.get("MODEL", ""),
+            serial=row.get("SERIAL", ""),
+            type=row.get("TYPE", ""),
+            uuid=row.get("UUID", ""),
+            wwid=row.get("WWID", ""),
+            modalias=row.get("MODALIAS", ""),
+            name=row.get("NAME", ""),
+            size=row.get("SIZE", ""),
+            bus_path=row.get("BUS_PATH", ""),
+            subsystem=row.get("SUBSYSTEM", ""),
+            read_only=row.get("READ_ONLY", "false") not in ("false", ""),
+            system_disk=row.get("SYSTEM_DISK", "false") not in ("false", ""),
+        )
     return disks
 
 
-def get(resource: str, id: str = None, **talos_args) -> Dict | List[Dict]:
-    """get a resource from the machine via talosctl as dict (list of dicts)"""
+def _stream_lines(cmd: List, additional_error_msg="", timeout: Optional[float] = None, check=True) -> Iterator[str]:
+    """run the *cmd* and yield its stdout lines as they arrive
+
+    exit 1 when the cmd fails or the *timeout* expires (check=False => the lines just end)
+    """
+    with tempfile.TemporaryFile("w+") as stderr:  # a file => a lot of stderr output can't block the cmd
+        process = sp.Popen(cmd, stdout=sp.PIPE, stderr=stderr, text=True)
+        timer = threading.Timer(timeout, process.kill) if timeout is not None else None
+        if timer is not None:
+            timer.start()
+        try:
+            yield from process.stdout
+            process.wait()
+        finally:  # the caller stopped early
+            if timer is not None:
+                timer.cancel()
+            if process.poll() is None:
+                process.kill()
+            process.stdout.close()
+        if process.returncode and check:
+            stderr.seek(0)
+            raise TyperAbort(stderr.read(), additional_error_msg)
+
+
+def _json_documents(lines: Iterable[str]) -> Iterator[Any]:
+    """decode the concatenated json documents (e.g. of 'talosctl get -o json') while the *lines* arrive
+
+    The buffered lines are only decoded when a line closes a top-level document (not indented, ending with a bracket),
+    so the work is linear in the size of the output.
+    """
+    decoder = json.JSONDecoder()
+    buffer: List[str] = []
+    for line in lines:
+        buffer.append(line)
+        if line[:1].isspace() or not line.rstrip().endswith(("}", "]")):
+            continue
+        text, pos = "".join(buffer), 0
+        while (pos := _WHITESPACE.match(text, pos).end()) < len(text):
+            try:
+                document, pos = decoder.raw_decode(text, pos)
+            except json.JSONDecodeError:  # incomplete => wait for more lines
+                break
+            yield document
+        buffer = [text[pos:]] if pos < len(text) else []
+
+    rest = "".join(buffer).strip()
+    if rest:
+        yield decoder.decode(rest)  # raise the error of a truncated document
+
+
+def _iter_resources(resource: str, id: str = None, **talos_args) -> Iterator[Dict]:
+    if (api := talos_api.client(**talos_args)) is not None:
+        try:
+            if id is None:
+                yield from api.iter_resources(resource)
+            else:
+                yield api.get(resource, id)
+            return
+        except talos_api.TalosApiError as exc:
+            raise TyperAbort(str(exc), f"Can't get the talos resource: {resource}.")
+
     cmd = ["talosctl", "get", resource, "-o", "json", *parse_kwargs_to_cli_args(**talos_args)]
     if id is not None:
         cmd.append(id)
-    cmd_result = Command.check_output(cmd, additional_error_msg=f"Can't get the talos resource: {resource}.")
+    yield from _json_documents(_stream_lines(cmd, additional_error_msg=f"Can't get the talos resource: {resource}."))
 
-    try:
-        return json.loads(cmd_result)
-    except json.JSONDecodeError:
-        decoder = json.JSONDecoder()
-        result = []
-        while cmd_result:
-            element, new_start = decoder.raw_decode(cmd_result)
-            cmd_result = cmd_result[new_start:].strip()
-            result.append(element)
-        return result
+
+def iter_resources(resource: str, id: str = None, **talos_args) -> Iterator[Dict]:
+    """yield the resources from the machine via the talos api / talosctl as they arrive
+
+    The caller can filter the resources (or stop) before all resources are read.
+    Each resource type is only read once per run (see 'invalidate_resource_cache').
+    """
+    key = _cache_key(resource, id, talos_args)
+    with _resource_cache_lock:
+        cached = copy.deepcopy(_resource_cache.get(key))
+    if cached is not None:
+        yield from cached
+        return
+
+    resources = []
+    for resource_ in _iter_resources(resource, id, **talos_args):
+        resources.append(resource_)
+        yield copy.deepcopy(resource_)  # the callers may change the returned resources
+    with _resource_cache_lock:
+        _resource_cache[key] = resources
+
+
+def get(resource: str, id: str = None, **talos_args) -> Dict | List[Dict]:
+    """get a resource from the machine via the talos api / talosctl as dict (list of dicts)
+
+    each resource is only read once per run (see 'invalidate_resource_cache')
+    """
+    resources = list(iter_resources(resource, id, **talos_args))
+    # same as the parsed talosctl output: a single resource isn't returned as a list
+    return resources[0] if len(resources) == 1 else resources
 
 
 def upgrade_talos(**talos_args):
-    """upgrade talos via talosctl"""
+    """upgrade talos via the talos api / talosctl (the talos api is only used when not waiting for the upgrade)"""
+    invalidate_resource_cache()
+    upgrade_args = {arg: talos_args[arg] for arg in ("image", "preserve", "stage", "force") if arg in talos_args}
+    connection_args = {arg: value for arg, value in talos_args.items() if arg not in upgrade_args}
+    if connection_args.pop("wait", True) is False and (api := talos_api.client(**connection_args)) is not None:
+        try:
+            api.upgrade(**upgrade_args)
+            return
+        except talos_api.TalosApiError as exc:
+            raise TyperAbort(str(exc), "Can't upgrade talos.")
+
     Command.check_output(cmd=["talosctl", "upgrade", *parse_kwargs_to_cli_args(**talos_args)])
 
 
@@ -78,26 +292,173 @@ def image_default(**talos_args):
     return Command.check_output(cmd=["talosctl", "image", "default", *parse_kwargs_to_cli_args(**talos_args)])
 
 
-def image_pull(image_ref: str, **talos_args):
-    Command.check_output(cmd=["talosctl", "image", "pull", image_ref, *parse_kwargs_to_cli_args(**talos_args)])
+def image_list(namespace="cri", **talos_args) -> List[str]:
+    """get the names of the images in the containerd *namespace* of the machine via the talos api / talosctl"""
+    error_msg = "Can't list the images of the machine."
+    if (api := talos_api.client(**talos_args)) is not None:
+        try:
+            return api.image_list(namespace)
+        except talos_api.TalosApiError as exc:
+            raise TyperAbort(str(exc), error_msg)
+
+    table = Command.check_output(
+        cmd=["talosctl", "image", "list", *parse_kwargs_to_cli_args(namespace=namespace, **talos_args)],
+        additional_error_msg=error_msg
+    )
+    return [row["IMAGE"] for row in _parse_table(table) if "IMAGE" in row]
+
+
+def image_pull(image_ref: str, exit_on_failure=True, namespace="cri", **talos_args) -> Optional[str]:
+    """pull the image into the containerd *namespace* of the machine via the talos api / talosctl
+
+    return the error message when the pull failed and exit_on_failure=False (otherwise exit 1), None on success
+    """
+    if (api := talos_api.client(**talos_args)) is not None:
+        try:
+            api.image_pull(image_ref, namespace)
+            return None
+        except talos_api.TalosApiError as exc:
+            error = str(exc)
+    else:
+        pull_args = parse_kwargs_to_cli_args(namespace=namespace, **talos_args)
+        result = Command.run(cmd=["talosctl", "image", "pull", image_ref, *pull_args])
+        if not result.returncode:
+            return None
+        error = result.stderr.strip()
+
+    if exit_on_failure:
+        raise TyperAbort(error, f"Can't pull the image: {image_ref}.")
+    return error
+
+
+def _event_from_line(line: str) -> Optional[Event]:
+    """parse a row of 'talosctl events' (NODE, ID, EVENT, [ACTOR], SOURCE, MESSAGE); None => not an event"""
+    columns = _COLUMN_SEPARATOR.split(line.strip())
+    type_column = next((i for i, column in enumerate(columns) if column.endswith("Event")), None)
+    if type_column is None or type_column == 0 or len(columns) < type_column + 3:
+        return None
+    event = Event(id=columns[type_column - 1], type=columns[type_column].rsplit(".", 1)[-1])
+    event.source, message = columns[-2], columns[-1]
+    if event.type in ("SequenceEvent", "PhaseEvent", "TaskEvent"):
+        event.action, _, event.message = message.partition(": ")
+        event.action = event.action.upper().rstrip(":")  # 'error: <message>' of a failed sequence
+    elif event.type == "ServiceStateEvent":
+        action, _, event.message = message.partition(": ")
+        event.action = action.upper()
+    elif event.type == "MachineStatusEvent":  # 'ready: false, unmet conditions: [...]'
+        ready, _, conditions = message.partition(", unmet conditions: ")
+        event.ready, event.message = ready.strip() == "ready: true", conditions.strip("[]")
+    return event
+
+
+def events(
+    tail_events=0, since_id: Optional[str] = None, timeout: Optional[float] = None, exit_on_failure=True, **talos_args
+) -> Iterator[Event]:
+    """stream the runtime events of the machine via the talos api / talosctl until the stream ends
+
+    tail_events: number of past events (-1 => all), since_id: only the events after this id
+    exit 1 when the connection is lost or the *timeout* expires (exit_on_failure=False => the stream just ends)
+    """
+    error_msg = "Lost the event stream of the machine."
+    if (api := talos_api.client(**talos_args)) is not None:
+        try:
+            yield from api.events(tail_events, since_id, timeout)
+        except talos_api.TalosApiError as exc:
+            if exit_on_failure:
+                raise TyperAbort(str(exc), error_msg)
+        return
+
+    event_args = {"tail": tail_events, **({"since": since_id} if since_id else {}), **talos_args}
+    cmd = ["talosctl", "events", *parse_kwargs_to_cli_args(**event_args)]
+    for line in _stream_lines(cmd, additional_error_msg=error_msg, timeout=timeout, check=exit_on_failure):
+        if (event := _event_from_line(line)) is not None:
+            yield event
+
+
+def logs(service: str, tail_lines=-1, follow=False, **talos_args) -> Iterator[str]:
+    """stream the log lines of a talos *service* via the talos api / talosctl as they arrive; tail_lines: -1 => all"""
+    error_msg = f"Can't get the logs of the service: {service}."
+    if (api := talos_api.client(**talos_args)) is not None:
+        try:
+            yield from api.logs(service, tail_lines, follow)
+            return
+        except talos_api.TalosApiError as exc:
+            raise TyperAbort(str(exc), error_msg)
+
+    cmd = ["talosctl", "logs", service, *parse_kwargs_to_cli_args(tail=tail_lines, follow=follow, **talos_args)]
+    for line in _stream_lines(cmd, additional_error_msg=error_msg):
+        yield line.rstrip("\n")
+
+
+def dmesg(follow=False, **talos_args) -> Iterator[str]:
+    """stream the kernel messages of the machine via the talos api / talosctl as they arrive"""
+    error_msg = "Can't get the kernel messages."
+    if (api := talos_api.client(**talos_args)) is not None:
+        try:
+            yield from api.dmesg(follow)
+            return
+        except talos_api.TalosApiError as exc:
+            raise TyperAbort(str(exc), error_msg)
+
+    cmd = ["talosctl", "dmesg", *parse_kwargs_to_cli_args(follow=follow, **talos_args)]
+    for line in _stream_lines(cmd, additional_error_msg=error_msg):
+        yield line.rstrip("\n")
+
+
+def last_event_id(**talos_args) -> Optional[str]:
+    """get the id of the latest runtime event of the machine (=> the events after it can be followed)"""
+    return next((event.id for event in events(tail_events=1, **talos_args)), None)
+
+
+@contextmanager
+def _mc_file(mc: bytes) -> Iterator[Tuple[Path, Dict]]:
+    """provide the *mc* as a file for a talosctl command; yield the file path and the args for the command
+
+    The mc is kept in an anonymous in-memory file (memfd, linux) which is passed to talosctl and opened via
+    '/dev/fd/N' => the mc is never written to disk. A file in a tempdir is used where memfd isn't available.
+    """
+    fd = None
+    if hasattr(os, "memfd_create"):
+        try:
+            fd = os.memfd_create("mc.json", os.MFD_CLOEXEC)
+        except OSError:  # e.g. blocked by a seccomp profile
+            fd = None
+
+    if fd is not None:
+        try:
+            with open(fd, "wb", closefd=False) as fmc:
+                fmc.write(mc)
+            yield Path(f"/dev/fd/{fd}"), {"pass_fds": (fd,)}
+        finally:
+            os.close(fd)
+        return
+
+    with tempfile.TemporaryDirectory(prefix="talos-mc") as td:
+        mc_file = Path(td) / "mc.json"
+        with open(mc_file, "wb") as fmc:
+            fmc.write(mc)
+        yield mc_file, {}
 
 
 def apply_mc(mc: bytes, exit_on_failure=True, print_errors=True, **talos_args):
-    """apply the mc to a machine with talosctl
+    """apply the mc to a machine via the talos api / talosctl
 
     **talos_args: are passed to the talosctl command
     """
+    if not talos_args.get("dry_run"):
+        invalidate_resource_cache()
+    apply_args = {arg: talos_args[arg] for arg in ("mode", "dry_run") if arg in talos_args}
+    connection_args = {arg: value for arg, value in talos_args.items() if arg not in apply_args}
+    if (api := talos_api.client(**connection_args)) is not None:
+        return _apply_mc_via_api(api, mc, exit_on_failure, print_errors, **apply_args)
+
     additional_args = parse_kwargs_to_cli_args(**talos_args)
     mode = talos_args["mode"] if "mode" in talos_args else "auto"
     error_msg = f'Can not apply the machine config in {mode} mode.'
     error_msg = error_msg + " (via dry-run)" if "dry_run" in talos_args else error_msg
 
-    # tempdir is required because the apply cmd must read from a file
-    with tempfile.TemporaryDirectory() as td:
-        tmp_dir = Path(td)
-        mc_file = tmp_dir / "mc.json"
-        with open(mc_file, "wb") as fmc:
-            fmc.write(mc)
+    # the apply cmd must read the mc from a file
+    with _mc_file(mc) as (mc_file, file_args):
         base_cmd = [
             "talosctl",
             "apply-config",
@@ -108,7 +469,8 @@ def apply_mc(mc: bytes, exit_on_failure=True, print_errors=True, **talos_args):
         cmd_result = Command.check(
             cmd=base_cmd + additional_args,
             ignore_error_msg=not print_errors,
-            additional_error_msg=error_msg if print_errors else ""
+            additional_error_msg=error_msg if print_errors else "",
+            **file_args
         )
 
     if exit_on_failure and not cmd_result:
@@ -117,6 +479,22 @@ def apply_mc(mc: bytes, exit_on_failure=True, print_errors=True, **talos_args):
     return cmd_result
 
 
+def _apply_mc_via_api(api: talos_api.Client, mc: bytes, exit_on_failure: bool, print_errors: bool, **apply_args):
+    """apply the mc with the native talos api client (same behavior as the talosctl variant of 'apply_mc')"""
+    mode = apply_args.get("mode", "auto")
+    error_msg = f'Can not apply the machine config in {mode} mode.'
+    error_msg = error_msg + " (via dry-run)" if "dry_run" in apply_args else error_msg
+    try:
+        api.apply_configuration(mc, mode=mode, dry_run=bool(apply_args.get("dry_run")))
+    except talos_api.TalosApiError as exc:
+        if print_errors:
+            print_error(str(exc), error_msg)
+        if exit_on_failure:
+            raise TyperAbort()
+        return False
+    return True
+
+
 def fetch_mc(id: str, **talos_args) -> bytes:
     """fetch the mc by id from a machine with talosctl
 
@@ -124,14 +502,25 @@ def fetch_mc(id: str, **talos_args) -> bytes:
     """
 
     mc_with_meta = get(resource="mc", id=id, **talos_args)
-    return bytes(json.dumps(mc_with_meta["spec"], indent=2), ENCODING)
+    # sorted keys like the patched mc (jq -S) => the same config has the same bytes with each backend
+    return bytes(json.dumps(mc_with_meta["spec"], indent=2, sort_keys=True), ENCODING)
 
 
 def get_live_talos_version(**talos_args) -> str:
-    """get the talos version from a machine with talosctl
+    """get the talos version from a machine with talosctl (read once per run)
 
     **talos_args: are passed to the talosctl command
     """
+    return _cached_read("talosctl version", None, talos_args, lambda: _get_live_talos_version(**talos_args))
+
+
+def _get_live_talos_version(**talos_args) -> str:
+    if (api := talos_api.client(**talos_args)) is not None:
+        try:
+            return api.version(timeout=10.0).tag.removeprefix("v")
+        except talos_api.TalosApiError as exc:
+            raise TyperAbort(str(exc), "Can't get the talos version.")
+
     additional_args = parse_kwargs_to_cli_args(**talos_args)
     cmd = ["talosctl", "version"] + additional_args
     cmd_result = Command.check_output(cmd, additional_error_msg="Can't get the talos version.", timeout=10.0)
@@ -166,6 +555,10 @@ def get_live_k8s_version(mc: bytes):
     # match the image version of kubelet (ghcr.io/siderolabs/kubelet:v...)
     jq_filter = '.machine.kubelet.image | match("(?<=:v).*").string'
 
+    results = run_filter_in_process(jq_filter, mc)
+    if results is not None and len(results) == 1:
+        return str(results[0])
+
     cmd_result: bytes = Command.check_output(
         cmd=["jq", jq_filter],
         additional_error_msg="Can't get the kubelet image version.",
@@ -213,33 +606,160 @@ def generate_mc(cluster_name: str, ttl_years: int, **talos_args):
     return controlplane_mc, talosconfig
 
 
-def validate_mc(mc: bytes, mode="metal"):
-    """validate the *mc* with talosctl
+def _run_validate_mc(mc: bytes, mode="metal", cache=False, semantic=True):
+    """validate the *mc* against the bundled schema and with talosctl; return the completed validation process
+
+    cache: serve / store the talosctl validation result from the mc cache
+    semantic: validate with talosctl, otherwise only the structure of the mc is checked against the schema
+    """
+    schema_errors = mc_schema.validate(mc)
+    if schema_errors or not semantic:
+        return sp.CompletedProcess(["mc-schema"], int(bool(schema_errors)), stdout="", stderr="\n".join(schema_errors))
+
+    if cache and (result := mc_cache.load_validation(mc, mode)) is not None:
+        return result
+
+    # talosctl validate needs a file which contains the mc
+    with _mc_file(mc) as (mc_file, file_args):
+        result = Command.run(cmd=["talosctl", "validate", f"--mode={mode}", "-c", mc_file], **file_args)
+
+    if cache:
+        mc_cache.store_validation(mc, mode, result)
+    return result
+
+
+def validate_mc(
+    mc: bytes, mode="metal", additional_error_msg="Machine config is not valid.", cache=False, semantic=True
+):
+    """validate the *mc* against the bundled schema and with talosctl (semantic)
 
     exit 1 when there is a validation error
     """
-    # tmpdir is required because talosctl validate needs a file which contains the mc
-    with tempfile.TemporaryDirectory("talos-validate") as td:
-        tmp_dir = Path(td)
-        mc_file = tmp_dir / "mc.json"
-        with open(mc_file, "wb") as fmc:
-            fmc.write(mc)
+    result = _run_validate_mc(mc, mode, cache, semantic)
+    if result.returncode:
+        raise TyperAbort(result.stderr, additional_error_msg)
 
-        Command.check_output(
-            cmd=["talosctl", "validate", f"--mode={mode}", "-c", mc_file],
-            additional_error_msg="Machine config is not valid."
-        )
 
+def _validate_patch_chain(patch_files: List[Path], patched_mc: Callable[[int], bytes], cache=False):
+    """validate the final mc of a patch chain; *patched_mc(n)* returns the mc after the first n patches
+
+    when the final mc is invalid, bisect the patch chain to find the first patch which makes the mc invalid
+    exit 1 when there is a validation error
+    """
+    results = {len(patch_files): _run_validate_mc(patched_mc(len(patch_files)), cache=cache)}
+    if not results[len(patch_files)].returncode:
+        return
+    if not patch_files:
+        raise TyperAbort(results[0].stderr, "Machine config is not valid.")
+
+    # a schema error is found with the schema check alone => no talosctl calls while bisecting
+    semantic = results[len(patch_files)].args != ["mc-schema"]
+    low, high = 1, len(patch_files)
+    while low < high:
+        mid = (low + high) // 2
+        results[mid] = _run_validate_mc(patched_mc(mid), cache=cache, semantic=semantic)
+        if results[mid].returncode:
+            high = mid
+        else:
+            low = mid + 1
+
+    invalid_patch = patch_files[low - 1].relative_to(REPO_ROOT)
+    raise TyperAbort(results[low].stderr, f"Machine config is not valid after the patch '{invalid_patch}'.")
+
+
+def _apply_patch(mc: bytes, patch_file: Path) -> bytes:
+    """apply a single patch file (in-process if the jq python binding is installed, otherwise via the jq cli)"""
+    patched_mc = patch_json_in_process(mc, [patch_file], JQ_MODULES_DIR)
+    return patched_mc if patched_mc is not None else patch_json(mc, patch_file, JQ_MODULES_DIR)
+
+
+def _patch_steps(mc: bytes, patch_files: List[Path], cache: bool, on_step: Callable[[int, bytes], None] = None):
+    """apply the *patch_files* one after another; return the mc before the first patch and after each patch
+
+    cache: only re-evaluate the patches which changed or depend on a changed patch (see '_patch_graph')
+    on_step(n, mc): called with the mc after the n-th patch
+    """
+    if cache:
+        return patch_graph.evaluate(mc, patch_files, JQ_MODULES_DIR, _apply_patch, on_step)
+
+    patched_mcs = [mc]
+    for n, patch_file in enumerate(patch_files, start=1):
+        patched_mcs.append(_apply_patch(patched_mcs[-1], patch_file))
+        if on_step is not None:
+            on_step(n, patched_mcs[-1])
+    return patched_mcs
+
+
+def _patch(mc: bytes, patch_files: List[Path], fused: bool, cache: bool):
+    """apply the *patch_files* to the *mc* (fused: as a single jq program)
+
+    The patches are applied in-process if the jq python binding is installed, otherwise via the jq cli.
+    cache: reuse the results of the mc cache and store the new results
+        (not fused: only the patches which changed or depend on a changed patch are re-evaluated)
+    """
+    if cache and not fused:
+        return _patch_steps(mc, patch_files, cache)[-1]
+
+    key = mc_cache.patch_key(mc, patch_files, JQ_MODULES_DIR) if cache else None
+    if cache and (cached_mc := mc_cache.load_patched(key)) is not None:
+        return cached_mc
+
+    # in-process: the mc is only parsed + dumped once
+    patched_mc = patch_json_in_process(mc, patch_files, JQ_MODULES_DIR, fused)
+    if patched_mc is None and fused:
+        patched_mc = patch_json_fused(mc, patch_files, JQ_MODULES_DIR)
+    elif patched_mc is None:
+        patched_mc = _patch_steps(mc, patch_files, cache=False)[-1]
+    if cache:
+        mc_cache.store_patched(key, patched_mc)
+    return patched_mc
+
+
+def patch_mc(
+    mc: bytes,
+    patch_files: Iterable[Path],
+    validation=True,
+    verbose=False,
+    fused=False,
+    deferred_validation=False,
+    cache=False
+):
+    """patches mc with all local jq patch files and validates it for each patch
+
+    the mc is validated against the bundled schema after each patch and with talosctl after the last patch
+
+    fused: apply all patches in a single jq run, the mc is only validated after the last patch
+    deferred_validation: only validate the mc after the last patch;
+        bisect the patches to find the patch which made the mc invalid
+    cache: reuse patched mcs and validation results from previous runs (see '_mc_cache')
+    """
+    patch_files = list(patch_files)
+
+    if validation and not (fused or deferred_validation):
+        def check_patched_mc(n: int, patched_mc: bytes):
+            patch = patch_files[n - 1].relative_to(REPO_ROOT)
+            print_if(f"   patch: {patch}", verbose)
+            # check the mc after each patch against the schema, talosctl only validates the final mc
+            validate_mc(
+                patched_mc,
+                additional_error_msg=f"Machine config is not valid after the patch '{patch}'.",
+                semantic=False
+            )
+
+        patched_mcs = _patch_steps(mc, patch_files, cache, check_patched_mc)
+        _validate_patch_chain(patch_files, lambda n: patched_mcs[n], cache=cache)
+        return patched_mcs[-1].rstrip()
 
-def patch_mc(mc: bytes, patch_files: Iterable[Path], validation=True, verbose=False):
-    """patches mc with all local jq patch files and validates it for each patch"""
     for patch in patch_files:
         print_if(f"   patch: {patch.relative_to(REPO_ROOT)}", verbose)
-        mc = patch_json(mc, patch, JQ_MODULES_DIR)
-        # validate the mc after each patch
-        if validation:
-            validate_mc(mc)
-
+    input_mc = mc
+    mc = _patch(input_mc, patch_files, fused, cache)
+    if validation:
+        _validate_patch_chain(
+            patch_files,
+            lambda n: mc if n == len(patch_files) else _patch(input_mc, patch_files[:n], fused, cache),
+            cache=cache
+        )
     return mc.rstrip()
 
 
@@ -396,56 +916,93 @@ def _patch_mc_with_custom_ca(mc_dict: dict, years_valid: int, issuer: str):
     mc_dict["machine"]["ca"]["key"] = b64_talos_key_str
 
 
-def _generate_talosconfig(context_name: str, ca_b64: str, ca_key_b64: str):
-    client_cert_hours_valid = 10 * 365 * 24
-    with tempfile.TemporaryDirectory() as td:
-        # copy ca, key, in dir
-        tmp_dir = Path(td)
-        ca_file = tmp_dir / "talos.crt"
-        with open(ca_file, "wb") as f:
-            f.write(base64.b64decode(ca_b64))
-        key_file = tmp_dir / "talos.key"
-        with open(key_file, "wb") as f:
-            f.write(base64.b64decode(ca_key_b64))
-
-        sp.check_output(["talosctl", "gen", "key", "--name=client"], cwd=tmp_dir)
-        sp.check_output(
-            ["talosctl", "gen", "csr", "--key=client.key", "--ip", "127.0.0.1"],
-            cwd=tmp_dir,
-        )
-        sp.check_output(
-            [
-                "talosctl",
-                "gen",
-                "crt",
-                "--ca",
-                "talos",
-                "--csr=client.csr",
-                "--name",
-                "client",
-                "--hours",
-                str(client_cert_hours_valid),
-            ],
-            cwd=tmp_dir,
-        )
-        talosconfig_file = tmp_dir / "talosconfig"
-        sp.check_output(
-            [
-                "talosctl",
-                "--talosconfig",
-                talosconfig_file,
-                "config",
-                "add",
-                "--ca",
-                ca_file,
-                "--key",
-                "client.key",
-                "--crt",
-                "client.crt",
-                context_name,
-            ],
-            cwd=tmp_dir,
+def _load_talos_key(key_pem: bytes):
+    """load a private key of talos (ed25519 keys have the pem type 'ED25519 PRIVATE KEY' with a pkcs8 body)"""
+    key_pem = key_pem.replace(_TALOS_ED25519_KEY_PEM_TYPE, b"PRIVATE KEY")
+    return serialization.load_pem_private_key(key_pem, password=None)
+
+
+def _generate_client_cert(ca_pem: bytes, ca_key_pem: bytes, hours_valid: int) -> Tuple[bytes, bytes]:
+    """generate an admin client key and cert signed by the talos CA like 'talosctl gen key / csr / crt'
+
+    Return: cert (pem), key (pem)
+    """
+    ca_cert = x509.load_pem_x509_certificate(ca_pem)
+    ca_key = _load_talos_key(ca_key_pem)
+    client_key = ed25519.Ed25519PrivateKey.generate()
+    now = datetime.datetime.now(datetime.timezone.utc)
+    builder = x509.CertificateBuilder().subject_name(
+        x509.Name([x509.NameAttribute(NameOID.ORGANIZATION_NAME, _TALOS_CLIENT_ROLE)])
+    ).issuer_name(
+        ca_cert.subject
+    ).public_key(
+        client_key.public_key()
+    ).serial_number(
+        x509.random_serial_number()
+    ).not_valid_before(
+        now
+    ).not_valid_after(
+        now + datetime.timedelta(hours=hours_valid)
+    ).add_extension(
+        x509.KeyUsage(
+            digital_signature=True,
+            content_commitment=False,
+            key_encipherment=False,
+            data_encipherment=False,
+            key_agreement=False,
+            key_cert_sign=False,
+            crl_sign=False,
+            encipher_only=False,
+            decipher_only=False,
+        ),
+        critical=True,
+    ).add_extension(
+        x509.ExtendedKeyUsage([ExtendedKeyUsageOID.SERVER_AUTH, ExtendedKeyUsageOID.CLIENT_AUTH]),
+        critical=False
+    ).add_extension(
+        x509.SubjectAlternativeName([x509.IPAddress(ipaddress.ip_address("127.0.0.1"))]),
+        critical=False
+    )
+    try:
+        builder = builder.add_extension(
+            x509.AuthorityKeyIdentifier.from_issuer_subject_key_identifier(
+                ca_cert.extensions.get_extension_for_class(x509.SubjectKeyIdentifier).value
+            ),
+            critical=False
         )
-        config_context_set(context_name, talosconfig=talosconfig_file)
-        with open(talosconfig_file, "rb") as file:
-            return file.read()
+    except x509.ExtensionNotFound:
+        pass
+    # ed25519 keys sign without a separate hash
+    hash_algorithm = None if isinstance(ca_key, (ed25519.Ed25519PrivateKey, ed448.Ed448PrivateKey)) else hashes.SHA256()
+    client_cert = builder.sign(ca_key, hash_algorithm)
+
+    client_key_pem = client_key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption(),
+    ).replace(b"PRIVATE KEY", _TALOS_ED25519_KEY_PEM_TYPE)
+    return client_cert.public_bytes(serialization.Encoding.PEM), client_key_pem
+
+
+def _generate_talosconfig(context_name: str, ca_b64: str, ca_key_b64: str) -> bytes:
+    """generate a talosconfig with an admin client cert (like talosctl: gen key, gen csr, gen crt, config add)"""
+    client_cert_hours_valid = 10 * 365 * 24
+    ca_pem = base64.b64decode(ca_b64)
+    try:
+        client_cert, client_key = _generate_client_cert(ca_pem, base64.b64decode(ca_key_b64), client_cert_hours_valid)
+    except (ValueError, TypeError) as exc:
+        raise TyperAbort(str(exc), "Can't generate the talosconfig with the talos CA.")
+
+    # the same layout as talosctl (yaml with 4 spaces indentation, no line wrapping)
+    talosconfig = {
+        "context": context_name,
+        "contexts": {
+            context_name: {
+                "endpoints": [],
+                "ca": base64.b64encode(ca_pem).decode(),
+                "crt": base64.b64encode(client_cert).decode(),
+                "key": base64.b64encode(client_key).decode(),
+            }
+        },
+    }
+    return yaml.safe_dump(talosconfig, indent=4, sort_keys=False, width=float("inf")).encode()
@@ -0,0 +1,59 @@
+"""YAML 1.2 loader
+
+pyyaml implements YAML 1.1: 'on' / 'yes' / 'no' are bools, '1:30' is 90 (base 60), '0o600' is a string and
+timestamps are dates. Talos reads its configs and resources with go-yaml v3 (YAML 1.2 core schema), so the yaml of
+the machines (resource specs) and of the repo (declarative patches) is loaded like talos reads it.
+"""
+
+import re
+from typing import Any, Dict
+
+import yaml
+
+try:
+    _BaseLoader = yaml.CSafeLoader
+except AttributeError:  # pyyaml without libyaml
+    _BaseLoader = yaml.SafeLoader
+
+
+class Yaml12Loader(_BaseLoader):
+    """safe yaml loader which resolves the plain scalars like talos (go-yaml v3, yaml 1.2)
+
+    e.g. 'permissions: 0o600' => 384 (yaml 1.1: a string), 'on' / 'yes', '1:30' and timestamps are strings
+    """
+
+    yaml_implicit_resolvers: Dict = {}
+
+    def construct_yaml_int(self, node) -> int:
+        value = self.construct_scalar(node).replace("_", "")
+        sign, digits = -1 if value.startswith("-") else 1, value.lstrip("+-")
+        if digits[:2] in ("0b", "0o", "0x"):
+            return sign * int(digits, 0)
+        return sign * int(digits, 8 if len(digits) > 1 and digits[0] == "0" else 10)  # go: leading 0 => octal
+
+
+Yaml12Loader.add_implicit_resolver(
+    "tag:yaml.org,2002:bool", re.compile(r"^(?:true|True|TRUE|false|False|FALSE)$"), list("tTfF")
+)
+Yaml12Loader.add_implicit_resolver(
+    "tag:yaml.org,2002:int",
+    re.compile(r"^[-+]?(?:0b[01_]+|0o[0-7_]+|0x[0-9a-fA-F_]+|0[0-7_]*|[1-9][0-9_]*)$"),
+    list("-+0123456789"),
+)
+Yaml12Loader.add_implicit_resolver(
+    "tag:yaml.org,2002:float",
+    re.compile(
+        r"^(?:[-+]?(?:\.[0-9]+|[0-9]+(?:\.[0-9]*)?)(?:[eE][-+]?[0-9]+)?|[-+]?\.(?:inf|Inf|INF)|\.(?:nan|NaN|NAN))$"
+    ),
+    list("-+.0123456789"),
+)
+Yaml12Loader.add_implicit_resolver(
+    "tag:yaml.org,2002:null", re.compile(r"^(?:~|null|Null|NULL|)$"), ["~", "n", "N", ""]
+)
+Yaml12Loader.add_implicit_resolver("tag:yaml.org,2002:merge", re.compile(r"^(?:<<)$"), ["<"])
+Yaml12Loader.add_constructor("tag:yaml.org,2002:int", Yaml12Loader.construct_yaml_int)
+
+
+def load(stream: Any) -> Any:
+    """load a yaml document (text or file) like talos (yaml 1.2)"""
+    return yaml.load(stream, Loader=Yaml12Loader)
@@ -15,6 +15,7 @@ from .._utils._constants import (DEP_GPG, DEP_JQ, DEP_TALOSCTL,
                                  TALOS_CONFIG_PROJECT)
 from .._utils._installer_spec_config import load_repo_installer_image_ref
 from . import _talos_config as talos_config
+from ._wait import wait_until_ready
 
 
 def _update_talosconfig(ip: str, talosconfig: bytes):
@@ -45,9 +46,14 @@ def bootstrap(
     dry_run: bool,
     force: bool,
     verbose: bool,
+    fused: bool,
+    deferred_validation: bool,
+    wait: bool = False,
 ):
 
     check.ip(machine_ip)
+    if wait and not out_talosconfig and not dry_run:
+        raise TyperAbort("Waiting for the machine requires the talosconfig", "Use the '--out-talosconfig' option")
     patch_files = common.glob_files(REPO_ROOT, *PATCH_LOCATIONS)
 
     installer_image = load_repo_installer_image_ref(required_extensions=TALOS_INSTALLED_EXTENSIONS)
@@ -68,7 +74,9 @@ def bootstrap(
         )
 
     common.print_if("Create an initial machine config with patches ...", verbose)
-    initial_mc = talosctl.patch_mc(initial_mc, patch_files, verbose=verbose)
+    initial_mc = talosctl.patch_mc(
+        initial_mc, patch_files, verbose=verbose, fused=fused, deferred_validation=deferred_validation
+    )
 
     if out_talosconfig:
         updated_talosconfig = _update_talosconfig(machine_ip, talosconfig)
@@ -100,3 +108,7 @@ def bootstrap(
     # patch the project talosconfig inplace
     with common.patch_yaml_file(file_path=TALOS_CONFIG_PROJECT) as config:
         config["contexts"][BOX_NAME]["ca"] = root_ca
+
+    if wait:
+        print(f"Wait until the machine ({machine_ip}) is ready ...")
+        wait_until_ready(tail_events=-1, verbose=verbose, talosconfig=Path(out_talosconfig).resolve())
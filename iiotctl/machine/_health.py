@@ -0,0 +1,158 @@
+import json
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from rich import print
+from rich.table import Table
+
+from .._utils import _check as check
+from .._utils import _common as common
+from .._utils import _kubectl as kubectl
+from .._utils import _talosctl as talosctl
+from .._utils import _teleport as teleport
+from .._utils._common import TyperAbort
+from .._utils._config import BOX_NAME, TELEPORT_PROXY_URL
+from .._utils._constants import (DEP_KUBECTL, DEP_TALOSCTL, DEP_TSH,
+                                 K8S_CONFIG_USER, TALOS_CONFIG_PROJECT)
+
+# namespaces of the system apps (their pods must be ready)
+SYSTEM_APPS = ("argocd", "traefik", "openebs", "sealed-secrets", "monitoring", "teleport-configurator")
+
+# timeout of the probes (the k8s probes go through the teleport proxy)
+TALOS_PROBE_TIMEOUT_SEC = 15.0
+ETCD_PROBE_TIMEOUT_SEC = 20.0
+K8S_PROBE_TIMEOUT_SEC = 30.0
+
+# check, healthy, details
+HealthRow = Tuple[str, bool, str]
+Probe = Callable[[], List[HealthRow]]
+
+
+def _talos_services(**config_args) -> List[HealthRow]:
+    rows = []
+    for service in talosctl.get(resource="services", **config_args):
+        spec = service["spec"]
+        healthy = spec.get("running", False) and (spec.get("healthy", False) or spec.get("unknown", False))
+        state = "running" if spec.get("running") else "not running"
+        health = "health unknown" if spec.get("unknown") else "healthy" if spec.get("healthy") else "unhealthy"
+        rows.append((f"talos service {service['metadata']['id']}", healthy, f"{state}, {health}"))
+    return rows
+
+
+def _etcd(**config_args) -> List[HealthRow]:
+    members = talosctl.etcd_members(**config_args)
+    statuses = talosctl.etcd_status(**config_args)
+    errors = [status["ERRORS"] for status in statuses if status.get("ERRORS")]
+    learners = [member.get("HOSTNAME", member.get("ID", "")) for member in members if member.get("LEARNER") == "true"]
+    healthy = bool(members) and bool(statuses) and not errors and not learners
+    details = [f"{len(members)} member(s)"]
+    details += [f"db size {status['DB SIZE']}" for status in statuses if "DB SIZE" in status]
+    details += [f"learner: {learner}" for learner in learners] + errors
+    return [("etcd", healthy, ", ".join(details))]
+
+
+def _k8s_nodes() -> List[HealthRow]:
+    nodes = json.loads(kubectl.fetch(resource="nodes", format="json", kubeconfig=K8S_CONFIG_USER))["items"]
+    rows = []
+    for node in nodes:
+        ready = next((c for c in node["status"].get("conditions", []) if c["type"] == "Ready"), {})
+        kubelet_version = node["status"].get("nodeInfo", {}).get("kubeletVersion", "")
+        details = f"kubelet {kubelet_version}, {ready.get('reason', 'no Ready condition')}"
+        rows.append((f"k8s node {node['metadata']['name']}", ready.get("status") == "True", details))
+    return rows or [("k8s nodes", False, "no nodes")]
+
+
+def _pod_ready(pod: Dict) -> bool:
+    status = pod.get("status", {})
+    if status.get("phase") == "Succeeded":  # e.g. a finished job
+        return True
+    return status.get("phase") == "Running" and all(c.get("ready") for c in status.get("containerStatuses", []))
+
+
+def _app_pods(app: str) -> List[HealthRow]:
+    pods = json.loads(
+        kubectl.fetch(resource="pods", format="json", kubeconfig=K8S_CONFIG_USER, namespace=app)
+    )["items"]
+    not_ready = [pod["metadata"]["name"] for pod in pods if not _pod_ready(pod)]
+    details = f"{len(pods) - len(not_ready)}/{len(pods)} pods ready"
+    if not_ready:
+        details += f", not ready: {', '.join(not_ready)}"
+    return [(f"app {app}", bool(pods) and not not_ready, details if pods else "no pods")]
+
+
+def _run_probes(probes: Dict[str, Tuple[Probe, float]]) -> List[Tuple[HealthRow, float]]:
+    """run all probes at once, each with its own timeout; return the rows with the duration of their probe
+
+    a probe which fails or times out results in an unhealthy row
+    """
+    results: Dict[str, Tuple[List[HealthRow], float]] = {}
+    start = time.monotonic()
+
+    def run(name: str, probe: Probe):
+        try:
+            rows = probe()
+        except Exception as exc:  # e.g. TyperAbort of a failed talosctl / kubectl call (the error is printed)
+            rows = [(name, False, str(exc) or "failed")]
+        results[name] = rows, time.monotonic() - start
+
+    # daemon threads => a probe which hangs after its timeout doesn't block the exit
+    threads = {
+        name: threading.Thread(target=run, args=(name, probe), daemon=True) for name, (probe, _) in probes.items()
+    }
+    for thread in threads.values():
+        thread.start()
+
+    rows = []
+    for name, (_, timeout) in probes.items():
+        threads[name].join(max(start + timeout - time.monotonic(), 0))
+        if name in results:
+            probe_rows, duration = results[name]
+        else:
+            probe_rows, duration = [(name, False, f"timeout after {timeout:.0f}s")], timeout
+        rows += [(row, duration) for row in probe_rows]
+    return rows
+
+
+def _print_health_table(rows: List[Tuple[HealthRow, float]]):
+    table = Table(title="Health", show_lines=True)
+    table.add_column("Healthy", justify="center")
+    table.add_column("Check")
+    table.add_column("Details")
+    table.add_column("Time", justify="right")
+    for (name, healthy, details), duration in rows:
+        table.add_row(":white_heavy_check_mark:" if healthy else ":x:", name, details, f"{duration:.1f}s")
+    print(table)
+
+
+@check.dependency(*DEP_KUBECTL)
+@check.dependency(*DEP_TALOSCTL)
+@check.dependency(*DEP_TSH)
+def health(use_current_context: bool, timeout: Optional[float]):
+    common.print_if(
+        "Ensure that 'iiotctl connect talos' is running\n", not use_current_context
+    )
+    config_args = (
+        {} if use_current_context else {"talosconfig": TALOS_CONFIG_PROJECT.resolve()}
+    )
+    if not use_current_context:
+        teleport.login(TELEPORT_PROXY_URL)
+        teleport.login_k8s(BOX_NAME)
+
+    probes: Dict[str, Tuple[Probe, float]] = {
+        "talos services": (lambda: _talos_services(**config_args), timeout or TALOS_PROBE_TIMEOUT_SEC),
+        "etcd": (lambda: _etcd(**config_args), timeout or ETCD_PROBE_TIMEOUT_SEC),
+        "k8s nodes": (_k8s_nodes, timeout or K8S_PROBE_TIMEOUT_SEC),
+    }
+    for app in SYSTEM_APPS:
+        probes[f"app {app}"] = ((lambda app=app: _app_pods(app)), timeout or K8S_PROBE_TIMEOUT_SEC)
+
+    start = time.monotonic()
+    rows = _run_probes(probes)
+    print()
+    _print_health_table(rows)
+
+    unhealthy = [name for (name, healthy, _), _ in rows if not healthy]
+    if unhealthy:
+        raise TyperAbort(f"{len(unhealthy)} of {len(rows)} health checks failed ({time.monotonic() - start:.1f}s).")
+    print(f"All {len(rows)} health checks passed ({time.monotonic() - start:.1f}s).")
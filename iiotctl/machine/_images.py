@@ -0,0 +1,142 @@
+import json
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from rich import print
+from rich.table import Table
+
+from .._utils import _check as check
+from .._utils import _common as common
+from .._utils import _oci as oci
+from .._utils import _talosctl as talosctl
+from .._utils._argo_images import argo_app_images, argo_manifest_images
+from .._utils._common import TyperAbort
+from .._utils._config import TALOS_INSTALLED_EXTENSIONS, TALOS_VERSION
+from .._utils._constants import (DEFAULT_MACHINE_CONFIG_ID, DEP_TALOSCTL,
+                                 TALOS_CONFIG_PROJECT)
+from .._utils._installer_spec_config import load_repo_installer_image_ref
+from ._prepull import prepull_images, run_image_jobs
+
+ADDITIONAL_ENDPOINTS_FILE = "machine/config/registry-endpoints/additional-endpoints.jq"
+
+
+def _mb(size: int) -> str:
+    return f"{size / 1e6:.1f} MB"
+
+
+def upgrade_images() -> List[str]:
+    """get the images of the repo: talos defaults (k8s, etcd, ...), the installer and the images of the argo apps"""
+    default_images = talosctl.image_default().splitlines()
+    default_images.remove(f"ghcr.io/siderolabs/installer:v{TALOS_VERSION}")  # replaced by the one with extensions
+    image_refs = [load_repo_installer_image_ref(TALOS_INSTALLED_EXTENSIONS), *default_images, *argo_manifest_images()]
+    return list(dict.fromkeys(oci.normalize_image_ref(image_ref) for image_ref in image_refs))
+
+
+@check.dependency(*DEP_TALOSCTL)
+def export_images(archive: Path, platform: str, workers: int, insecure_registries: List[str]):
+    image_refs = upgrade_images()
+    print(f"Export {len(image_refs)} images ({platform}) into '{archive}' ...\n")
+
+    with oci.RegistryClient(insecure_registries) as client, oci.ArchiveWriter(archive) as writer:
+
+        def export(image_ref: str) -> Tuple[Optional[str], str]:
+            try:
+                downloaded = writer.add_image(client, image_ref, platform)
+            except oci.OciError as exc:
+                return str(exc), ""
+            return None, f"({_mb(downloaded)})" if downloaded else "(all layers are shared)"
+
+        failed = run_image_jobs(image_refs, workers, export, "Export image")
+        if failed:  # in the context => the archive isn't written
+            raise TyperAbort(
+                *[f"{image_ref}: {error}" for image_ref, error in failed],
+                f"{len(failed)} of {len(image_refs)} images can't be exported."
+            )
+    print(
+        f"\nExported {len(image_refs)} images into '{archive}': {_mb(writer.size)}",
+        f"(shared blobs saved {_mb(writer.shared_bytes)})"
+    )
+
+
+@check.dependency(*DEP_TALOSCTL)
+def prepull_app_images(apps: List[str], workers: int, use_current_context: bool):
+    common.print_if(
+        "Ensure that 'iiotctl connect talos' is running\n", not use_current_context
+    )
+    config_args = (
+        {} if use_current_context else {"talosconfig": TALOS_CONFIG_PROJECT.resolve()}
+    )
+    app_images = {app: images for app, images in argo_app_images(apps).items() if images}
+    if not app_images:
+        raise TyperAbort(f"There aren't any images in the argo manifests of the apps: {', '.join(apps)}")
+
+    table = Table(title="Images of the argo apps", show_lines=True)
+    table.add_column("APP")
+    table.add_column("IMAGES")
+    for app, images in app_images.items():
+        table.add_row(app, "\n".join(images))
+    print(table)
+    print()
+
+    # the same image may be referenced differently by the apps (e.g. with / without 'docker.io/')
+    image_refs = {oci.normalize_image_ref(image): image for images in app_images.values() for image in images}
+    prepull_images(image_refs.values(), workers, **config_args)
+
+
+def _missing_mirrors(registries: List[str], endpoint: str, **config_args) -> List[str]:
+    """get the registries which the machine doesn't mirror via the *endpoint*"""
+    mc = json.loads(talosctl.fetch_mc(DEFAULT_MACHINE_CONFIG_ID, **config_args))
+    mirrors: Dict[str, Dict] = mc.get("machine", {}).get("registries", {}).get("mirrors") or {}
+    mirrored = {
+        oci.normalize_registry(registry) for registry, mirror in mirrors.items()
+        if any(url.rstrip("/").startswith(endpoint) for url in mirror.get("endpoints") or [])
+    }
+    return [registry for registry in registries if registry not in mirrored]
+
+
+def _print_mirror_patch(registries: List[str], endpoint: str):
+    mirrors = {registry: {"endpoints": [endpoint]} for registry in registries}
+    print(f"Add the mirrors (as first endpoints) to 'additional_endpoints' in '{ADDITIONAL_ENDPOINTS_FILE}':")
+    print(json.dumps(mirrors, indent=2))
+    print("and sync the machine config with 'iiotctl machine sync'. Remove them after the import.\n")
+
+
+@check.dependency(*DEP_TALOSCTL)
+def import_images(archive_path: Path, address: str, port: int, workers: int, use_current_context: bool):
+    common.print_if(
+        "Ensure that 'iiotctl connect talos' is running\n", not use_current_context
+    )
+    config_args = (
+        {} if use_current_context else {"talosconfig": TALOS_CONFIG_PROJECT.resolve()}
+    )
+    try:
+        archive = oci.Archive(archive_path)
+    except oci.OciError as exc:
+        raise TyperAbort(str(exc))
+    if not archive.images:
+        raise TyperAbort(f"There aren't any images in '{archive_path}'.")
+
+    endpoint = f"http://{address}:{port}"
+    registries = sorted({oci.ImageRef.parse(image_ref).registry for image_ref in archive.images})
+    if missing_mirrors := _missing_mirrors(registries, endpoint, **config_args):
+        _print_mirror_patch(missing_mirrors, endpoint)
+        raise TyperAbort(f"The machine doesn't pull the images of {', '.join(missing_mirrors)} via {endpoint}.")
+
+    # talos runs the installer in the system namespace, all other images are used by k8s
+    installer = oci.normalize_image_ref(load_repo_installer_image_ref(TALOS_INSTALLED_EXTENSIONS))
+    cri_images = [image_ref for image_ref in archive.images if image_ref != installer]
+    try:
+        registry = oci.ArchiveRegistry(archive, port)
+    except OSError as exc:
+        raise TyperAbort(str(exc), f"Can't serve the archive at port {port}.")
+    with registry:
+        print(f"Serve '{archive_path}' at {endpoint} ...\n")
+        prepull_images(cri_images, workers, **config_args)
+        if installer in archive.images:
+            prepull_images([installer], namespace="system", **config_args)
+
+    shared = sum(count > 1 for count in registry.sent_blobs.values())
+    print(
+        f"\nImported {len(archive.images)} images: sent {_mb(registry.sent_bytes)} in {len(registry.sent_blobs)} blobs",
+        f"({shared} blobs were requested more than once)" if shared else ""
+    )
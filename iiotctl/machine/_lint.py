@@ -0,0 +1,54 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from rich import print
+
+from .._utils import _check as check
+from .._utils import _common as common
+from .._utils import _declarative_patch as declarative_patch
+from .._utils._common import TyperAbort
+from .._utils._constants import DEP_JQ, JQ_MODULES_DIR, PATCH_LOCATIONS, REPO_ROOT
+from .._utils._jq import compile_errors
+
+
+def _lint_patch(patch_file: Path) -> List[Tuple[Path, Optional[int], str]]:
+    """compile a single patch; return the errors (file, line number, message)"""
+    if declarative_patch.is_declarative(patch_file):
+        return [(patch_file, line, msg) for line, msg in declarative_patch.lint(patch_file)]
+    return compile_errors(patch_file, JQ_MODULES_DIR)
+
+
+def _location(file: Path, line: Optional[int]) -> str:
+    file = Path(file).resolve()
+    location = str(file.relative_to(REPO_ROOT)) if file.is_relative_to(REPO_ROOT) else str(file)
+    return f"{location}:{line}" if line else location
+
+
+@check.dependency(*DEP_JQ)
+def lint_patches(patch_file_pattern: List[str]):
+    """compile all patches (and their modules) in parallel; print the errors with file and line number
+
+    exit 1 when a patch has errors
+    """
+    start = time.perf_counter()
+    patch_files = common.glob_files(REPO_ROOT, *(patch_file_pattern or PATCH_LOCATIONS))
+    if not patch_files:
+        raise TyperAbort("No patch files found.")
+
+    with ThreadPoolExecutor(max_workers=len(patch_files)) as executor:
+        results = list(executor.map(_lint_patch, patch_files))
+
+    errors = []
+    for error in (error for result in results for error in result):
+        if error not in errors:  # errors in a module are reported by every patch which imports it
+            errors.append(error)
+    for file, line, msg in errors:
+        common.print_error(f"{_location(file, line)}: {msg}")
+
+    duration = time.perf_counter() - start
+    if errors:
+        failed = sum(bool(result) for result in results)
+        raise TyperAbort(f"{len(errors)} error(s) in {failed} of {len(patch_files)} patches ({duration:.2f}s).")
+    print(f"All {len(patch_files)} patches compile ({duration:.2f}s).")
@@ -0,0 +1,192 @@
+import datetime
+import heapq
+import json
+import queue
+import re
+import threading
+from collections import deque
+from typing import Iterable, Iterator, List, Optional, Pattern, Tuple
+
+import typer
+
+from .._utils import _check as check
+from .._utils import _common as common
+from .._utils import _talosctl as talosctl
+from .._utils._common import TyperAbort
+from .._utils._constants import DEP_TALOSCTL, TALOS_CONFIG_PROJECT
+
+DMESG = "dmesg"
+
+LogLine = Tuple[datetime.datetime, str, str]  # timestamp, source, line
+
+_UTC = datetime.timezone.utc
+_NO_TIMESTAMP = datetime.datetime.min.replace(tzinfo=_UTC)
+# '2024-08-20T06:19:04.123Z' (etcd, containerd, dmesg), '2024/08/20 06:19:04' (go log), 'I0820 06:19:04.123456' (klog)
+_ISO_TIMESTAMP = re.compile(r'(\d{4}-\d{2}-\d{2})[T ](\d{2}:\d{2}:\d{2})(\.\d+)?(Z|[+-]\d{2}:?\d{2})?')
+_GO_TIMESTAMP = re.compile(r'(\d{4})/(\d{2})/(\d{2}) (\d{2}:\d{2}:\d{2})(\.\d+)?')
+_KLOG_TIMESTAMP = re.compile(r'\b[IWEF](\d{2})(\d{2}) (\d{2}:\d{2}:\d{2})(\.\d+)?')
+# json lines, e.g. '{"ts":1724134744123.4,...}' (kubelet: epoch milliseconds) or '{"time":"2024-08-20T06:19:04Z",...}'
+_JSON_TIME_FIELDS = ("ts", "time", "timestamp")
+_EPOCH_MILLIS = 10 ** 11  # larger epoch values are milliseconds (10 ** 11 seconds => the year 5138)
+_JSON_DECODER = json.JSONDecoder()
+_DURATION = re.compile(r'(\d+)([smhd])')
+_DURATION_UNITS = {"s": "seconds", "m": "minutes", "h": "hours", "d": "days"}
+
+
+def _fraction(fraction: Optional[str]) -> str:
+    return (fraction or "")[:7]  # python supports microseconds
+
+
+def _json_timestamp(line: str) -> Optional[datetime.datetime]:
+    """get the timestamp of a json log *line* (the line may have a prefix, e.g. the node)"""
+    if (start := line.find("{")) < 0:
+        return None
+    try:
+        entry, _ = _JSON_DECODER.raw_decode(line, start)
+    except ValueError:
+        return None
+    if not isinstance(entry, dict):
+        return None
+    for field in _JSON_TIME_FIELDS:
+        value = entry.get(field)
+        if isinstance(value, str):
+            return _text_timestamp(value)
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            try:
+                return datetime.datetime.fromtimestamp(value / 1000 if value > _EPOCH_MILLIS else value, _UTC)
+            except (ValueError, OverflowError, OSError):
+                return None
+    return None
+
+
+def _text_timestamp(line: str) -> Optional[datetime.datetime]:
+    """get the first timestamp in the text of a log *line* (iso, go log or klog format)"""
+    try:
+        if match := _ISO_TIMESTAMP.search(line):
+            date, time, fraction, zone = match.groups()
+            timestamp = datetime.datetime.fromisoformat(f"{date}T{time}{_fraction(fraction)}{zone or ''}")
+        elif match := _GO_TIMESTAMP.search(line):
+            year, month, day, time, fraction = match.groups()
+            timestamp = datetime.datetime.fromisoformat(f"{year}-{month}-{day}T{time}{_fraction(fraction)}")
+        elif match := _KLOG_TIMESTAMP.search(line):  # without year
+            month, day, time, fraction = match.groups()
+            year = datetime.datetime.now(_UTC).year
+            timestamp = datetime.datetime.fromisoformat(f"{year}-{month}-{day}T{time}{_fraction(fraction)}")
+        else:
+            return None
+    except ValueError:
+        return None
+    return timestamp if timestamp.tzinfo else timestamp.replace(tzinfo=_UTC)
+
+
+def _log_timestamp(line: str) -> Optional[datetime.datetime]:
+    """get the timestamp of a log *line* (utc if the line has no timezone); None => the line has no timestamp
+
+    the time field of a json line wins over the timestamps in its message
+    """
+    return _json_timestamp(line) or _text_timestamp(line)
+
+
+def _parse_since(since: str) -> datetime.datetime:
+    """parse a duration ('90s', '15m', '2h', '1d', '1h30m') or a timestamp into the point in time
+
+    exit 1 if *since* can't be parsed
+    """
+    if re.fullmatch(r'(?:\d+[smhd])+', since):
+        delta = datetime.timedelta()
+        for value, unit in _DURATION.findall(since):
+            delta += datetime.timedelta(**{_DURATION_UNITS[unit]: int(value)})
+        return datetime.datetime.now(_UTC) - delta
+    if (timestamp := _log_timestamp(since)) is None:
+        raise TyperAbort(f"Invalid '--since' value: {since}", "Use a duration (e.g. '15m', '2h') or a timestamp")
+    return timestamp
+
+
+def _source_lines(source: str, tail: Optional[int], follow: bool, **config_args) -> Iterator[str]:
+    """stream the lines of a talos service or of the kernel messages"""
+    if source != DMESG:
+        yield from talosctl.logs(source, -1 if tail is None else tail, follow, **config_args)
+    elif tail is None or follow:  # dmesg can't be tailed by the server => only without follow (on the client)
+        yield from talosctl.dmesg(follow, **config_args)
+    else:
+        yield from deque(talosctl.dmesg(False, **config_args), maxlen=tail)
+
+
+def _timestamped(source: str, lines: Iterable[str]) -> Iterator[LogLine]:
+    """add the timestamps to the lines; a line without timestamp (e.g. a stack trace) gets the one of its predecessor"""
+    timestamp = _NO_TIMESTAMP
+    for line in lines:
+        timestamp = _log_timestamp(line) or timestamp
+        yield timestamp, source, line
+
+
+def _filtered(
+    log_lines: Iterable[LogLine], since: Optional[datetime.datetime], pattern: Optional[Pattern]
+) -> Iterator[LogLine]:
+    for log_line in log_lines:
+        if since is not None and log_line[0] < since:
+            continue
+        if pattern is not None and not pattern.search(log_line[2]):
+            continue
+        yield log_line
+
+
+def _interleave_live(streams: List[Iterator[LogLine]]) -> Iterator[LogLine]:
+    """yield the lines of all (endless) streams in the order they arrive"""
+    arrived: queue.Queue = queue.Queue()
+
+    def pump(stream: Iterator[LogLine]):
+        try:
+            for log_line in stream:
+                arrived.put(log_line)
+        except BaseException as exc:  # e.g. TyperAbort => re-raised in the main thread
+            arrived.put(exc)
+        finally:
+            arrived.put(None)
+
+    for stream in streams:
+        threading.Thread(target=pump, args=(stream,), daemon=True).start()
+
+    running = len(streams)
+    while running:
+        item = arrived.get()
+        if item is None:
+            running -= 1
+        elif isinstance(item, BaseException):
+            raise item
+        else:
+            yield item
+
+
+@check.dependency(*DEP_TALOSCTL)
+def logs(
+    sources: List[str],
+    since: Optional[str],
+    grep: Optional[str],
+    tail: Optional[int],
+    follow: bool,
+    use_current_context: bool
+):
+    common.print_if(
+        "Ensure that 'iiotctl connect talos' is running\n", not use_current_context
+    )
+    config_args = (
+        {} if use_current_context else {"talosconfig": TALOS_CONFIG_PROJECT.resolve()}
+    )
+    since_time = _parse_since(since) if since else None
+    try:
+        pattern = re.compile(grep) if grep else None
+    except re.error as exc:
+        raise TyperAbort(f"Invalid '--grep' regex: {exc}")
+
+    # each source is a lazy pipeline: stream => timestamps => filters (the lines are never buffered)
+    streams = [
+        _filtered(_timestamped(source, _source_lines(source, tail, follow, **config_args)), since_time, pattern)
+        for source in dict.fromkeys(sources)
+    ]
+    # the lines of finished logs are merged by their timestamps, followed logs are shown as they arrive
+    log_lines = _interleave_live(streams) if follow else heapq.merge(*streams, key=lambda log_line: log_line[0])
+
+    width = max(len(source) for source in sources)
+    for _, source, line in log_lines:
+        typer.echo(f"{source:<{width}} | {line}")
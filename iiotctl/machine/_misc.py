@@ -1,3 +1,4 @@
+from concurrent.futures import Executor, Future
 from typing import Dict
 
 from rich import print
@@ -8,15 +9,34 @@ from .._utils import _talosctl as talosctl
 from .._utils._common import TyperAbort
 from .._utils._config import (K8S_VERSION, TALOS_INSTALLED_EXTENSIONS,
                               TALOS_VERSION)
-from .._utils._constants import (EXCLUDE_SYNC_PATCHES, PATCH_LOCATIONS,
+from .._utils._constants import (DEFAULT_MACHINE_CONFIG_ID,
+                                 EXCLUDE_SYNC_PATCHES, PATCH_LOCATIONS,
                                  REPO_ROOT)
 from .._utils._installer_spec_config import load_repo_extension_versions
 
 
-def print_live_talos_nodename(**config_arg):
-    """fetches nodename from live talos machine; prints it to STDOUT"""
+def get_live_talos_nodename(**config_arg) -> str:
+    """fetches nodename from live talos machine"""
     node_name_rsc = talosctl.get(resource="nodename", **config_arg)
-    node_name = node_name_rsc["spec"]["nodename"]
+    return node_name_rsc["spec"]["nodename"]
+
+
+def read_live_machine(executor: Executor, **config_arg) -> Dict[str, Future]:
+    """start all (independent) reads from the live talos machine at once
+
+    Return the futures of the reads by name: mc, talos_version, node_name, extensions
+    => the total wait is the slowest read, the local work can be done in between
+    """
+    return {
+        "mc": executor.submit(talosctl.fetch_mc, DEFAULT_MACHINE_CONFIG_ID, **config_arg),
+        "talos_version": executor.submit(talosctl.get_live_talos_version, **config_arg),
+        "node_name": executor.submit(get_live_talos_nodename, **config_arg),
+        "extensions": executor.submit(talosctl.get_live_talos_extension_versions, **config_arg),
+    }
+
+
+def print_live_talos_nodename(node_name: str):
+    """prints the nodename of the live talos machine to STDOUT"""
     print()
     print(f"Selected talos node: '{node_name}'")
     print()
@@ -84,7 +104,7 @@ def print_status_table(live_talos_vers: str, live_k8s_vers: str, mc_diffs: bool,
     print()
 
 
-def create_new_mc(live_mc: bytes, verbose: bool):
+def create_new_mc(live_mc: bytes, verbose: bool, fused=False, deferred_validation=False, cache=False):
     """create live mc from repo mc anda list of local patch files; return new mc"""
     exc_patch_files = common.glob_files(REPO_ROOT, *EXCLUDE_SYNC_PATCHES)
     patch_files = [f for f in common.glob_files(REPO_ROOT, *PATCH_LOCATIONS) if f not in exc_patch_files]
@@ -92,7 +112,9 @@ def create_new_mc(live_mc: bytes, verbose: bool):
     new_mc = live_mc
     common.print_if("", verbose)
     common.print_if("Create a patched version of the live machine config ...", verbose)
-    new_mc = talosctl.patch_mc(new_mc, patch_files, verbose=verbose)
+    new_mc = talosctl.patch_mc(
+        new_mc, patch_files, verbose=verbose, fused=fused, deferred_validation=deferred_validation, cache=cache
+    )
     return new_mc
 
 
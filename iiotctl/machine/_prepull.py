@@ -0,0 +1,82 @@
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, List, Optional, Tuple
+
+from rich import print
+from rich.progress import Progress, SpinnerColumn, TextColumn, TimeElapsedColumn
+
+from .._utils import _talosctl as talosctl
+from .._utils._common import TyperAbort
+from .._utils._oci import normalize_image_ref
+
+DEFAULT_WORKERS = 4
+MAX_ATTEMPTS = 4
+_BACKOFF_SEC = 2.0  # doubled after each failed attempt
+# pull errors which a retry can't fix
+_PERMANENT_ERRORS = re.compile(r'not ?found|unauthorized|denied|invalid reference', re.IGNORECASE)
+
+# image ref => error (None => done), details of the result
+ImageJob = Callable[[str], Tuple[Optional[str], str]]
+
+
+def run_image_jobs(image_refs: List[str], workers: int, job: ImageJob, action: str) -> List[Tuple[str, str]]:
+    """run the *job* of each image with up to *workers* jobs at once and show a progress line per image
+
+    return the failed images and their errors
+    """
+    failed: List[Tuple[str, str]] = []
+    columns = (SpinnerColumn(finished_text=""), TextColumn("{task.description}"), TimeElapsedColumn())
+    with Progress(*columns) as progress, ThreadPoolExecutor(max(workers, 1)) as executor:
+
+        def run(image_ref: str, task):
+            progress.start_task(task)
+            progress.update(task, description=f"{action}: '{image_ref}' ...")
+            try:
+                error, details = job(image_ref)
+            except Exception as exc:  # e.g. TyperAbort of an unexpected talosctl failure
+                error, details = str(exc) or type(exc).__name__, ""
+            details = f" {details}" if details else ""
+            if error is None:
+                progress.update(task, description=f":white_heavy_check_mark: '{image_ref}'{details}", completed=1)
+            else:
+                failed.append((image_ref, error))
+                progress.update(task, description=f":x: '{image_ref}'{details}", completed=1)
+
+        for image_ref in image_refs:
+            task = progress.add_task(f"Waiting: '{image_ref}'", total=1, start=False)
+            executor.submit(run, image_ref, task)
+    return failed
+
+
+def _pull(image_ref: str, namespace: str, **config_args) -> Tuple[Optional[str], str]:
+    """pull the image, transient failures are retried with an exponential backoff; return the error and the attempts"""
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        error = talosctl.image_pull(image_ref, exit_on_failure=False, namespace=namespace, **config_args)
+        if error is None or _PERMANENT_ERRORS.search(error) or attempt == MAX_ATTEMPTS:
+            return error, f"({attempt} attempts)" if attempt > 1 else ""
+        time.sleep(_BACKOFF_SEC * 2 ** (attempt - 1))
+    return None, ""
+
+
+def prepull_images(image_refs: Iterable[str], workers: int = DEFAULT_WORKERS, namespace="cri", **config_args):
+    """pull the images onto the machine with up to *workers* pulls at once; images on the machine are skipped
+
+    exit 1 if an image can't be pulled
+    """
+    image_refs = list(dict.fromkeys(image_refs))
+    present = {normalize_image_ref(image_ref) for image_ref in talosctl.image_list(namespace, **config_args)}
+    missing = [image_ref for image_ref in image_refs if normalize_image_ref(image_ref) not in present]
+    print(f"{len(image_refs) - len(missing)} of {len(image_refs)} images are already on the machine.")
+    if not missing:
+        return
+
+    failed = run_image_jobs(
+        missing, workers, lambda image_ref: _pull(image_ref, namespace, **config_args), "Pull image"
+    )
+    if failed:
+        raise TyperAbort(
+            *[f"{image_ref}: {error}" for image_ref, error in failed],
+            f"{len(failed)} of {len(missing)} images can't be pulled."
+        )
+    print(f"Pulled {len(missing)} images.")
@@ -1,4 +1,9 @@
-from typing import Dict, List, Tuple
+import json
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, Tuple
 
 import questionary
 from rich import print
@@ -9,7 +14,10 @@ from .._utils import _check as check
 from .._utils import _common as common
 from .._utils import _talosctl as talosctl
 from .._utils._common import TyperAbort
-from .._utils._constants import MACHINE_DIR, REPO_ROOT, TALOS_CONFIG_PROJECT
+from .._utils._config import BOX_NAME
+from .._utils._constants import (INVENTORY_DIR, MACHINE_DIR, REPO_ROOT,
+                                 TALOS_CONFIG_PROJECT)
+from .._utils._talos_api import Disk
 
 _DISK_SELECTOR_TEMP = """# This file was created by 'iiotctl machine resources' task and should not be manually changed
 
@@ -41,7 +49,7 @@ def _render_disk_selector_patch(model: str, second_identifier: str):
     print()
 
 
-def _parse_ethernet_datasets(links: List[Dict]) -> Dict[str, Dict[str, str]]:
+def _parse_ethernet_datasets(links: Iterable[Dict]) -> Dict[str, Dict[str, str]]:
     eth_datasets = {}
     for eth in links:
         spec = eth["spec"]
@@ -61,20 +69,63 @@ def _determine_talos_kwargs(machine_ip: str | None, use_current_context: bool):
         return {"talosconfig": TALOS_CONFIG_PROJECT.resolve()}
 
 
-def resources(machine_ip: str | None, patch: bool, use_current_context: bool):
-    if machine_ip is not None:
-        check.ip(machine_ip)
+def _parse_disk_datasets(disks: Iterable[Disk]) -> Dict[str, Dict[str, str]]:
+    disk_datasets = {}
+    for disk in disks:
+        data = {"MODEL": disk.model, "SIZE": disk.size, "WWID": disk.wwid, "BUS_PATH": disk.bus_path}
+        disk_datasets.update({disk.dev: {key: value for key, value in data.items() if value}})
+    return disk_datasets
+
+
+def _inventory_file(machine_ip: str | None) -> Path:
+    """file of the cached hardware inventory of the box (by ip for an insecure connection)"""
+    return INVENTORY_DIR / f"{machine_ip or BOX_NAME}.json"
+
 
+def _read_inventory(machine_ip: str | None, use_current_context: bool) -> Dict:
+    """read the hardware inventory (ethernet interfaces + disks) from the machine; cache it in the '.tasks' dir"""
     common.print_if(
-        "Ensure that 'iiotctl connect talos' is running", not use_current_context
+        "Ensure that 'iiotctl connect talos' is running", not use_current_context and machine_ip is None
     )
     config_kwargs = _determine_talos_kwargs(machine_ip, use_current_context)
 
-    eth_links = talosctl.get(resource="links", **config_kwargs)
-    eth_datasets = _parse_ethernet_datasets(eth_links)
+    with ThreadPoolExecutor() as executor:
+        links = executor.submit(lambda: _parse_ethernet_datasets(talosctl.iter_resources("links", **config_kwargs)))
+        disks = executor.submit(talosctl.disks, **config_kwargs)
+        inventory = {
+            "updated": datetime.now().isoformat(timespec="seconds"),
+            "links": links.result(),
+            "disks": {dev: asdict(disk) for dev, disk in disks.result().items()},
+        }
+
+    inventory_file = _inventory_file(machine_ip)
+    inventory_file.parent.mkdir(parents=True, exist_ok=True)
+    with open(inventory_file, "w") as f:
+        json.dump(inventory, f, indent=2)
+    return inventory
+
+
+def _load_inventory(machine_ip: str | None) -> Dict:
+    """load the cached hardware inventory of the last run; exit 1 if there is none"""
+    inventory_file = _inventory_file(machine_ip)
+    if not inventory_file.is_file():
+        raise TyperAbort(f"There is no cached inventory for '{machine_ip or BOX_NAME}', run without '--cached' first.")
+    with open(inventory_file, "r") as f:
+        inventory = json.load(f)
+    print(f"Cached inventory from {inventory['updated']} ({inventory_file.relative_to(REPO_ROOT)})")
+    return inventory
+
+
+def resources(machine_ip: str | None, patch: bool, use_current_context: bool, cached: bool):
+    if machine_ip is not None:
+        check.ip(machine_ip)
+
+    inventory = _load_inventory(machine_ip) if cached else _read_inventory(machine_ip, use_current_context)
+
+    eth_datasets = inventory["links"]
     _print_resource_overview("Ethernet Interfaces (talosctl get links)", ("HARDWARE_ADDRESS", "PRODUCT"), eth_datasets)
 
-    disk_datasets = talosctl.disks(**config_kwargs)
+    disk_datasets = _parse_disk_datasets(Disk(**disk) for disk in inventory["disks"].values())
     _print_resource_overview("Disks (talosctl disks)", ("MODEL", "SIZE"), disk_datasets)
 
     if not patch:
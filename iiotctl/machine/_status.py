@@ -1,22 +1,70 @@
+from concurrent.futures import ThreadPoolExecutor
+
 from rich import print
 
 from .._utils import _check as check
 from .._utils import _common as common
+from .._utils import _mc_reboot as mc_reboot
 from .._utils import _talosctl as talosctl
+from .._utils._common import TyperAbort
 from .._utils._config import TALOS_INSTALLED_EXTENSIONS
-from .._utils._constants import (DEFAULT_MACHINE_CONFIG_ID, DEP_GPG, DEP_JQ,
-                                 DEP_TALOSCTL, TALOS_CONFIG_PROJECT)
+from .._utils._constants import (DEP_GPG, DEP_JQ, DEP_TALOSCTL,
+                                 TALOS_CONFIG_PROJECT)
 from .._utils._installer_spec_config import load_repo_extension_versions
 from . import _talos_config as talos_config
 from ._misc import (check_if_mc_diffs, check_if_talos_ext_diffs,
                     compare_mc_hash, create_new_mc, print_live_talos_nodename,
-                    print_status_table)
+                    print_status_table, read_live_machine)
+
+
+def _dry_run_sequentially(new_mc: bytes, predicted_reboot: bool, **config_arg) -> bool:
+    """confirm the apply mode with dry-runs, the reboot dry-run only runs when required; return if a reboot is required
+
+    exit 1 if the mc can't be applied at all
+    """
+    apply_no_reboot = not predicted_reboot and talosctl.apply_mc(
+        new_mc, mode="no-reboot", dry_run=True, exit_on_failure=False, print_errors=False, **config_arg
+    )
+    # if mc can't be applied without reboot
+    if not apply_no_reboot:
+        # raise if mc can't be applied with reboot
+        talosctl.apply_mc(new_mc, mode="reboot", dry_run=True, exit_on_failure=True, **config_arg)
+    return not apply_no_reboot
+
+
+def _dry_run_concurrently(new_mc: bytes, **config_arg) -> bool:
+    """run the no-reboot and the reboot dry-run at the same time; return if a reboot is required
+
+    exit 1 if the mc can't be applied at all
+    """
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        apply_no_reboot = executor.submit(
+            talosctl.apply_mc,
+            new_mc, mode="no-reboot", dry_run=True, exit_on_failure=False, print_errors=False, **config_arg
+        )
+        # a config which can be applied without reboot can be applied with reboot as well => errors are relevant
+        apply_reboot = executor.submit(
+            talosctl.apply_mc, new_mc, mode="reboot", dry_run=True, exit_on_failure=False, **config_arg
+        )
+    if apply_no_reboot.result():
+        return False
+    if not apply_reboot.result():
+        raise TyperAbort()
+    return True
 
 
 @check.dependency(*DEP_GPG)
 @check.dependency(*DEP_TALOSCTL)
 @check.dependency(*DEP_JQ)
-def status(out_diff: str, use_current_context: bool, verbose: bool):
+def status(
+    out_diff: str,
+    use_current_context: bool,
+    verbose: bool,
+    fused: bool,
+    deferred_validation: bool,
+    no_cache: bool,
+    concurrent_dry_run: bool
+):
 
     common.print_if(
         "Ensure that 'iiotctl connect talos' is running", not use_current_context
@@ -25,15 +73,17 @@ def status(out_diff: str, use_current_context: bool, verbose: bool):
         {} if use_current_context else {"talosconfig": TALOS_CONFIG_PROJECT.resolve()}
     )
 
-    live_mc = talosctl.fetch_mc(DEFAULT_MACHINE_CONFIG_ID, **config_arg)
-    live_talos_version = talosctl.get_live_talos_version(**config_arg)
-    live_k8s_version = talosctl.get_live_k8s_version(live_mc)
-
-    print_live_talos_nodename(**config_arg)
+    with ThreadPoolExecutor() as executor:
+        live_reads = read_live_machine(executor, **config_arg)
+        live_mc = live_reads["mc"].result()
+        live_k8s_version = talosctl.get_live_k8s_version(live_mc)
+        print_live_talos_nodename(live_reads["node_name"].result())
 
-    new_mc = create_new_mc(live_mc, verbose)
-    mc_diffs = common.diffs_mc(live_mc, new_mc, out_diff)
-    live_exts = talosctl.get_live_talos_extension_versions(**config_arg)
+        # the repo patches are applied while the other reads are still running
+        new_mc = create_new_mc(live_mc, verbose, fused, deferred_validation, cache=not no_cache)
+        mc_diffs = common.diffs_mc(live_mc, new_mc, out_diff)
+        live_talos_version = live_reads["talos_version"].result()
+        live_exts = live_reads["extensions"].result()
 
     repo_extension_versions = load_repo_extension_versions(TALOS_INSTALLED_EXTENSIONS)
     exts_out_of_sync = check_if_talos_ext_diffs(live_exts, repo_extension_versions)
@@ -43,15 +93,18 @@ def status(out_diff: str, use_current_context: bool, verbose: bool):
     compare_mc_hash(hash_diff)
 
     if mc_out_of_sync:
-        common.print_if("Check if a reboot is necessary to apply the new config...", verbose)
+        # the local prediction is instant, the server dry-run (a round trip) only confirms it
+        reboot_paths = mc_reboot.reboot_paths(live_mc, new_mc)
+        print(f"Predicted apply mode: {'reboot' if reboot_paths else 'no-reboot'}")
+        for path in reboot_paths:
+            common.print_if(f"  '{path}' changed => requires a reboot", verbose)
+        common.print_if("Confirm the apply mode with a dry-run on the machine...", verbose)
 
-        apply_no_reboot = talosctl.apply_mc(
-            new_mc, mode="no-reboot", dry_run=True, exit_on_failure=False, print_errors=False, **config_arg
-        )
-        # if mc can't be applied without reboot
-        if not apply_no_reboot:
-            # raise if mc can't be applied with reboot
-            talosctl.apply_mc(new_mc, mode="reboot", dry_run=True, exit_on_failure=True, **config_arg)
+        if concurrent_dry_run:
+            reboot_required = _dry_run_concurrently(new_mc, **config_arg)
+        else:
+            reboot_required = _dry_run_sequentially(new_mc, bool(reboot_paths), **config_arg)
+        if reboot_required:
             print("The new config must be applied with a reboot")
         else:
             print("The new config can be applied without a reboot")
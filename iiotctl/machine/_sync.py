@@ -1,3 +1,4 @@
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
 
@@ -10,13 +11,13 @@ from .._utils import _talosctl as talosctl
 from .._utils._common import TyperAbort
 from .._utils._config import (K8S_VERSION, TALOS_INSTALLED_EXTENSIONS,
                               TALOS_VERSION)
-from .._utils._constants import (DEFAULT_MACHINE_CONFIG_ID, DEP_GPG, DEP_JQ,
-                                 DEP_TALOSCTL, TALOS_CONFIG_PROJECT)
+from .._utils._constants import (DEP_GPG, DEP_JQ, DEP_TALOSCTL,
+                                 TALOS_CONFIG_PROJECT)
 from .._utils._installer_spec_config import load_repo_extension_versions
 from . import _talos_config as talos_config
 from ._misc import (check_if_mc_diffs, check_if_talos_ext_diffs,
                     compare_mc_hash, create_new_mc, print_live_talos_nodename,
-                    print_status_table)
+                    print_status_table, read_live_machine)
 
 
 def _compare_repo_and_live_talos_version(live_talos_vers: str, force: bool):
@@ -70,6 +71,9 @@ def sync(
     dry_run: bool,
     use_current_context: bool,
     verbose: bool,
+    fused: bool,
+    deferred_validation: bool,
+    no_cache: bool,
 ):
 
     common.print_if(
@@ -79,15 +83,17 @@ def sync(
         {} if use_current_context else {"talosconfig": TALOS_CONFIG_PROJECT.resolve()}
     )
 
-    live_mc = talosctl.fetch_mc(DEFAULT_MACHINE_CONFIG_ID, **config_arg)
-    live_talos_version = talosctl.get_live_talos_version(**config_arg)
-    live_k8s_version = talosctl.get_live_k8s_version(live_mc)
-
-    print_live_talos_nodename(**config_arg)
-
-    new_mc = create_new_mc(live_mc, verbose)
-    mc_diffs = common.diffs_mc(live_mc, new_mc, out_diff)
-    live_exts = talosctl.get_live_talos_extension_versions(**config_arg)
+    with ThreadPoolExecutor() as executor:
+        live_reads = read_live_machine(executor, **config_arg)
+        live_mc = live_reads["mc"].result()
+        live_k8s_version = talosctl.get_live_k8s_version(live_mc)
+        print_live_talos_nodename(live_reads["node_name"].result())
+
+        # the repo patches are applied while the other reads are still running
+        new_mc = create_new_mc(live_mc, verbose, fused, deferred_validation, cache=not no_cache)
+        mc_diffs = common.diffs_mc(live_mc, new_mc, out_diff)
+        live_talos_version = live_reads["talos_version"].result()
+        live_exts = live_reads["extensions"].result()
 
     repo_extension_versions = load_repo_extension_versions(TALOS_INSTALLED_EXTENSIONS)
     exts_out_of_sync = check_if_talos_ext_diffs(live_exts, repo_extension_versions)
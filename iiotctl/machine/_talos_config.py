@@ -1,10 +1,18 @@
+import glob
+import io
 import json
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import redirect_stderr
 from datetime import datetime
 from hashlib import sha256
-from typing import List
+from pathlib import Path
+from typing import List, Optional, Tuple
 
+import typer
 from rich import print, print_json
+from rich.table import Table
 
 from .._utils import _check as check
 from .._utils import _common as common
@@ -12,8 +20,8 @@ from .._utils import _talosctl as talosctl
 from .._utils._common import Command, TyperAbort
 from .._utils._config import BOX_NAME, TALOS_INSTALLED_EXTENSIONS
 from .._utils._constants import (DEP_GPG, DEP_JQ, DEP_TALOSCTL,
-                                 EXCLUDE_SYNC_PATCHES, JQ_MODULES_DIR,
-                                 MACHINE_DIR, PATCH_LOCATIONS, REPO_ROOT,
+                                 EXCLUDE_SYNC_PATCHES, MACHINE_DIR,
+                                 PATCH_LOCATIONS, REPO_ROOT,
                                  TALOS_CONFIG_PROJECT)
 from .._utils._installer_spec_config import load_repo_installer_image_ref
 
@@ -22,6 +30,7 @@ CONFIG_HASH_FILE = CONFIG_SEALED_DIR / "config.hash"
 CONFIG_SEALED_FILE = CONFIG_SEALED_DIR / "config-sealed.asc"
 KEY_ID = "CE5C2A48F2FD3B6F748F39D35C573EF25CB0F87E"
 PUBLIC_KEY_FILE = CONFIG_SEALED_DIR / "public-key.gpg"
+PATCHED_SUFFIX = ".patched.json"
 
 
 def is_mc_hash_diff(mc: bytes):
@@ -96,16 +105,158 @@ def fetch_config(id: str, use_current_context: bool):
     print_json(data=json.loads(mc))
 
 
+def find_batch_mcs(batch: List[str]) -> List[Path]:
+    """find the mc files of a batch: the json files in a dir or the files matching a glob pattern
+
+    the results of a previous batch run (next to the inputs) are skipped
+    """
+    mc_files: List[Path] = []
+    for pattern in batch:
+        if Path(pattern).is_dir():
+            found = Path(pattern).glob("*.json")
+        else:
+            found = (Path(file) for file in glob.glob(pattern, recursive=True))
+        for mc_file in found:
+            if mc_file.is_file() and not mc_file.name.endswith(PATCHED_SUFFIX) and mc_file not in mc_files:
+                mc_files.append(mc_file)
+    return sorted(mc_files)
+
+
+def batch_output_file(mc_file: Path, output_dir: Optional[Path]) -> Path:
+    """get the result file of a batch mc: next to the input file or in the *output_dir*"""
+    if output_dir is None:
+        return mc_file.with_name(mc_file.name.removesuffix(".json") + PATCHED_SUFFIX)
+    return output_dir / mc_file.name
+
+
+def _batch_error(exc: Exception) -> str:
+    """error message of an unexpected failure of a batch mc (typer.Abort / OSError: the messages were printed)"""
+    return str(exc) if isinstance(exc, (typer.Abort, OSError)) else f"{type(exc).__name__}: {exc}"
+
+
+def _patch_batch_mc(
+    mc_file: Path, output_file: Path, patch_files: List[Path], fused: bool, deferred_validation: bool, cache: bool
+) -> Tuple[bool, float, str]:
+    """validate, patch and write a single mc of a batch (executed in a worker process)
+
+    return if it was successful, the duration in sec and the error messages
+    """
+    start = time.perf_counter()
+    errors = io.StringIO()
+    try:
+        with redirect_stderr(errors):  # the error messages are printed in the summary
+            with open(mc_file, "rb") as f:
+                mc = f.read()
+            talosctl.validate_mc(mc, cache=cache)
+            mc = talosctl.patch_mc(mc, patch_files, fused=fused, deferred_validation=deferred_validation, cache=cache)
+        with open(output_file, "wb") as f:
+            f.write(mc + b"\n")
+    except Exception as exc:  # e.g. an invalid input mc => only this mc of the batch failed
+        error = errors.getvalue().replace("[ERROR]: ", "").strip() or _batch_error(exc)
+        return False, time.perf_counter() - start, error
+    return True, time.perf_counter() - start, ""
+
+
+def patch_batch(
+    mc_files: List[Path],
+    output_dir: Optional[Path],
+    patch_files: List[Path],
+    workers: Optional[int],
+    verbose: bool,
+    fused: bool,
+    deferred_validation: bool,
+    cache: bool
+):
+    """validate and patch all *mc_files* in parallel (process pool); print a summary table
+
+    exit 1 when a mc can't be patched or is invalid
+    """
+    output_files = [batch_output_file(mc_file, output_dir) for mc_file in mc_files]
+    if len(set(output_files)) != len(output_files):
+        raise TyperAbort("The batch contains several machine configs with the same file name.")
+    input_files = {mc_file.resolve() for mc_file in mc_files}
+    overwritten = [output_file for output_file in output_files if output_file.resolve() in input_files]
+    if overwritten:  # e.g. the output dir is the dir of the inputs
+        raise TyperAbort(
+            f"The results would overwrite the input machine configs: {', '.join(map(str, overwritten))}",
+            "Choose another output dir."
+        )
+    if output_dir is not None:
+        output_dir.mkdir(parents=True, exist_ok=True)
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(
+                _patch_batch_mc, mc_file, output_file, patch_files, fused, deferred_validation, cache
+            ): mc_file
+            for mc_file, output_file in zip(mc_files, output_files)
+        }
+        for future in as_completed(futures):
+            try:
+                results[futures[future]] = future.result()
+            except Exception as exc:  # the worker couldn't run the job (e.g. a pickling error, a broken pool)
+                results[futures[future]] = (False, 0.0, _batch_error(exc))
+            success, duration, _ = results[futures[future]]
+            common.print_if(f"   {'patched' if success else 'failed'}: {futures[future]} ({duration:.2f}s)", verbose)
+
+    table = Table(title="Batch Summary", show_lines=True)
+    table.add_column("Valid", justify="center")
+    table.add_column("Machine config")
+    table.add_column("Result")
+    table.add_column("Time", justify="right")
+    table.add_column("Errors")
+    for mc_file, output_file in zip(mc_files, output_files):
+        success, duration, errors = results[mc_file]
+        table.add_row(
+            ":white_heavy_check_mark:" if success else ":x:",
+            str(mc_file),
+            str(output_file) if success else "-",
+            f"{duration:.2f}s",
+            errors
+        )
+    print(table)
+
+    failed = [mc_file for mc_file in mc_files if not results[mc_file][0]]
+    if failed:
+        raise TyperAbort(f"{len(failed)} of {len(mc_files)} machine configs failed.")
+
+
 @check.dependency(*DEP_JQ)
 @check.dependency(*DEP_TALOSCTL)
 def patch_config(
-    fetch: bool, generate: bool, patch_file_pattern: List[str], verbose: bool, id: str, use_current_context: bool
+    fetch: bool,
+    generate: bool,
+    patch_file_pattern: List[str],
+    verbose: bool,
+    id: str,
+    use_current_context: bool,
+    fused: bool,
+    deferred_validation: bool,
+    no_cache: bool,
+    batch: List[str],
+    output_dir: Optional[Path],
+    workers: Optional[int]
 ):
 
     if generate and fetch:
         raise TyperAbort("Invalid flags. 'Generate' and 'fetch' are mutually exclusive.")
+    if batch and (generate or fetch):
+        raise TyperAbort("Invalid flags. 'Batch' can't be combined with 'generate' or 'fetch'.")
 
     patch_files = common.glob_files(REPO_ROOT, *patch_file_pattern) if patch_file_pattern else []
+    # a generated mc contains new secrets => never found in the cache
+    cache = not (no_cache or generate)
+
+    if batch:
+        mc_files = find_batch_mcs(batch)
+        if not mc_files:
+            raise TyperAbort("No machine configs found for the batch.")
+        if not patch_file_pattern:
+            exc_patch_files = common.glob_files(REPO_ROOT, *EXCLUDE_SYNC_PATCHES)
+            patch_files = [f for f in common.glob_files(REPO_ROOT, *PATCH_LOCATIONS) if f not in exc_patch_files]
+        patch_batch(mc_files, output_dir, patch_files, workers, verbose, fused, deferred_validation, cache)
+        return
 
     if generate:
         image_ref = load_repo_installer_image_ref(required_extensions=TALOS_INSTALLED_EXTENSIONS)
@@ -122,7 +273,7 @@ def patch_config(
             patch_files = [f for f in common.glob_files(REPO_ROOT, *PATCH_LOCATIONS) if f not in exc_patch_files]
     else:
         mc = sys.stdin.buffer.read()  # read piped-in file content (cat mc.json | iiotctl machine patch_config)
-        talosctl.validate_mc(mc)
+        talosctl.validate_mc(mc, cache=cache)
 
     if not patch_files:
         raise TyperAbort("No patch files found.")
@@ -134,7 +285,7 @@ def patch_config(
     for patch in patch_files:
         if verbose:
             print(f"   patch: {patch.relative_to(REPO_ROOT)}", file=sys.stderr)
-        mc = common.patch_json(mc, patch, JQ_MODULES_DIR)
-        talosctl.validate_mc(mc)
+
+    mc = talosctl.patch_mc(mc, patch_files, fused=fused, deferred_validation=deferred_validation, cache=cache)
 
     print_json(data=json.loads(mc))
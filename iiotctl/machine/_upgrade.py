@@ -14,6 +14,8 @@ from .._utils._constants import (DEP_JQ, DEP_KUBECTL, DEP_TALOSCTL, DEP_TSH,
                                  K8S_CONFIG_USER, TALOS_CONFIG_PROJECT)
 from .._utils._installer_spec_config import (load_repo_extension_versions,
                                              load_repo_installer_image_ref)
+from ._prepull import DEFAULT_WORKERS, prepull_images
+from ._wait import wait_until_ready
 
 
 def _print_current_extensions():
@@ -58,7 +60,7 @@ def _set_talos_upgrade_kwargs(image_ref: str, use_current_context: bool, verbose
 
 
 @check.dependency(*DEP_TALOSCTL)
-def prepare_upgrade(use_current_context: bool):
+def prepare_upgrade(use_current_context: bool, workers: int = DEFAULT_WORKERS):
     common.print_if(
         "Ensure that 'iiotctl connect talos' is running\n", not use_current_context
     )
@@ -70,17 +72,13 @@ def prepare_upgrade(use_current_context: bool):
     images = response.splitlines()
     images.remove(f"ghcr.io/siderolabs/installer:v{TALOS_VERSION}")
 
-    for img in images:
-        print(f"Pull image: '{img}' ...", end=" ")
-        talosctl.image_pull(img, **config_args)
-        print(":white_heavy_check_mark:")
-
+    prepull_images(images, workers, **config_args)
     print("Preloading images done.\n")
 
 
 @check.dependency(*DEP_TALOSCTL)
 @check.dependency(*DEP_JQ)
-def upgrade_talos(use_current_context: bool, preserve: bool, stage: bool, verbose: bool):
+def upgrade_talos(use_current_context: bool, preserve: bool, stage: bool, verbose: bool, wait: bool = False):
 
     common.print_if(
         "Ensure that 'iiotctl connect talos' is running\n", not use_current_context
@@ -109,8 +107,16 @@ def upgrade_talos(use_current_context: bool, preserve: bool, stage: bool, verbos
         print()
         print("It takes a while (~ 5 min) before the machine can be reconnected.")
         print("It's necessary to restart the 'iiotctl connect talos' task.")
-        upgrade_kwargs = _set_talos_upgrade_kwargs(image_ref, use_current_context, verbose, preserve, stage)
+        # talosctl doesn't wait itself when the events are followed
+        upgrade_kwargs = _set_talos_upgrade_kwargs(
+            image_ref, use_current_context, verbose and not wait, preserve, stage
+        )
+        # the events after the last one before the upgrade are the progress of the upgrade
+        since_id = talosctl.last_event_id(**config_args) if wait else None
         talosctl.upgrade_talos(**upgrade_kwargs)
+        if wait:
+            print("Wait until the machine is ready ...")
+            wait_until_ready(since_id, verbose=verbose, **config_args)
 
 
 @check.dependency(*DEP_KUBECTL)
@@ -0,0 +1,140 @@
+import time
+from typing import Dict, List, Optional
+
+from rich import print
+from rich.table import Table
+
+from .._utils import _talosctl as talosctl
+from .._utils._common import TyperAbort
+from .._utils._talos_api import Event
+
+READY_TIMEOUT_SEC = 30 * 60
+_RECONNECT_DELAY_SEC = 5
+# services which are always shown (the states of all other services only in verbose mode)
+_MILESTONE_SERVICES = ("etcd", "kubelet")
+
+
+class _Progress:
+    """phase transitions of the machine (from its runtime events) and their timing"""
+
+    def __init__(self, verbose: bool):
+        self.verbose = verbose
+        self.start = time.monotonic()
+        self.steps: List[List] = []  # name, start offset, duration (None => not finished)
+        self._open_steps: Dict[str, int] = {}
+        self.booted = False  # a boot sequence started during the wait
+        self.stage = ""
+        self.unmet_conditions = ""
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.start
+
+    def _print(self, msg: str, show=True):
+        if show:
+            print(f"[{self.elapsed():6.1f}s] {msg}")
+
+    def _begin(self, name: str):
+        if name not in self._open_steps:
+            self._open_steps[name] = len(self.steps)
+            self.steps.append([name, self.elapsed(), None])
+
+    def _end(self, name: str):
+        if (index := self._open_steps.pop(name, None)) is not None:
+            self.steps[index][2] = self.elapsed() - self.steps[index][1]
+
+    def disconnected(self):
+        if "unreachable" not in self._open_steps:
+            self._print("The machine is unreachable (e.g. rebooting), waiting for it ...")
+            for name in list(self._open_steps):  # interrupted by the reboot
+                self._end(name)
+            self._begin("unreachable")
+
+    def connected(self):
+        if "unreachable" in self._open_steps:
+            self._end("unreachable")
+            self._print("The machine is reachable again")
+
+    def handle(self, event: Event) -> bool:
+        """track the *event*; return True when the machine is ready"""
+        if event.type == "SequenceEvent":
+            name = f"sequence {event.source}"
+            if event.action == "START":
+                self.booted = self.booted or event.source == "boot"
+                self._begin(name)
+                self._print(f"Sequence '{event.source}' started")
+            elif event.action == "STOP":
+                self._end(name)
+                self._print(f"Sequence '{event.source}' finished")
+            elif event.action == "ERROR":
+                self._end(name)
+                self._print(f"Sequence '{event.source}' failed: {event.message}")
+        elif event.type == "PhaseEvent":
+            name = f"  phase {event.source}"
+            if event.action == "START":
+                self._begin(name)
+                self._print(f"  phase '{event.source}'", self.verbose)
+            else:
+                self._end(name)
+        elif event.type == "TaskEvent":
+            self._print(f"    task '{event.source}': {event.action.lower()}", self.verbose)
+        elif event.type == "ServiceStateEvent":
+            milestone = event.source in _MILESTONE_SERVICES
+            name = f"service {event.source}"
+            if event.action == "RUNNING":
+                self._end(name)
+                self._print(f"Service '{event.source}' is running", milestone or self.verbose)
+            else:
+                if milestone and event.action not in ("FAILED", "FINISHED", "SKIPPED", "STOPPING"):
+                    self._begin(name)
+                self._print(f"Service '{event.source}': {event.action.lower()} {event.message}", self.verbose)
+        elif event.type == "MachineStatusEvent":
+            if event.source != self.stage:
+                self.stage = event.source
+                self._print(f"Machine stage: {event.source}")
+            self.unmet_conditions = event.message
+            return bool(event.ready) and self.booted and event.source == "RUNNING"
+        return False
+
+    def print_summary(self, ready=True):
+        table = Table(title="Time to ready")
+        table.add_column("STEP")
+        table.add_column("START", justify="right")
+        table.add_column("DURATION", justify="right")
+        for name, start, duration in self.steps:
+            table.add_row(name, f"{start:.1f}s", "-" if duration is None else f"{duration:.1f}s")
+        table.add_row("ready" if ready else "not ready", "", f"{self.elapsed():.1f}s")
+        print(table)
+
+
+def wait_until_ready(
+    since_id: Optional[str] = None, tail_events=0, timeout: float = READY_TIMEOUT_SEC, verbose=False, **config_args
+):
+    """follow the runtime events of the machine until it's ready (booted, stage RUNNING and all conditions met)
+
+    since_id: only the events after this id are followed (e.g. the last event before an upgrade was started)
+    tail_events: number of past events which are followed as well (-1 => all, e.g. after a fresh install)
+    the connection is retried until the *timeout* expires when the machine is unreachable (e.g. while rebooting)
+    exit 1 when the machine isn't ready in time
+    """
+    progress = _Progress(verbose)
+    last_id = since_id
+    while (remaining := timeout - progress.elapsed()) > 0:
+        for event in talosctl.events(tail_events, since_id, remaining, exit_on_failure=False, **config_args):
+            progress.connected()
+            if last_id is not None and event.id <= last_id:  # replayed (the event ids are sortable xids)
+                continue
+            last_id = event.id
+            if progress.handle(event):
+                print(f"The machine is ready after {progress.elapsed():.1f}s")
+                progress.print_summary()
+                return
+        progress.disconnected()  # the event stream ends when the connection is lost
+        # a rebooted machine doesn't know the last seen event => all events are requested after a reconnect
+        tail_events, since_id = -1, None
+        time.sleep(min(_RECONNECT_DELAY_SEC, max(timeout - progress.elapsed(), 0)))
+
+    progress.print_summary(ready=False)
+    raise TyperAbort(
+        f"Unmet conditions: {progress.unmet_conditions}" if progress.unmet_conditions else None,
+        f"The machine isn't ready after {timeout / 60:.0f} min."
+    )
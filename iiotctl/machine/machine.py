@@ -1,3 +1,4 @@
+from pathlib import Path
 from typing import List, Optional
 
 import typer
@@ -5,7 +6,9 @@ from typing_extensions import Annotated
 
 from .._utils._constants import (DEFAULT_MACHINE_CONFIG_ID, REPO_ROOT,
                                  TASKS_TMP_DIR)
-from . import _bootstrap, _resources, _status, _sync, _talos_config, _upgrade
+from .._utils._oci import DEFAULT_PLATFORM
+from . import (_bootstrap, _health, _images, _lint, _logs, _prepull, _resources, _status, _sync, _talos_config,
+               _upgrade)
 
 app = typer.Typer(name="machine", help="Interact with live machine via established connection.")
 
@@ -25,6 +28,12 @@ def resources(
             "-u",
             help="use the current selected talos context, otherwise the machine/talosconfig-teleport file will be used"
         )
+    ] = False,
+    cached: Annotated[
+        bool,
+        typer.Option(
+            "--cached", help="use the hardware inventory of the last run (in the '.tasks' dir) without a connection"
+        )
     ] = False
 ):
     """
@@ -43,9 +52,12 @@ def resources(
     >>> iiotctl machine resources --use-current-context
 
         Useful if you want to connect via local talos cert and context, without teleport.
+
+    Call with argument '--cached' to use the hardware inventory of the last run (e.g. to render the patch files again):
+    >>> iiotctl machine resources --cached --patch
     """
 
-    _resources.resources(machine_ip, patch, use_current_context)
+    _resources.resources(machine_ip, patch, use_current_context, cached)
 
 
 @app.command()
@@ -62,6 +74,20 @@ def bootstrap(
     force: Annotated[
         bool,
         typer.Option("--force", "-f", help="overwrite <out-mc> & <out-talosconfig> when they already exist")
+    ] = False,
+    fused: Annotated[
+        bool,
+        typer.Option("--fused", help="apply all patches in a single jq run (only the final config is validated)")
+    ] = False,
+    deferred_validation: Annotated[
+        bool,
+        typer.Option(
+            "--deferred-validation", help="only validate the final config instead of the config after each patch"
+        )
+    ] = False,
+    wait: Annotated[
+        bool,
+        typer.Option("--wait", help="follow the boot of the machine until it's ready and show the timing")
     ] = False
 ):
     """
@@ -77,9 +103,14 @@ def bootstrap(
 
     Call with argument '--out-mc' to also write the new machine config in a local file given by name:
     >>> iiotctl machine bootstrap 192.168.23.2 --out-mc "mc.json"
+
+    Call with argument '--wait' to follow the install & boot phases until the machine is ready:
+    >>> iiotctl machine bootstrap 192.168.23.2 --wait
     """
 
-    _bootstrap.bootstrap(machine_ip, ttl, out_talosconfig, out_mc, dry_run, force, verbose)
+    _bootstrap.bootstrap(
+        machine_ip, ttl, out_talosconfig, out_mc, dry_run, force, verbose, fused, deferred_validation, wait
+    )
 
 
 @app.command()
@@ -93,6 +124,27 @@ def status(
             "-u",
             help="use the current selected talos context, otherwise the machine/talosconfig-teleport file will be used"
         )
+    ] = False,
+    fused: Annotated[
+        bool,
+        typer.Option("--fused", help="apply all patches in a single jq run (only the final config is validated)")
+    ] = False,
+    deferred_validation: Annotated[
+        bool,
+        typer.Option(
+            "--deferred-validation", help="only validate the final config instead of the config after each patch"
+        )
+    ] = False,
+    no_cache: Annotated[
+        bool,
+        typer.Option("--no-cache", help="don't reuse patched configs and validation results from previous runs")
+    ] = False,
+    concurrent_dry_run: Annotated[
+        bool,
+        typer.Option(
+            "--concurrent-dry-run",
+            help="run the no-reboot and the reboot dry-run at the same time (saves a round trip on slow connections)"
+        )
     ] = False
 ):
     """
@@ -105,9 +157,45 @@ def status(
 
     Call with argument '--out-diff' to export differences between repo and live machine config to file:
     >>> iiotctl machine status --out-diff "diffs.txt"
+
+    Call with argument '--fused' to apply all local patch files in a single jq run:
+    >>> iiotctl machine status --fused
+
+    Call with argument '--concurrent-dry-run' to check the no-reboot and the reboot apply mode at the same time:
+    >>> iiotctl machine status --concurrent-dry-run
     """
 
-    _status.status(out_diff, use_current_context, verbose)
+    _status.status(out_diff, use_current_context, verbose, fused, deferred_validation, no_cache, concurrent_dry_run)
+
+
+@app.command()
+def health(
+    use_current_context: Annotated[
+        bool,
+        typer.Option(
+            "--use-current-context",
+            "-u",
+            help="use the current selected talos & k8s context, otherwise the machine/talosconfig-teleport file "
+            "and the teleport k8s login will be used"
+        )
+    ] = False,
+    timeout: Annotated[
+        float, typer.Option("--timeout", help="timeout of each check in seconds (default: per check, 15-30 s)")
+    ] = None
+):
+    """
+    check the health of the talos services, etcd, the k8s nodes and the pods of the system apps (all at once)
+
+    EXAMPLES:
+
+    Call without optional arguments to show a summary table (exit code 1 if a check fails):
+    >>> iiotctl machine health
+
+    Call with argument '--timeout' to give slow connections more time:
+    >>> iiotctl machine health --timeout 60
+    """
+
+    _health.health(use_current_context, timeout)
 
 
 @app.command()
@@ -143,6 +231,20 @@ def sync(
         typer.Option(
             "--force", "-f", help="ignore version conflicts for talos and k8s between repo and live machine"
         )
+    ] = False,
+    fused: Annotated[
+        bool,
+        typer.Option("--fused", help="apply all patches in a single jq run (only the final config is validated)")
+    ] = False,
+    deferred_validation: Annotated[
+        bool,
+        typer.Option(
+            "--deferred-validation", help="only validate the final config instead of the config after each patch"
+        )
+    ] = False,
+    no_cache: Annotated[
+        bool,
+        typer.Option("--no-cache", help="don't reuse patched configs and validation results from previous runs")
     ] = False
 ):
     """
@@ -164,7 +266,10 @@ def sync(
         Other apply modes are: [auto, interactive, staged, try, (default:) no-reboot]
     """
 
-    _sync.sync(force, out_backup, out_diff, apply_mode, dry_run, use_current_context, verbose)
+    _sync.sync(
+        force, out_backup, out_diff, apply_mode, dry_run, use_current_context, verbose, fused, deferred_validation,
+        no_cache
+    )
 
 
 @app.command()
@@ -176,18 +281,128 @@ def prepare_upgrade(
             "-u",
             help="use the current selected talos context, otherwise the machine/talosconfig-teleport file will be used"
         )
-    ] = False
+    ] = False,
+    workers: Annotated[
+        int, typer.Option("--workers", "-w", min=1, help="number of images which are pulled at once")
+    ] = _prepull.DEFAULT_WORKERS
 ):
     """
     pre-pull all images required for updating the live machine's talos & k8s versions to current project versions
 
+    Images which are already on the machine are skipped, failed pulls are retried.
+
     Call with argument '--use-current-context' to connect via the currently selected talos context.
-    >>> iiotctl machine upgrade-talos --use-current-context
+    >>> iiotctl machine prepare-upgrade --use-current-context
 
         Useful if you want to connect via local talos cert and context, without teleport.
+
+    Call with argument '--workers' to change the number of concurrent pulls.
+    >>> iiotctl machine prepare-upgrade --workers 8
     """
 
-    _upgrade.prepare_upgrade(use_current_context)
+    _upgrade.prepare_upgrade(use_current_context, workers)
+
+
+@app.command()
+def prepull_app_images(
+    app: Annotated[
+        List[str], typer.Option("--app", "-a", help="one or more system-apps or user-apps (glob patterns)")
+    ] = ["*"],
+    workers: Annotated[
+        int, typer.Option("--workers", "-w", min=1, help="number of images which are pulled at once")
+    ] = _prepull.DEFAULT_WORKERS,
+    use_current_context: Annotated[
+        bool,
+        typer.Option(
+            "--use-current-context",
+            "-u",
+            help="use the current selected talos context, otherwise the machine/talosconfig-teleport file will be used"
+        )
+    ] = False
+):
+    """
+    pre-pull the images of the argo apps (rendered manifests in the 'argo' dirs) onto the live machine
+
+    The images of the containers / init containers are collected with the image overrides of kustomize applied.
+    Pull them before the commit which changes them is pushed => argo can sync the apps without waiting for the pulls.
+
+    EXAMPLES:
+
+    Call without arguments to pre-pull the images of all system-apps and user-apps:
+    >>> iiotctl machine prepull-app-images
+
+    Call with argument '--app' to pre-pull only the images of some apps:
+    >>> iiotctl machine prepull-app-images --app traefik --app monitoring
+    """
+
+    _images.prepull_app_images(app, workers, use_current_context)
+
+
+@app.command()
+def export_images(
+    archive: Annotated[Path, typer.Argument(help="OCI image archive (tar) which is written")] = Path("images.tar"),
+    platform: Annotated[
+        str, typer.Option("--platform", help="platform of the images (os/architecture) of multi-platform images")
+    ] = DEFAULT_PLATFORM,
+    workers: Annotated[
+        int, typer.Option("--workers", "-w", min=1, help="number of images which are downloaded at once")
+    ] = _prepull.DEFAULT_WORKERS,
+    insecure_registries: Annotated[
+        List[str], typer.Option("--insecure-registry", help="registry which is reached via plain http")
+    ] = []
+):
+    """
+    export all images of the repo (talos & k8s, installer and the images of the argo manifests) into an OCI archive
+
+    Layers which are shared by several images are stored once. Registries on localhost are reached via plain http.
+
+    EXAMPLES:
+
+    Call with the archive path to export the images of the repo:
+    >>> iiotctl machine export-images images.tar
+
+    Call with argument '--insecure-registry' to export from a registry stand-in without tls:
+    >>> iiotctl machine export-images images.tar --insecure-registry registry.local:5000
+    """
+
+    _images.export_images(archive, platform, workers, insecure_registries)
+
+
+@app.command()
+def import_images(
+    archive: Annotated[Path, typer.Argument(help="OCI image archive (tar) of 'export-images'", exists=True)],
+    address: Annotated[
+        str, typer.Option("--address", "-a", help="address of this computer which the machine can reach")
+    ],
+    port: Annotated[int, typer.Option("--port", "-p", help="port of the registry which serves the archive")] = 5000,
+    workers: Annotated[
+        int, typer.Option("--workers", "-w", min=1, help="number of images which are pulled at once")
+    ] = _prepull.DEFAULT_WORKERS,
+    use_current_context: Annotated[
+        bool,
+        typer.Option(
+            "--use-current-context",
+            "-u",
+            help="use the current selected talos context, otherwise the machine/talosconfig-teleport file will be used"
+        )
+    ] = False
+):
+    """
+    import the images of an OCI archive into the image cache of the live machine (e.g. without internet access)
+
+    The archive is served as registry by this computer, the machine pulls the images from it. The machine config must
+    mirror the registries of the images via this registry (the command prints the required endpoints).
+
+    EXAMPLES:
+
+    Call with the archive and the address of this computer in the network of the machine:
+    >>> iiotctl machine import-images images.tar --address 192.168.1.20
+
+    Call with argument '--use-current-context' to connect via the currently selected talos context.
+    >>> iiotctl machine import-images images.tar --address 192.168.1.20 --use-current-context
+    """
+
+    _images.import_images(archive, address, port, workers, use_current_context)
 
 
 @app.command()
@@ -204,6 +419,10 @@ def upgrade_talos(
             "-u",
             help="use the current selected talos context, otherwise the machine/talosconfig-teleport file will be used"
         )
+    ] = False,
+    wait: Annotated[
+        bool,
+        typer.Option("--wait", help="follow the upgrade until the machine is ready and show the timing")
     ] = False
 ):
     """
@@ -213,9 +432,12 @@ def upgrade_talos(
     >>> iiotctl machine upgrade-talos --use-current-context
 
         Useful if you want to connect via local talos cert and context, without teleport.
+
+    Call with argument '--wait' to follow the upgrade phases (upgrade, reboot, boot) until the machine is ready:
+    >>> iiotctl machine upgrade-talos --wait
     """
 
-    _upgrade.upgrade_talos(use_current_context, not no_preserve, not no_stage, verbose)
+    _upgrade.upgrade_talos(use_current_context, not no_preserve, not no_stage, verbose, wait)
 
 
 @app.command()
@@ -276,7 +498,48 @@ def patch_config(
             help="use the current selected talos context, otherwise the machine/talosconfig-teleport file will be used",
             rich_help_panel="Fetch utils"
         )
-    ] = False
+    ] = False,
+    fused: Annotated[
+        bool,
+        typer.Option("--fused", help="apply all patches in a single jq run (only the final config is validated)")
+    ] = False,
+    deferred_validation: Annotated[
+        bool,
+        typer.Option(
+            "--deferred-validation", help="only validate the final config instead of the config after each patch"
+        )
+    ] = False,
+    no_cache: Annotated[
+        bool,
+        typer.Option("--no-cache", help="don't reuse patched configs and validation results from previous runs")
+    ] = False,
+    batch: Annotated[
+        List[str],
+        typer.Option(
+            "--batch",
+            "-b",
+            help="dir or glob pattern of machine configs which are all patched (instead of STDIN)",
+            rich_help_panel="Batch utils"
+        )
+    ] = [],
+    output_dir: Annotated[
+        Optional[Path],
+        typer.Option(
+            "--output-dir",
+            "-o",
+            help="dir for the patched configs of the batch, otherwise they are written next to the inputs",
+            rich_help_panel="Batch utils"
+        )
+    ] = None,
+    workers: Annotated[
+        Optional[int],
+        typer.Option(
+            "--workers",
+            "-w",
+            help="number of parallel workers for the batch (default: cpu count)",
+            rich_help_panel="Batch utils"
+        )
+    ] = None
 ):
     """
     patch machine config with jq patch files
@@ -302,9 +565,96 @@ def patch_config(
     into a json file for better readability:
     >>> cat mc.json | iiotctl machine patch-config --patch-file-pattern "machine/config/*/_*.jq" --patch-file-pattern
     "system-apps/*/machine-patches/_*.jq"
+
+    Patched configs are cached (except for generated configs), after editing a patch file only this patch and the
+    following patches which depend on its changes are re-evaluated. Call with argument '--no-cache' to re-evaluate
+    all patches:
+    >>> iiotctl machine patch-config --no-cache > mc.json
+
+    Call with argument '--batch' to patch all machine configs in a dir (or matching a glob pattern) in parallel, e.g.
+    to check a change of the patches against archived configs. The patched configs are written next to the inputs
+    ('*.patched.json') or into the '--output-dir':
+    >>> iiotctl machine patch-config --batch archive/ --output-dir patched/
+    """
+
+    _talos_config.patch_config(
+        fetch,
+        generate,
+        patch_file_pattern,
+        verbose,
+        id,
+        use_current_context,
+        fused,
+        deferred_validation,
+        no_cache,
+        batch,
+        output_dir,
+        workers
+    )
+
+
+@app.command()
+def lint_patches(
+    patch_file_pattern: Annotated[
+        List[str],
+        typer.Option(
+            "--patch-file-pattern", "-p", help="glob pattern(s) to find the patch files (default: all patch files)"
+        )
+    ] = []
+):
+    """
+    compile all patch files and their imported modules without a machine config; report errors with file and line
+
+    EXAMPLES:
+
+    Call without arguments to check all patch files (e.g. in a pre-commit hook):
+    >>> iiotctl machine lint-patches
+
+    Call with argument '--patch-file-pattern' to only check some patch files:
+    >>> iiotctl machine lint-patches --patch-file-pattern "machine/config/network/_*.jq"
+    """
+
+    _lint.lint_patches(patch_file_pattern)
+
+
+@app.command()
+def logs(
+    sources: Annotated[
+        List[str], typer.Argument(help="talos services (e.g. 'kubelet', 'etcd', 'machined') and/or 'dmesg'")
+    ],
+    since: Annotated[
+        str, typer.Option("--since", "-s", help="only lines newer than a duration (e.g. '15m', '2h') or a timestamp")
+    ] = None,
+    grep: Annotated[str, typer.Option("--grep", "-g", help="only lines which match the regex")] = None,
+    tail: Annotated[
+        int, typer.Option("--tail", "-n", help="only the last N lines of each log (dmesg: without '--follow')")
+    ] = None,
+    follow: Annotated[bool, typer.Option("--follow", "-f", help="follow the logs (Ctrl+C to stop)")] = False,
+    use_current_context: Annotated[
+        bool,
+        typer.Option(
+            "--use-current-context",
+            "-u",
+            help="use the current selected talos context, otherwise the machine/talosconfig-teleport file will be used"
+        )
+    ] = False
+):
+    """
+    stream the logs of talos services and the kernel messages, interleaved by their timestamps
+
+    EXAMPLES:
+
+    Call with the services to show their logs (and the kernel messages) of the last 15 minutes:
+    >>> iiotctl machine logs kubelet etcd dmesg --since 15m
+
+    Call with argument '--grep' to only show the matching lines, '--tail' to limit the lines per log:
+    >>> iiotctl machine logs kubelet --grep "error|failed" --tail 500
+
+    Call with argument '--follow' to show the new lines as they arrive:
+    >>> iiotctl machine logs machined containerd --follow
     """
 
-    _talos_config.patch_config(fetch, generate, patch_file_pattern, verbose, id, use_current_context)
+    _logs.logs(sources, since, grep, tail, follow, use_current_context)
 
 
 @app.command()
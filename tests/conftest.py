@@ -0,0 +1,22 @@
+import pytest
+
+from iiotctl._utils import _mc_cache as mc_cache
+from iiotctl._utils import _patch_graph as patch_graph
+
+
+def _forget_files():
+    # the digests / reads of the patch files are cached per run (the files don't change during a run)
+    mc_cache._file_digests.clear()
+    mc_cache._patch_digests.clear()
+    patch_graph._reads.clear()
+
+
+@pytest.fixture
+def new_run(tmp_path, monkeypatch):
+    """an empty mc cache in a temp dir; call the fixture to start a new run (e.g. after a patch file was edited)"""
+    monkeypatch.setattr(mc_cache, "_PATCHED_DIR", tmp_path / "mc-cache" / "patched")
+    monkeypatch.setattr(mc_cache, "_VALIDATED_DIR", tmp_path / "mc-cache" / "validated")
+    monkeypatch.setattr(mc_cache, "_GRAPH_DIR", tmp_path / "mc-cache" / "graph")
+    _forget_files()
+    yield _forget_files
+    _forget_files()
@@ -0,0 +1,130 @@
+"""Stand-in for a container registry to test the OCI image archives of '_oci'
+
+A plain http registry on localhost (read-only distribution api) which serves the images, indexes and blobs added by
+the tests and records the requests. Tampered blobs / manifests are served with a wrong content (=> digest mismatch).
+"""
+
+import hashlib
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Set, Tuple
+
+from iiotctl._utils import _oci as oci
+
+MANIFEST_TYPE = oci.MANIFEST_MEDIA_TYPES[0]
+INDEX_TYPE = oci.INDEX_MEDIA_TYPES[0]
+CONFIG_TYPE = "application/vnd.oci.image.config.v1+json"
+LAYER_TYPE = "application/vnd.oci.image.layer.v1.tar+gzip"
+
+
+def digest(content: bytes) -> str:
+    return f"sha256:{hashlib.sha256(content).hexdigest()}"
+
+
+def _descriptor(media_type: str, content: bytes) -> Dict:
+    return {"mediaType": media_type, "digest": digest(content), "size": len(content)}
+
+
+class RegistryStandIn(ThreadingHTTPServer):
+    """registry in a background thread (port chosen by the os)"""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.blobs: Dict[str, bytes] = {}
+        self.manifests: Dict[Tuple[str, str], Tuple[bytes, str]] = {}  # repository, tag / digest => content, type
+        self.tampered: Set[str] = set()  # digests which are served with a wrong content
+        self.requests: List[Tuple[str, str]] = []  # method, path
+        self._lock = threading.Lock()
+
+    def __enter__(self) -> "RegistryStandIn":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
+
+    @property
+    def host(self) -> str:
+        return f"127.0.0.1:{self.server_address[1]}"
+
+    def _add_manifest(self, repository: str, tag: Optional[str], content: bytes, media_type: str) -> Dict:
+        self.manifests[(repository, digest(content))] = (content, media_type)
+        if tag is not None:
+            self.manifests[(repository, tag)] = (content, media_type)
+        return _descriptor(media_type, content)
+
+    def add_image(self, repository: str, tag: Optional[str], layers: List[bytes], platform="linux/amd64") -> Dict:
+        """add an image with the *layers* (a tag of None => only by digest); return the descriptor of its manifest"""
+        os_name, architecture, *variant = platform.split("/")
+        config = json.dumps({
+            "architecture": architecture, "os": os_name, "config": {"Labels": {"repository": repository}},
+            "rootfs": {"type": "layers", "diff_ids": [digest(layer) for layer in layers]},
+        }).encode()
+        for blob in (config, *layers):
+            self.blobs[digest(blob)] = blob
+        manifest = json.dumps({
+            "schemaVersion": 2,
+            "mediaType": MANIFEST_TYPE,
+            "config": _descriptor(CONFIG_TYPE, config),
+            "layers": [_descriptor(LAYER_TYPE, layer) for layer in layers],
+        }).encode()
+        descriptor = self._add_manifest(repository, tag, manifest, MANIFEST_TYPE)
+        platform_fields = {"os": os_name, "architecture": architecture, **({"variant": variant[0]} if variant else {})}
+        return {**descriptor, "platform": platform_fields}
+
+    def add_index(self, repository: str, tag: str, manifests: List[Dict]) -> Dict:
+        """add an index of the *manifests* (descriptors of 'add_image')"""
+        index = json.dumps({"schemaVersion": 2, "mediaType": INDEX_TYPE, "manifests": manifests}).encode()
+        return self._add_manifest(repository, tag, index, INDEX_TYPE)
+
+    def record(self, method: str, path: str):
+        with self._lock:
+            self.requests.append((method, path))
+
+    def blob_requests(self, blob_digest: str) -> int:
+        return sum(path.endswith(f"/blobs/{blob_digest}") for method, path in self.requests if method == "GET")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: RegistryStandIn
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, content: bytes, media_type: str):
+        self.send_response(status)
+        self.send_header("Content-Type", media_type)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(content)
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        self.server.record(self.command, self.path)
+        if self.path.rstrip("/") == "/v2":
+            self._send(200, b"{}", "application/json")
+            return
+        match = re.fullmatch(r'/v2/(.+)/(manifests|blobs)/([^/?]+)', self.path)
+        if match is None:
+            self._send(404, b"{}", "application/json")
+            return
+        repository, kind, reference = match.groups()
+        if kind == "manifests":
+            content, media_type = self.server.manifests.get((repository, reference), (None, ""))
+        else:
+            content, media_type = self.server.blobs.get(reference), "application/octet-stream"
+        if content is None:
+            self._send(404, b'{"errors": [{"code": "NOT_FOUND"}]}', "application/json")
+            return
+        if digest(content) in self.server.tampered:
+            content = content[:-1] + bytes([content[-1] ^ 1])
+        self._send(200, content, media_type)
@@ -0,0 +1,270 @@
+"""Stand-in for the talos machine api to test the native client of '_talos_api'
+
+A gRPC server with mTLS (like apid) which answers the rpcs used by the client with canned responses of the talos
+protobuf messages (field numbers of the talos api protos) and records the requests. The responses are encoded with
+the wire format helpers of the client, which are checked against the protobuf encoding separately.
+"""
+
+import base64
+import datetime
+import ipaddress
+import threading
+import time
+from concurrent import futures
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import grpc
+import yaml
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import ExtendedKeyUsageOID, NameOID
+
+from iiotctl._utils._talos_api import _decode, _encode
+
+NODE = "10.5.0.2"
+# resource definitions: type, display type, default namespace, aliases
+RESOURCE_DEFINITIONS = [
+    ("MachineConfigs.config.talos.dev", "MachineConfig", "config", ["mc", "machineconfigs"]),
+    ("Nodenames.kubernetes.talos.dev", "Nodename", "controlplane", ["nodenames"]),
+    ("ResourceDefinitions.meta.cosi.dev", "ResourceDefinition", "meta", ["rd", "resourcedefinitions"]),
+]
+
+
+@dataclass
+class Request:
+    method: str
+    fields: Dict[int, List]
+    metadata: Dict[str, str]
+
+
+@dataclass
+class Resource:
+    namespace: str
+    type: str
+    id: str
+    spec: str  # yaml (like talos marshals it)
+    version: int = 1
+    labels: Dict[str, str] = field(default_factory=dict)
+
+
+def _certificate(name: str, key, issuer: Optional[Tuple[x509.Certificate, object]] = None, ca=False, ip=None):
+    subject = x509.Name([x509.NameAttribute(NameOID.ORGANIZATION_NAME, name)])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    builder = x509.CertificateBuilder().subject_name(subject).issuer_name(
+        issuer[0].subject if issuer else subject
+    ).public_key(key.public_key()).serial_number(x509.random_serial_number()).not_valid_before(
+        now - datetime.timedelta(minutes=1)
+    ).not_valid_after(now + datetime.timedelta(hours=1)).add_extension(
+        x509.BasicConstraints(ca=ca, path_length=None), critical=True
+    )
+    if not ca:
+        builder = builder.add_extension(
+            x509.ExtendedKeyUsage([ExtendedKeyUsageOID.SERVER_AUTH, ExtendedKeyUsageOID.CLIENT_AUTH]), critical=False
+        )
+    if ip:
+        builder = builder.add_extension(x509.SubjectAlternativeName([x509.IPAddress(ipaddress.ip_address(ip))]), False)
+    return builder.sign(issuer[1] if issuer else key, hashes.SHA256())
+
+
+def _pem(certificate: x509.Certificate) -> bytes:
+    return certificate.public_bytes(serialization.Encoding.PEM)
+
+
+def _key_pem(key) -> bytes:
+    return key.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    )
+
+
+def _metadata(error: str = "") -> bytes:
+    """common.Metadata: hostname (1), error (2)"""
+    return _encode((1, NODE), (2, error or None))
+
+
+def _timestamp(seconds: int) -> bytes:
+    """google.protobuf.Timestamp: seconds (1)"""
+    return _encode((1, seconds))
+
+
+def event(id: str, type: str, payload: bytes) -> bytes:
+    """machine.Event: metadata (1), data (2, google.protobuf.Any: type_url (1), value (2)), id (3)"""
+    return _encode((1, _metadata()), (2, _encode((1, f"talos/runtime/machine.{type}"), (2, payload))), (3, id))
+
+
+class TalosApiStandIn:
+    """talos api of a single node on a random local port; use as a context manager"""
+
+    def __init__(self):
+        # the tls library of grpcio can't sign with ed25519 keys => ecdsa like 'talosctl gen ... --ecdsa'
+        ca_key = ec.generate_private_key(ec.SECP256R1())
+        self.ca = _certificate("talos", ca_key, ca=True)
+        self._server_key = ec.generate_private_key(ec.SECP256R1())
+        self._server_cert = _certificate("apid", self._server_key, (self.ca, ca_key), ip="127.0.0.1")
+        self.client_key = ec.generate_private_key(ec.SECP256R1())
+        self.client_cert = _certificate("os:admin", self.client_key, (self.ca, ca_key))
+
+        self.requests: List[Request] = []
+        self.node_error = ""  # error of the node in the metadata of the responses
+        self.resources: List[Resource] = [
+            Resource(
+                "meta", "ResourceDefinitions.meta.cosi.dev", type_,
+                yaml.safe_dump({"type": type_, "displayType": display, "defaultNamespace": namespace,
+                                "aliases": aliases, "allAliases": aliases})
+            )
+            for type_, display, namespace, aliases in RESOURCE_DEFINITIONS
+        ]
+        self.events: List[bytes] = []
+        self.log_chunks: List[bytes] = []
+        self.images: List[str] = []
+        self._lock = threading.Lock()
+        self._server = None
+        self.port = 0
+
+    def __enter__(self) -> "TalosApiStandIn":
+        self._server = grpc.server(futures.ThreadPoolExecutor(max_workers=4), handlers=[_Handler(self)])
+        credentials = grpc.ssl_server_credentials(
+            [(_key_pem(self._server_key), _pem(self._server_cert))], root_certificates=_pem(self.ca),
+            require_client_auth=True
+        )
+        self.port = self._server.add_secure_port("127.0.0.1:0", credentials)
+        self._server.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.stop(grace=None)
+
+    def talosconfig(self, context="stand-in", endpoint: Optional[str] = None) -> Dict:
+        """talosconfig with a context for the node of the stand-in"""
+        return {"context": context, "contexts": {context: {
+            "endpoints": [endpoint or f"127.0.0.1:{self.port}"],
+            "nodes": [NODE],
+            "ca": base64.b64encode(_pem(self.ca)).decode(),
+            "crt": base64.b64encode(_pem(self.client_cert)).decode(),
+            "key": base64.b64encode(_key_pem(self.client_key)).decode(),
+        }}}
+
+    def calls(self, method: str) -> List[Request]:
+        return [request for request in self.requests if request.method == method]
+
+    def _record(self, method: str, request: bytes, context) -> Dict[int, List]:
+        fields = _decode(request)
+        with self._lock:
+            self.requests.append(Request(method, fields, dict(context.invocation_metadata())))
+        return fields
+
+    def _resource(self, resource: Resource) -> bytes:
+        """cosi.resource.Resource: metadata (1), spec (2: proto_spec (1), yaml_spec (2))"""
+        metadata = _encode(
+            (1, resource.namespace), (2, resource.type), (3, resource.id), (4, str(resource.version)),
+            (5, "ctrl"), (6, "running"), (7, _timestamp(1724134742)), (8, _timestamp(1724134744)),
+            *((10, _encode((1, key), (2, value))) for key, value in resource.labels.items()),
+        )
+        return _encode((1, metadata), (2, _encode((2, resource.spec))))
+
+    # --- rpcs ---
+
+    def version(self, fields, context) -> bytes:
+        """machine.VersionResponse: messages (1: metadata (1), version (2: tag (1), sha (2), arch (6)))"""
+        version = _encode((1, "v1.7.6"), (2, "a1b2c3d4"), (6, "amd64"))
+        return _encode((1, _encode((1, _metadata(self.node_error)), (2, version))))
+
+    def get(self, fields, context) -> bytes:
+        """cosi.resource.GetRequest: namespace (1), type (2), id (3) => GetResponse: resource (1)"""
+        namespace, type_, id = (fields[number][0].decode() for number in (1, 2, 3))
+        for resource in self.resources:
+            if (resource.namespace, resource.type, resource.id) == (namespace, type_, id):
+                return _encode((1, self._resource(resource)))
+        context.abort(grpc.StatusCode.NOT_FOUND, f"resource {type_} {id} doesn't exist")
+
+    def list(self, fields, context) -> Iterator[bytes]:
+        """cosi.resource.ListRequest: namespace (1), type (2) => stream of ListResponse: resource (1)"""
+        namespace, type_ = fields[1][0].decode(), fields[2][0].decode()
+        for resource in self.resources:
+            if (resource.namespace, resource.type) == (namespace, type_):
+                yield _encode((1, self._resource(resource)))
+
+    def apply_configuration(self, fields, context) -> bytes:
+        """machine.ApplyConfigurationRequest: data (1), mode (4), dry_run (5)
+
+        => ApplyConfigurationResponse: messages (1: metadata (1), warnings (2), mode (3), mode_details (4))
+        """
+        mode = fields.get(4, [0])[0]
+        details = f"Applied configuration with a mode {mode}" + (" (dry run)" if fields.get(5, [0])[0] else "")
+        apply = _encode((1, _metadata(self.node_error)), (2, "deprecated field"), (3, mode), (4, details))
+        return _encode((1, apply))
+
+    def disks(self, fields, context) -> bytes:
+        """storage.DisksResponse: messages (1: metadata (1), disks (2: size (1), model (2), device_name (3), ...))"""
+        system_disk = _encode(
+            (1, 512110190592), (2, "Samsung SSD 870"), (3, "/dev/sda"), (4, "sda"), (5, "S1"), (6, "scsi:t-0x00"),
+            (7, "uuid-1"), (8, "naa.5000"), (9, 1), (10, "/pci0000:00/0000:00:10.0"), (11, True), (12, "/sys/block")
+        )
+        cd_rom = _encode((1, 1073741824), (2, "QEMU DVD-ROM"), (3, "/dev/sr0"), (9, 5), (13, True))
+        return _encode((1, _encode((1, _metadata(self.node_error)), (2, system_disk), (2, cd_rom))))
+
+    def image_list(self, fields, context) -> Iterator[bytes]:
+        """machine.ImageListRequest: namespace (1) => stream of ImageListResponse: metadata (1), name (2), ..."""
+        for name in self.images:
+            yield _encode((1, _metadata()), (2, name), (3, "sha256:0123"), (4, 1000))
+
+    def image_pull(self, fields, context) -> bytes:
+        """machine.ImagePullRequest: namespace (1), reference (2) => ImagePullResponse: messages (1: metadata (1))"""
+        reference = fields[2][0].decode()
+        if reference not in self.images:
+            self.images.append(reference)
+        return _encode((1, _encode((1, _metadata(self.node_error)))))
+
+    def events_stream(self, fields, context) -> Iterator[bytes]:
+        """machine.EventsRequest: tail_events (1), tail_id (2) => stream of machine.Event (until cancelled)"""
+        yield from self.events
+        while context.is_active():
+            time.sleep(0.05)
+
+    def data_stream(self, fields, context) -> Iterator[bytes]:
+        """machine.LogsRequest / DmesgRequest => stream of common.Data: metadata (1), bytes (2)"""
+        for chunk in self.log_chunks:
+            yield _encode((1, _metadata(self.node_error)), (2, chunk))
+
+    def upgrade(self, fields, context) -> bytes:
+        """machine.UpgradeRequest: image (1), preserve (2), stage (3), force (4)
+
+        => UpgradeResponse: messages (1: metadata (1), ack (2), actor_id (3))
+        """
+        return _encode((1, _encode((1, _metadata(self.node_error)), (2, "Upgrade request received"), (3, "actor"))))
+
+
+class _Handler(grpc.GenericRpcHandler):
+
+    def __init__(self, stand_in: TalosApiStandIn):
+        self._stand_in = stand_in
+        self._unary: Dict[str, Callable] = {
+            "/machine.MachineService/Version": stand_in.version,
+            "/cosi.resource.State/Get": stand_in.get,
+            "/machine.MachineService/ApplyConfiguration": stand_in.apply_configuration,
+            "/storage.StorageService/Disks": stand_in.disks,
+            "/machine.MachineService/ImagePull": stand_in.image_pull,
+            "/machine.MachineService/Upgrade": stand_in.upgrade,
+        }
+        self._stream: Dict[str, Callable] = {
+            "/cosi.resource.State/List": stand_in.list,
+            "/machine.MachineService/ImageList": stand_in.image_list,
+            "/machine.MachineService/Events": stand_in.events_stream,
+            "/machine.MachineService/Logs": stand_in.data_stream,
+            "/machine.MachineService/Dmesg": stand_in.data_stream,
+        }
+
+    def service(self, handler_call_details):
+        method = handler_call_details.method
+        if method in self._unary:
+            rpc = self._unary[method]
+            return grpc.unary_unary_rpc_method_handler(
+                lambda request, context: rpc(self._stand_in._record(method, request, context), context)
+            )
+        if method in self._stream:
+            rpc = self._stream[method]
+            return grpc.unary_stream_rpc_method_handler(
+                lambda request, context: rpc(self._stand_in._record(method, request, context), context)
+            )
+        return None  # => UNIMPLEMENTED
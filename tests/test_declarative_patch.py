@@ -0,0 +1,89 @@
+import json
+
+import pytest
+import typer
+
+from iiotctl._utils import _declarative_patch as declarative_patch
+from iiotctl._utils._common import patch_json
+from iiotctl._utils._constants import JQ_MODULES_DIR
+
+MC = {
+    "machine": {
+        "type": "controlplane",
+        "files": [{"path": "/a", "content": "a"}, {"path": "/b", "content": "b"}],
+        "kubelet": {"extraArgs": {"rotate-server-certificates": "true"}},
+    },
+    "cluster": {"network": {"cni": {"name": "flannel"}}, "allowSchedulingOnControlPlanes": False},
+}
+
+
+def _patch(tmp_path, text: str, suffix=".yaml", mc=MC):
+    patch_file = tmp_path / f"_patch{suffix}"
+    patch_file.write_text(text)
+    return declarative_patch.patch_value(json.loads(json.dumps(mc)), patch_file)
+
+
+def test_set_creates_the_parents(tmp_path):
+    patched = _patch(tmp_path, "- set: .machine.features.apidCheckExtKeyUsage\n  value: true\n")
+    assert patched["machine"]["features"] == {"apidCheckExtKeyUsage": True}
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("on", "on"), ("yes", "yes"), ("No", "No"), ("1:30", "1:30"), ("2024-08-20", "2024-08-20"),
+    ("0o644", 0o644), ("0644", 0o644), ("true", True), ("'0644'", "0644"),
+])
+def test_values_like_talos(tmp_path, value, expected):
+    # yaml 1.2 like talos reads the machine config (yaml 1.1: on => True, 1:30 => 90, a date)
+    patched = _patch(tmp_path, f"- set: [machine, sysctls, x]\n  value: {value}\n")
+    assert patched["machine"]["sysctls"]["x"] == expected
+
+
+def test_merge_like_jq(tmp_path):
+    patch = "- merge: .cluster\n  value:\n    network: {dnsDomain: local}\n    allowSchedulingOnControlPlanes: true\n"
+    jq_patch = tmp_path / "merge.jq"
+    jq_patch.write_text(".cluster |= . * {network: {dnsDomain: \"local\"}, allowSchedulingOnControlPlanes: true}")
+
+    patched = _patch(tmp_path, patch)
+
+    assert patched == json.loads(patch_json(json.dumps(MC).encode(), jq_patch, tmp_path))
+    assert patched["cluster"]["network"] == {"cni": {"name": "flannel"}, "dnsDomain": "local"}
+
+
+def test_delete(tmp_path):
+    patched = _patch(tmp_path, "- delete: .machine.kubelet.extraArgs\n- delete: .machine.missing.key\n")
+    assert patched["machine"]["kubelet"] == {}
+    assert "missing" not in patched["machine"]
+
+
+@pytest.mark.parametrize("objects", [
+    [{"path": "/b", "content": "new b"}, {"path": "/c", "content": "c"}],
+    [{"path": "/c", "content": "c"}, {"path": "/c", "content": "last c"}],  # the last object of a key wins
+    [{"content": "without a path"}],
+])
+def test_upsert_like_the_jq_module(tmp_path, objects):
+    jq_patch = tmp_path / "upsert.jq"
+    jq_patch.write_text(f"include \"upsert\";\n.machine.files |= upsert_all(\"path\"; {json.dumps(objects)})")
+
+    patched = _patch(tmp_path, json.dumps([{"upsert": ".machine.files", "key": "path", "value": objects}]), ".json")
+
+    assert patched == json.loads(patch_json(json.dumps(MC).encode(), jq_patch, JQ_MODULES_DIR))
+
+
+def test_upsert_into_a_missing_list(tmp_path):
+    patch = "- upsert: .machine.kubelet.extraMounts\n  key: destination\n  value: {destination: /x}\n"
+    patched = _patch(tmp_path, patch)
+    assert patched["machine"]["kubelet"]["extraMounts"] == [{"destination": "/x"}]
+
+
+@pytest.mark.parametrize("text, line", [
+    ("- set: .machine.type\n  value: worker\n- merge: .cluster\n", 3),  # no value
+    ("- set: .machine.type\n  value: [\n", 3),  # invalid yaml
+    ("- upsert: .machine.files\n  value: {path: /x}\n", 1),  # no key
+])
+def test_lint_errors(tmp_path, text, line):
+    patch_file = tmp_path / "_patch.yaml"
+    patch_file.write_text(text)
+
+    assert declarative_patch.lint(patch_file)[0][0] == line
+    with pytest.raises(typer.Abort):
+        declarative_patch.patch_value({}, patch_file)
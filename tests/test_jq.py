@@ -0,0 +1,46 @@
+import pytest
+
+from iiotctl._utils import _jq as jq
+
+
+@pytest.fixture(params=["binding", "cli"])
+def backend(request, monkeypatch):
+    if request.param == "binding" and jq.jq_binding is None:
+        pytest.skip("the jq python binding isn't installed")
+    if request.param == "cli":
+        monkeypatch.setattr(jq, "jq_binding", None)
+    return request.param
+
+
+@pytest.mark.parametrize("program, line", [
+    ("# comment\n.machine.type = \"x\" |\n.machine.files = [1, 2\n", 3),  # unexpected end of the file
+    (".a = 1 |\n.b = (2 +) |\n.c = 3\n", 2),
+    (".a = 1 |\n.b = 2 |\n", 2),
+    (".a = 1 |\n.b = foo(1)\n", 2),
+])
+def test_compile_error_lines(tmp_path, backend, program, line):
+    patch = tmp_path / "patch.jq"
+    patch.write_text(program)
+
+    errors = jq.compile_errors(patch, tmp_path)
+
+    assert errors[0][:2] == (patch, line)
+    assert line <= len(program.splitlines())
+
+
+def test_compile_errors_of_modules(tmp_path, backend):
+    module = tmp_path / "module.jq"
+    module.write_text("# comment\ndef x: (1;\n")
+    patch = tmp_path / "patch.jq"
+    patch.write_text("import \"module\" as m;\n.a = m::x\n")
+    assert jq.compile_errors(patch, tmp_path)[0][:2] == (module, 2)
+
+    patch.write_text("# comment\nimport \"missing\" as m;\n.a = m::x\n")
+    assert jq.compile_errors(patch, tmp_path) == [(patch, 2, "module not found: missing")]
+
+
+def test_valid_patch_is_not_applied(tmp_path, backend):
+    patch = tmp_path / "patch.jq"
+    patch.write_text("include \"module\";\n.a = x | error(\"applied\")\n")
+    (tmp_path / "module.jq").write_text("def x: 1;\n")
+    assert jq.compile_errors(patch, tmp_path) == []
@@ -0,0 +1,63 @@
+import datetime
+
+import pytest
+import typer
+
+from iiotctl.machine import _logs as logs
+
+UTC = datetime.timezone.utc
+YEAR = datetime.datetime.now(UTC).year
+
+
+@pytest.mark.parametrize("line, timestamp", [
+    ('{"level":"info","ts":"2024-08-20T06:19:04.123456789Z","msg":"ready"}', datetime.datetime(
+        2024, 8, 20, 6, 19, 4, 123456, UTC
+    )),
+    ("2024/08/20 06:19:04 starting", datetime.datetime(2024, 8, 20, 6, 19, 4, tzinfo=UTC)),
+    ("I0820 06:19:04.500000    1234 server.go:42] started", datetime.datetime(YEAR, 8, 20, 6, 19, 4, 500000, UTC)),
+    ("kern: info: [2024-08-20T08:19:04+02:00]: Linux", datetime.datetime(2024, 8, 20, 6, 19, 4, tzinfo=UTC)),
+    # kubelet: json lines with epoch milliseconds, the timestamps in the message are ignored
+    ('{"ts":1724134744500.25,"caller":"kubelet.go:1","msg":"synced 2023-01-01T00:00:00Z"}', datetime.datetime(
+        2024, 8, 20, 6, 19, 4, 500250, UTC
+    )),
+    ('10.5.0.2: {"ts":1724134744,"msg":"started"}', datetime.datetime(2024, 8, 20, 6, 19, 4, tzinfo=UTC)),
+    ('{"time":"2024-08-20T06:19:04Z","msg":"started"}', datetime.datetime(2024, 8, 20, 6, 19, 4, tzinfo=UTC)),
+    ('{"msg":"no time field"} at 2024-08-20 06:19:04', datetime.datetime(2024, 8, 20, 6, 19, 4, tzinfo=UTC)),
+    ("    at main.go:42", None),
+    ('{"msg":"no time field"}', None),
+    ('{"ts":true}', None),
+])
+def test_log_timestamp(line, timestamp):
+    assert logs._log_timestamp(line) == timestamp
+
+
+@pytest.mark.parametrize("since, delta", [
+    ("90s", datetime.timedelta(seconds=90)),
+    ("15m", datetime.timedelta(minutes=15)),
+    ("1h30m", datetime.timedelta(hours=1, minutes=30)),
+    ("2d", datetime.timedelta(days=2)),
+])
+def test_parse_since_duration(since, delta):
+    before = datetime.datetime.now(UTC)
+    since_time = logs._parse_since(since)
+    assert before - delta <= since_time <= datetime.datetime.now(UTC) - delta
+
+
+def test_parse_since_timestamp():
+    assert logs._parse_since("2024-08-20T06:19:04Z") == datetime.datetime(2024, 8, 20, 6, 19, 4, tzinfo=UTC)
+    assert logs._parse_since("2024-08-20 08:19:04+02:00") == datetime.datetime(2024, 8, 20, 6, 19, 4, tzinfo=UTC)
+
+
+@pytest.mark.parametrize("since", ["15x", "yesterday", ""])
+def test_invalid_since(since):
+    with pytest.raises(typer.Abort):
+        logs._parse_since(since)
+
+
+def test_kubelet_lines_are_kept_since_a_time():
+    kubelet_lines = ['{"ts":1724134740000,"msg":"old"}', '{"ts":1724134750000,"msg":"new"}', "  stack trace of new"]
+    since = datetime.datetime(2024, 8, 20, 6, 19, 5, tzinfo=UTC)
+
+    lines = [line for _, _, line in logs._filtered(logs._timestamped("kubelet", kubelet_lines), since, None)]
+
+    assert lines == kubelet_lines[1:]
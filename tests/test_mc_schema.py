@@ -0,0 +1,38 @@
+import json
+
+import pytest
+
+from iiotctl._utils import _mc_schema as mc_schema
+
+pytestmark = pytest.mark.skipif(not mc_schema.is_supported(), reason="the schema doesn't support the talos version")
+
+
+def _validate(mc) -> list:
+    return mc_schema.validate(json.dumps(mc).encode())
+
+
+def test_valid_fields_which_the_schema_does_not_list():
+    mc = {
+        "version": "v1alpha1",
+        "unlisted": True,
+        "machine": {"type": "init", "nodeAnnotations": {"a": "b"}, "time": {"disabled": False, "unlisted": 1}},
+        "cluster": {"clusterName": "c", "unlisted": {}},
+    }
+    assert _validate(mc) == []
+
+
+def test_invalid_listed_fields():
+    mc = {"version": "v1alpha1", "machine": {"type": "master", "files": [{"path": "x", "op": "crate"}]}}
+    assert _validate(mc) == [
+        '$.machine.type: "master" is not one of ["init", "controlplane", "worker", "join"]',
+        "$.machine.files[0].path: \"x\" doesn't match the pattern '^/'",
+        '$.machine.files[0].op: "crate" is not one of ["create", "append", "overwrite"]',
+    ]
+
+
+def test_the_schema_uses_only_supported_keywords():
+    # a hand-written subset: an unsupported keyword (e.g. 'oneOf' of the upstream schema) would be ignored silently
+    assert mc_schema.unsupported_keywords(mc_schema._load_schema()) == []
+    assert mc_schema.unsupported_keywords({"properties": {"a": {"oneOf": [], "items": {"minItems": 1}}}}) == [
+        "#/properties/a/oneOf", "#/properties/a/items/minItems",
+    ]
@@ -0,0 +1,107 @@
+import tarfile
+
+import httpx
+import pytest
+from registry_stand_in import INDEX_TYPE, MANIFEST_TYPE, RegistryStandIn, digest
+
+from iiotctl._utils import _oci as oci
+
+BASE_LAYER = b"base layer " * 1000
+
+
+@pytest.fixture
+def registry():
+    with RegistryStandIn() as registry:
+        yield registry
+
+
+@pytest.fixture
+def client():
+    with oci.RegistryClient() as client:
+        yield client
+
+
+def _export(archive, client, *image_refs, platform=oci.DEFAULT_PLATFORM):
+    with oci.ArchiveWriter(archive) as writer:
+        for image_ref in image_refs:
+            writer.add_image(client, image_ref, platform)
+    return writer
+
+
+def _blob_names(archive):
+    with tarfile.open(archive) as tar:
+        return [name for name in tar.getnames() if name.startswith("blobs/")]
+
+
+def test_export_stores_shared_layers_once(tmp_path, registry, client):
+    registry.add_image("apps/one", "1.0", [BASE_LAYER, b"one"])
+    registry.add_image("apps/two", "2.0", [BASE_LAYER, b"two"])
+
+    writer = _export(tmp_path / "images.tar", client, f"{registry.host}/apps/one:1.0", f"{registry.host}/apps/two:2.0")
+
+    assert registry.blob_requests(digest(BASE_LAYER)) == 1
+    assert writer.shared_bytes == len(BASE_LAYER)
+    blob_names = _blob_names(tmp_path / "images.tar")
+    # the manifest, config and own layer of each image + the base layer once
+    assert len(blob_names) == len(set(blob_names)) == 2 * 3 + 1
+    archive = oci.Archive(tmp_path / "images.tar")
+    assert set(archive.images) == {f"{registry.host}/apps/one:1.0", f"{registry.host}/apps/two:2.0"}
+    assert b"".join(archive.iter_blob(digest(BASE_LAYER))) == BASE_LAYER
+
+
+def test_export_selects_the_platform_of_an_index(tmp_path, registry, client):
+    amd64 = registry.add_image("multi", None, [b"amd64 layer"], platform="linux/amd64")
+    arm64 = registry.add_image("multi", None, [b"arm64 layer"], platform="linux/arm64/v8")
+    index = registry.add_index("multi", "1.0", [amd64, arm64])
+
+    _export(tmp_path / "images.tar", client, f"{registry.host}/multi:1.0", platform="linux/arm64/v8")
+
+    archive = oci.Archive(tmp_path / "images.tar")
+    assert archive.images[f"{registry.host}/multi:1.0"]["digest"] == index["digest"]
+    assert archive.media_types == {index["digest"]: INDEX_TYPE, arm64["digest"]: MANIFEST_TYPE}
+    assert archive.has_blob(digest(b"arm64 layer"))
+    assert not archive.has_blob(amd64["digest"]) and not archive.has_blob(digest(b"amd64 layer"))
+
+    with pytest.raises(oci.OciError, match="No manifest for the platform linux/s390x"):
+        _export(tmp_path / "s390x.tar", client, f"{registry.host}/multi:1.0", platform="linux/s390x")
+    assert not (tmp_path / "s390x.tar").exists()
+
+
+@pytest.mark.parametrize("tampered", ["layer", "manifest"])
+def test_export_rejects_a_digest_mismatch(tmp_path, registry, client, tampered):
+    manifest = registry.add_image("broken", "1.0", [b"layer"])
+    registry.tampered.add(digest(b"layer") if tampered == "layer" else manifest["digest"])
+
+    with pytest.raises(oci.OciError, match=f"The digest of the {'blob' if tampered == 'layer' else 'manifest'} "):
+        _export(tmp_path / "images.tar", client, f"{registry.host}/broken@{manifest['digest']}")
+    assert not (tmp_path / "images.tar").exists()
+    assert list(tmp_path.iterdir()) == []  # no staged blobs are left
+
+
+def test_archive_registry_serves_the_archive(tmp_path, registry, client):
+    manifest = registry.add_image("apps/one", "1.0", [BASE_LAYER, b"one"])
+    _export(tmp_path / "images.tar", client, f"{registry.host}/apps/one:1.0")
+
+    with oci.ArchiveRegistry(oci.Archive(tmp_path / "images.tar"), 0, "127.0.0.1") as archive_registry:
+        url = f"http://127.0.0.1:{archive_registry.server_address[1]}/v2"
+        with httpx.Client() as http:
+            assert http.get(f"{url}/").status_code == 200
+            response = http.get(f"{url}/apps/one/manifests/1.0", params={"ns": registry.host})
+            assert response.content == registry.manifests[("apps/one", "1.0")][0]
+            assert response.headers["content-type"] == MANIFEST_TYPE
+            assert response.headers["docker-content-digest"] == manifest["digest"]
+            # a mirror with 'overridePath' (e.g. '/v2/quay/...'), an other registry
+            assert http.get(f"{url}/mirror/apps/one/manifests/1.0").status_code == 200
+            assert http.get(f"{url}/apps/one/manifests/1.0", params={"ns": "docker.io"}).status_code == 404
+
+            blob_url = f"{url}/apps/one/blobs/{digest(BASE_LAYER)}"
+            assert http.head(blob_url).headers["content-length"] == str(len(BASE_LAYER))
+            assert http.get(blob_url).content == BASE_LAYER
+            missing = http.get(f"{url}/apps/one/blobs/{digest(b'missing')}")
+            assert (missing.status_code, missing.json()["errors"][0]["code"]) == (404, "BLOB_UNKNOWN")
+
+        # the archive can be pulled like a registry (the digests of the manifest and the blobs are verified)
+        _export(tmp_path / "copy.tar", client, f"127.0.0.1:{archive_registry.server_address[1]}/apps/one:1.0")
+
+    assert archive_registry.sent_blobs[digest(BASE_LAYER)] == 2  # the head request isn't a download
+    assert sorted(_blob_names(tmp_path / "copy.tar")) == sorted(_blob_names(tmp_path / "images.tar"))
@@ -0,0 +1,49 @@
+import json
+
+import pytest
+import typer
+
+from iiotctl.machine import _talos_config as talos_config
+
+
+def _mc_files(tmp_path, *contents: bytes):
+    mc_files = []
+    for i, content in enumerate(contents):
+        mc_files.append(tmp_path / f"mc{i}.json")
+        mc_files[-1].write_bytes(content)
+    return mc_files
+
+
+def test_unexpected_failure_of_a_mc(tmp_path, monkeypatch):
+    monkeypatch.setattr(talos_config.talosctl, "validate_mc", lambda mc, cache: json.loads(mc))
+    mc_file, = _mc_files(tmp_path, b"{not json")
+
+    success, _, error = talos_config._patch_batch_mc(mc_file, tmp_path / "out.json", [], False, False, False)
+
+    assert not success
+    assert error.startswith("JSONDecodeError: ")
+    assert not (tmp_path / "out.json").exists()
+
+
+def test_failed_jobs_are_summarized(tmp_path, capsys):
+    mc_files = _mc_files(tmp_path, b"{}", b"{}")
+    unpicklable_patches = [lambda: None]  # the jobs can't be sent to the workers
+
+    with pytest.raises(typer.Abort):
+        talos_config.patch_batch(mc_files, tmp_path / "out", unpicklable_patches, 1, False, False, False, False)
+
+    output = capsys.readouterr()
+    assert "Batch Summary" in output.out
+    assert output.out.count("❌") == 2
+    assert "2 of 2 machine configs failed." in output.err
+
+
+@pytest.mark.parametrize("output_dir", [".", "sub/.."])
+def test_the_inputs_are_not_overwritten(tmp_path, capsys, output_dir):
+    mc_files = _mc_files(tmp_path, b"{}")
+
+    with pytest.raises(typer.Abort):
+        talos_config.patch_batch(mc_files, tmp_path / output_dir, [], 1, False, False, False, False)
+
+    assert "would overwrite the input machine configs" in capsys.readouterr().err
+    assert mc_files[0].read_bytes() == b"{}"
@@ -0,0 +1,122 @@
+import json
+
+import pytest
+from iiotctl._utils import _patch_graph as patch_graph
+from iiotctl._utils._common import patch_json
+
+MC = json.dumps({"cluster": {"clusterName": "a"}, "machine": {"type": "init", "nodeLabels": {}}}).encode()
+
+
+def _reads(tmp_path, program: str, modules=None):
+    """the reads of a patch with the *program* and the *modules* (name => program)"""
+    for name, module in (modules or {}).items():
+        (tmp_path / f"{name}.jq").write_text(module)
+    patch = tmp_path / "patch.jq"
+    patch.write_text(program)
+    patch_graph._reads.clear()
+    return patch_graph.patch_reads(patch, tmp_path)
+
+
+@pytest.mark.parametrize("program, reads", [
+    (".machine.type = \"worker\"", {("machine", "type")}),
+    (".cluster |= . * {clusterName: \"b\"}", {("cluster",)}),
+    (".machine.files |= map(select(.path | test(\"x\") | not)) | del(.machine.install.disk)",
+     {("machine", "files"), ("machine", "install"), ("path",)}),
+    ("def file(content): {\"content\": content, path: \"/x\"}; .machine.type as $t | .machine.files = [file($t)]",
+     {("machine", "type"), ("machine", "files")}),
+    (".machine.nodeLabels.hash = (tojson | length | tostring)", {()}),
+    (".machine.nodeLabels.hash = \"\\(tojson)\"", {()}),
+    (".machine.nodeLabels.hash = @json", {()}),
+    (".machine.files |= tojson | length", {()}),
+    (".machine.certSANs += [length]", {()}),
+    (".machine.files[length:] = []", {()}),
+    ("if .machine then .machine.type = \"x\" else . end", {()}),
+    (".machine.env = env.HOME", {()}),
+    (".machine.type = $__loc__.file", {()}),
+    # a new output drops the keys of the input which aren't named
+    ("{version: \"v1alpha1\", machine: .machine, cluster: .cluster}", {()}),
+    (".machine", {()}),
+    (".machine.type = \"x\" | [.machine]", {()}),
+    ("reduce .machine.files[] as $file ({}; .[$file.path] = $file)", {()}),
+    ("def config: {machine: .machine}; config", {()}),
+    ("if .machine.type == \"init\" then .machine.type = \"x\" else {} end", {()}),
+    ("if .machine.type == \"init\" then .machine.type = \"x\" elif .debug then del(.debug) end",
+     {("machine", "type"), ("debug",)}),
+    ("select(.debug) | (.cluster.clusterName = \"x\" | .machine.type = \"y\")",
+     {("debug",), ("cluster", "clusterName"), ("machine", "type")}),
+])
+def test_patch_reads(tmp_path, program, reads):
+    assert _reads(tmp_path, program) == reads
+
+
+def test_patch_reads_of_module_functions(tmp_path):
+    modules = {"literal": "def name: \"x\";", "reading": "def size: length;"}
+    prefix = "import \"literal\" as literal; import \"reading\" as reading;\n"
+    assert _reads(tmp_path, prefix + ".cluster.clusterName = literal::name", modules) == {("cluster", "clusterName")}
+    assert _reads(tmp_path, prefix + ".cluster.size = reading::size", modules) == {()}
+    # the input of the right side of an update assignment is the updated path
+    assert _reads(tmp_path, prefix + ".cluster.size |= reading::size", modules) == {("cluster", "size")}
+
+
+def test_evaluate_reapplies_whole_input_readers(tmp_path, new_run):
+    # the hash of the whole config changes when the first patch is edited, although its paths aren't named
+    first = tmp_path / "first.jq"
+    hashed = tmp_path / "hashed.jq"
+    hashed.write_text(".machine.nodeLabels.hash = (tojson | length | tostring)")
+
+    def evaluate():
+        new_run()
+        return [json.loads(mc) for mc in patch_graph.evaluate(MC, [first, hashed], tmp_path, apply_patch)]
+
+    def apply_patch(mc: bytes, patch_file):
+        return patch_json(mc, patch_file, tmp_path)
+
+    first.write_text(".cluster.clusterName = \"b\"")
+    first_run = evaluate()
+    first.write_text(".cluster.clusterName = \"bc\"")
+    second_run = evaluate()
+
+    def hash_of(mc):
+        return mc["machine"]["nodeLabels"]["hash"]
+
+    assert int(hash_of(second_run[-1])) == int(hash_of(first_run[-1])) + 1
+    assert hash_of(second_run[-1]) == hash_of(json.loads(apply_patch(json.dumps(second_run[1]).encode(), hashed)))
+
+
+def test_evaluate_takes_over_independent_writes(tmp_path, new_run):
+    first = tmp_path / "first.jq"
+    independent = tmp_path / "independent.jq"
+    independent.write_text(".machine.type = \"controlplane\"")
+    applied = []
+
+    def apply_patch(mc: bytes, patch_file):
+        applied.append(patch_file.name)
+        return patch_json(mc, patch_file, tmp_path)
+
+    for cluster_name in ("b", "c"):
+        first.write_text(f".cluster.clusterName = \"{cluster_name}\"")
+        new_run()
+        patched_mcs = patch_graph.evaluate(MC, [first, independent], tmp_path, apply_patch)
+
+    assert applied == ["first.jq", "independent.jq", "first.jq"]
+    assert json.loads(patched_mcs[-1]) == {
+        "cluster": {"clusterName": "c"}, "machine": {"type": "controlplane", "nodeLabels": {}}
+    }
+
+
+def test_evaluate_doesnt_take_over_rebuilt_outputs(tmp_path, new_run):
+    first = tmp_path / "first.jq"
+    rebuilt = tmp_path / "rebuilt.jq"
+    rebuilt.write_text("{version: \"v1alpha1\", machine: .machine, cluster: .cluster}")
+
+    def apply_patch(mc: bytes, patch_file):
+        return patch_json(mc, patch_file, tmp_path)
+
+    for program in (".machine.type = \"x\"", ".machine.type = \"x\" | .debug = true"):
+        first.write_text(program)
+        new_run()
+        patched_mcs = patch_graph.evaluate(MC, [first, rebuilt], tmp_path, apply_patch)
+
+    # like jq: the rebuilt config doesn't contain the new key of the first patch
+    assert json.loads(patched_mcs[-1]) == json.loads(apply_patch(patched_mcs[1], rebuilt))
+    assert "debug" not in json.loads(patched_mcs[-1])
@@ -0,0 +1,15 @@
+from iiotctl._utils import _talos_api as talos_api
+
+
+def test_encode_like_protobuf():
+    # examples of the protobuf encoding guide
+    assert talos_api._encode((1, 150)) == bytes.fromhex("089601")
+    assert talos_api._encode((2, "testing")) == bytes.fromhex("120774657374696e67")
+    assert talos_api._encode((3, talos_api._encode((1, 150)))) == bytes.fromhex("1a03089601")
+    assert talos_api._encode((1, -2)) == bytes.fromhex("08feffffffffffffffff01")  # int64: two's complement
+    assert talos_api._encode((1, True), (2, None), (4, "")) == bytes.fromhex("08012200")
+
+
+def test_decode_like_protobuf():
+    message = bytes.fromhex("089601" "120774657374696e67" "1a03089601" "0d01000000" "110200000000000000" "1a00")
+    assert talos_api._decode(message) == {1: [150, 1], 2: [b"testing", 2], 3: [bytes.fromhex("089601"), b""]}
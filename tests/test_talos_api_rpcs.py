@@ -0,0 +1,251 @@
+import json
+from itertools import islice
+
+import pytest
+import yaml
+
+from iiotctl._utils import _talos_api as talos_api
+from iiotctl._utils import _talosctl as talosctl
+
+pytest.importorskip("grpc")
+from talos_api_stand_in import NODE, Resource, TalosApiStandIn, event  # noqa: E402
+
+MACHINE_CONFIG = """\
+version: v1alpha1
+machine:
+    type: controlplane
+    files:
+        - content: reload
+          permissions: 0o600
+          path: /var/etc/reload
+          op: create
+    install:
+        wipe: false
+"""
+
+
+@pytest.fixture
+def stand_in():
+    with TalosApiStandIn() as stand_in:
+        yield stand_in
+    talos_api._close_channels()
+
+
+@pytest.fixture
+def talosconfig(stand_in, tmp_path):
+    talosconfig = tmp_path / "talosconfig"
+    talosconfig.write_text(yaml.safe_dump(stand_in.talosconfig()))
+    return talosconfig
+
+
+@pytest.fixture
+def client(talosconfig) -> talos_api.Client:
+    client = talos_api.client(talosconfig=talosconfig)
+    assert client is not None
+    return client
+
+
+def test_client_of_the_talosconfig_context(stand_in, talosconfig, client):
+    assert client.node == NODE
+    assert talos_api.client(talosconfig=talosconfig, nodes=NODE) is client  # the channel is kept open
+    client.version()
+    assert stand_in.calls("/machine.MachineService/Version")[0].metadata["node"] == NODE
+
+
+def test_no_client_when_talosctl_must_be_used(stand_in, tmp_path, talosconfig):
+    assert talos_api.client(talosconfig=talosconfig, nodes="10.5.0.2,10.5.0.3") is None
+    assert talos_api.client(talosconfig=talosconfig, insecure=True) is None
+    assert talos_api.client(talosconfig=tmp_path / "missing") is None
+
+    other_ca = TalosApiStandIn()  # the server cert isn't signed by its ca => the tls handshake fails
+    config = stand_in.talosconfig()
+    config["contexts"]["stand-in"]["ca"] = other_ca.talosconfig()["contexts"]["stand-in"]["ca"]
+    talosconfig.write_text(yaml.safe_dump(config))
+    assert talos_api.client(talosconfig=talosconfig) is None
+
+
+def test_version(client):
+    assert client.version() == talos_api.Version(tag="v1.7.6", sha="a1b2c3d4", arch="amd64")
+
+
+def test_error_of_the_node(stand_in, client):
+    stand_in.node_error = "machine is booting"
+    with pytest.raises(talos_api.TalosApiError, match="machine is booting"):
+        client.version()
+
+
+def test_get_resource_like_talosctl(stand_in, client):
+    stand_in.resources.append(Resource(
+        "config", "MachineConfigs.config.talos.dev", "v1alpha1", MACHINE_CONFIG, version=3, labels={"a": "b"}
+    ))
+
+    resource = client.get("mc", "v1alpha1")
+
+    assert stand_in.calls("/cosi.resource.State/Get")[0].fields == {
+        1: [b"config"], 2: [b"MachineConfigs.config.talos.dev"], 3: [b"v1alpha1"]
+    }
+    # the output of 'talosctl get mc v1alpha1 -o json': sorted keys, yaml 1.2 values (0o600 => 384)
+    assert json.dumps(resource, indent=4) == """\
+{
+    "metadata": {
+        "created": "2024-08-20T06:19:02Z",
+        "id": "v1alpha1",
+        "labels": {
+            "a": "b"
+        },
+        "namespace": "config",
+        "owner": "ctrl",
+        "phase": "running",
+        "type": "MachineConfigs.config.talos.dev",
+        "updated": "2024-08-20T06:19:04Z",
+        "version": 3
+    },
+    "node": "10.5.0.2",
+    "spec": {
+        "machine": {
+            "files": [
+                {
+                    "content": "reload",
+                    "op": "create",
+                    "path": "/var/etc/reload",
+                    "permissions": 384
+                }
+            ],
+            "install": {
+                "wipe": false
+            },
+            "type": "controlplane"
+        },
+        "version": "v1alpha1"
+    }
+}"""
+
+
+def test_fetch_mc_has_the_bytes_of_the_talosctl_backend(stand_in, talosconfig, monkeypatch):
+    monkeypatch.setattr(talosctl, "_resource_cache", {})
+    stand_in.resources.append(Resource("config", "MachineConfigs.config.talos.dev", "v1alpha1", MACHINE_CONFIG))
+
+    # like the mc of 'talosctl get mc -o json' and the patched mc (jq -S) => no reorder diff
+    assert talosctl.fetch_mc("v1alpha1", talosconfig=talosconfig) == b"""\
+{
+  "machine": {
+    "files": [
+      {
+        "content": "reload",
+        "op": "create",
+        "path": "/var/etc/reload",
+        "permissions": 384
+      }
+    ],
+    "install": {
+      "wipe": false
+    },
+    "type": "controlplane"
+  },
+  "version": "v1alpha1"
+}"""
+
+
+def test_list_resources(stand_in, client):
+    for id in ("a", "b"):
+        stand_in.resources.append(Resource("controlplane", "Nodenames.kubernetes.talos.dev", id, f"nodename: {id}\n"))
+
+    assert [resource["spec"] for resource in client.get("Nodename")] == [{"nodename": "a"}, {"nodename": "b"}]
+    assert [resource["metadata"]["id"] for resource in client.iter_resources("nodenames")] == ["a", "b"]
+    # the resource definitions are listed once per client
+    assert len(stand_in.calls("/cosi.resource.State/List")) == 3
+
+
+def test_missing_resources(client):
+    with pytest.raises(talos_api.TalosApiError, match="^NOT_FOUND: resource .* doesn't exist"):
+        client.get("mc", "missing")
+    with pytest.raises(talos_api.TalosApiError, match="resource type 'nope' is not registered"):
+        client.get("nope")
+
+
+@pytest.mark.parametrize("mode, dry_run, fields", [
+    ("auto", False, {1: [b"{}"], 4: [1]}),
+    ("no-reboot", True, {1: [b"{}"], 4: [2], 5: [1]}),
+    ("reboot", False, {1: [b"{}"]}),  # default values aren't encoded
+])
+def test_apply_configuration(stand_in, client, mode, dry_run, fields):
+    result = client.apply_configuration(b"{}", mode=mode, dry_run=dry_run)
+
+    assert stand_in.calls("/machine.MachineService/ApplyConfiguration")[0].fields == fields
+    assert result.mode == mode
+    assert result.mode_details.startswith("Applied configuration")
+    assert result.warnings == ["deprecated field"]
+
+
+def test_disks(client):
+    assert client.disks() == [
+        talos_api.Disk(
+            dev="/dev/sda", model="Samsung SSD 870", serial="S1", type="SSD", uuid="uuid-1", wwid="naa.5000",
+            modalias="scsi:t-0x00", name="sda", size="512 GB", bus_path="/pci0000:00/0000:00:10.0",
+            subsystem="/sys/block", system_disk=True
+        ),
+        talos_api.Disk(dev="/dev/sr0", model="QEMU DVD-ROM", type="CD", size="1.1 GB", read_only=True),
+    ]
+
+
+def test_image_pull_and_list(stand_in, client):
+    client.image_pull("registry.k8s.io/pause:3.8", namespace="system")
+
+    assert stand_in.calls("/machine.MachineService/ImagePull")[0].fields == {1: [1], 2: [b"registry.k8s.io/pause:3.8"]}
+    assert client.image_list("system") == ["registry.k8s.io/pause:3.8"]
+    assert stand_in.calls("/machine.MachineService/ImageList")[0].fields == {1: [1]}
+
+
+def test_events(stand_in, client):
+    stand_in.events = [
+        event("c01", "SequenceEvent", talos_api._encode((1, "boot"), (2, 1))),
+        event("c02", "SequenceEvent", talos_api._encode((1, "boot"), (3, talos_api._encode((2, "boot failed"))))),
+        event("c03", "PhaseEvent", talos_api._encode((1, "startEverything"), (2, 1))),
+        event("c04", "TaskEvent", talos_api._encode((1, "startAllServices"))),
+        event("c05", "ServiceStateEvent", talos_api._encode((1, "etcd"), (2, 3), (3, "Health check successful"))),
+        event("c06", "MachineStatusEvent", talos_api._encode((1, 4), (2, talos_api._encode(
+            (2, talos_api._encode((1, "nodeReady"), (2, "node not ready"))),
+            (2, talos_api._encode((1, "staticPods"), (2, "pods not running"))),
+        )))),
+        event("c07", "MachineStatusEvent", talos_api._encode((1, 4), (2, talos_api._encode((1, True))))),
+    ]
+
+    events = list(islice(client.events(tail_events=-1, tail_id="b09"), len(stand_in.events)))
+
+    assert stand_in.calls("/machine.MachineService/Events")[0].fields == {1: [2 ** 64 - 1], 2: [b"b09"]}
+    assert events == [
+        talos_api.Event("c01", "SequenceEvent", "boot", "START"),
+        talos_api.Event("c02", "SequenceEvent", "boot", "ERROR", "boot failed"),
+        talos_api.Event("c03", "PhaseEvent", "startEverything", "STOP"),
+        talos_api.Event("c04", "TaskEvent", "startAllServices", "START"),
+        talos_api.Event("c05", "ServiceStateEvent", "etcd", "RUNNING", "Health check successful"),
+        talos_api.Event(
+            "c06", "MachineStatusEvent", "RUNNING", "", "nodeReady: node not ready, staticPods: pods not running", False
+        ),
+        talos_api.Event("c07", "MachineStatusEvent", "RUNNING", "", "", True),
+    ]
+
+
+def test_logs_split_over_chunks(stand_in, client):
+    stand_in.log_chunks = [b"line 1\nli", b"ne 2\n", b"\xff last line without a newline"]
+
+    lines = list(client.logs("etcd", tail_lines=10, follow=True))
+
+    assert stand_in.calls("/machine.MachineService/Logs")[0].fields == {
+        1: [b"system"], 2: [b"etcd"], 4: [1], 5: [10]
+    }
+    assert lines == ["line 1", "line 2", "� last line without a newline"]
+
+
+def test_dmesg(stand_in, client):
+    stand_in.log_chunks = [b"kern: info: [2024-08-20T06:19:01Z]: Linux\n"]
+
+    assert list(client.dmesg()) == ["kern: info: [2024-08-20T06:19:01Z]: Linux"]
+    assert stand_in.calls("/machine.MachineService/Dmesg")[0].fields == {}
+
+
+def test_upgrade(stand_in, client):
+    assert client.upgrade("factory.talos.dev/installer/abc:v1.7.6", stage=True) == "Upgrade request received"
+    assert stand_in.calls("/machine.MachineService/Upgrade")[0].fields == {
+        1: [b"factory.talos.dev/installer/abc:v1.7.6"], 3: [1]
+    }
@@ -0,0 +1,42 @@
+import pytest
+
+from iiotctl._utils import _talosctl as talosctl
+
+DISKS_TABLE = """\
+DEV        MODEL              SERIAL   TYPE   WWID       NAME   SIZE     BUS_PATH   SYSTEM_DISK
+/dev/sda   Samsung  SSD 870   S1       SSD    naa.5000   sda    512 GB   /pci0      *
+"""
+
+
+@pytest.fixture
+def machine(monkeypatch):
+    """a machine without the native talos api client; set the talos version of the machine"""
+    resource_reads = []
+
+    def iter_resources(resource, id=None, **talos_args):
+        resource_reads.append(resource)
+        yield {"metadata": {"id": "sda"}, "spec": {"dev_path": "/dev/sda", "model": "Samsung  SSD 870", "size": 512e9}}
+
+    monkeypatch.setattr(talosctl.talos_api, "client", lambda **talos_args: None)
+    monkeypatch.setattr(talosctl, "iter_resources", iter_resources)
+    monkeypatch.setattr(talosctl.Command, "check_output", lambda cmd, **args: DISKS_TABLE)
+
+    def set_version(version: str):
+        monkeypatch.setattr(talosctl, "get_live_talos_version", lambda **talos_args: version)
+        return resource_reads
+    return set_version
+
+
+@pytest.mark.parametrize("version, resource_reads", [
+    ("1.7.6", []),  # the repo may pin 1.8 before the machine is upgraded => the disks table
+    ("1.8.0-beta.1", ["disks"]),
+    ("1.10.2", ["disks"]),
+])
+def test_disks_by_the_version_of_the_machine(machine, version, resource_reads):
+    reads = machine(version)
+
+    disks = talosctl.disks(nodes="10.5.0.2")
+
+    assert reads == resource_reads
+    assert disks["/dev/sda"].model == "Samsung  SSD 870"
+    assert disks["/dev/sda"].size == "512 GB"
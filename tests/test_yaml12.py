@@ -0,0 +1,16 @@
+from iiotctl._utils import _yaml12 as yaml12
+
+
+def test_scalars_like_talos():
+    spec = yaml12.load(
+        "files: [{permissions: 0o600, mode: 0644}]\n"
+        "ints: [600, -0x1F, 1_000, 0]\n"
+        "strings: [yes, on, No, 2024-08-20T06:19:02Z, '0o600', 1.2.3, 1:30]\n"
+        "others: [True, false, 1.5e3, .inf, ~, null, 08]\n"
+    )
+    assert spec == {
+        "files": [{"permissions": 0o600, "mode": 0o644}],
+        "ints": [600, -31, 1000, 0],
+        "strings": ["yes", "on", "No", "2024-08-20T06:19:02Z", "0o600", "1.2.3", "1:30"],
+        "others": [True, False, 1500.0, float("inf"), None, None, 8.0],
+    }